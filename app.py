@@ -1,39 +1,42 @@
 import streamlit as st
-import psycopg2
-import json
-import requests
 from typing import Dict, Any, List
 import time
 from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import question_bank
+from explanations import ExplanationStore
+from granite_client import GraniteClient, GraniteError
+from marking import format_marking_feedback, marking_fields, parse_marking_feedback
+from prompts import MARKING_PROMPTS, MARKING_SCHEMAS, MARKING_SYSTEM_PROMPTS, TUTOR_PROMPTS
+from semantic_cache import SemanticCache
 
 # ==================== DATABASE FUNCTIONS ====================
-def get_db_connection():
-    """Establish connection to PostgreSQL database"""
-    return psycopg2.connect(
-        host="localhost",
-        database="vce_learning_platform",
-        user="postgres",
-        password="postgres1234",
-        port="5432"
-    )
+@st.cache_resource
+def get_db_pool():
+    """One connection pool per server process, shared with the retriever, caches and stores"""
+    return db.get_pool()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_db_health():
+    """Pool health check, rerun at most every 30s rather than on every interaction"""
+    return get_db_pool().health_check()
 
 def get_questions_list(limit=20):
     """Get a list of questions for selection"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT q.question_id, q.question_number, q.question_text, 
-               e.year, e.subject, e.exam_name, q.difficulty_level
-        FROM questions q
-        JOIN exams e ON q.exam_id = e.exam_id
-        ORDER BY q.question_id
-        LIMIT %s;
-    """, (limit,))
-    
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with get_db_pool().cursor() as cursor:
+        cursor.execute("""
+            SELECT q.question_id, q.question_number, q.question_text, 
+                   e.year, e.subject, e.exam_name, q.difficulty_level
+            FROM questions q
+            JOIN exams e ON q.exam_id = e.exam_id
+            ORDER BY q.question_id
+            LIMIT %s;
+        """, (limit,))
+        
+        rows = cursor.fetchall()
     
     questions = []
     for row in rows:
@@ -49,36 +52,42 @@ def get_questions_list(limit=20):
     
     return questions
 
+@st.cache_data(ttl=300, show_spinner=False)
+def get_question_facets():
+    """Years, subjects and difficulties for the Question Bank filters"""
+    return question_bank.facets()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def count_questions(filters):
+    """Matches for a set of filters, counted once rather than on every page turn"""
+    return question_bank.count_questions(filters)
+
 def get_question_by_id(question_id):
     """Get complete question data by ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT  
-            q.question_id, q.question_number, q.section, q.unit, q.aos, q.subtopic,
-            q.skill_type, q.difficulty_level, q.question_text, q.answer_text, 
-            q.detailed_answer, q.page_number,
+    with get_db_pool().cursor() as cursor:
+        cursor.execute("""
+            SELECT  
+                q.question_id, q.question_number, q.section, q.unit, q.aos, q.subtopic,
+                q.skill_type, q.difficulty_level, q.question_text, q.answer_text, 
+                q.detailed_answer, q.page_number,
 
-            e.exam_id, e.year, e.subject, e.unit AS exam_unit, e.exam_name,
-            e.pdf_url, e.source, e.scraped_at,
+                e.exam_id, e.year, e.subject, e.unit AS exam_unit, e.exam_name,
+                e.pdf_url, e.source, e.scraped_at,
 
-            ab.aos_name, ab.percentage,
+                ab.aos_name, ab.percentage,
 
-            sp.subpart_id, sp.subpart_letter, sp.subpart_text, 
-            sp.subpart_answer, sp.subpart_detailed_answer
+                sp.subpart_id, sp.subpart_letter, sp.subpart_text, 
+                sp.subpart_answer, sp.subpart_detailed_answer
 
-        FROM questions q
-        JOIN exams e ON q.exam_id = e.exam_id
-        LEFT JOIN aos_breakdown ab ON ab.exam_id = e.exam_id
-        LEFT JOIN question_subparts sp ON sp.question_id = q.question_id
-        WHERE q.question_id = %s
-        ORDER BY sp.subpart_letter;
-    """, (question_id,))
+            FROM questions q
+            JOIN exams e ON q.exam_id = e.exam_id
+            LEFT JOIN aos_breakdown ab ON ab.exam_id = e.exam_id
+            LEFT JOIN question_subparts sp ON sp.question_id = q.question_id
+            WHERE q.question_id = %s
+            ORDER BY sp.subpart_letter;
+        """, (question_id,))
 
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        rows = cursor.fetchall()
 
     if not rows:
         return None
@@ -125,213 +134,96 @@ def get_question_by_id(question_id):
     return result
 
 # ==================== GRANITE API FUNCTIONS ====================
-def query_granite(user_prompt, system_prompt="You are a math reasoning assistant.", context="", 
-                  api_url="https://nab6wk9x0oev1u-8888.proxy.runpod.net/api/granite/generate", timeout=300):
-    """Send query to Granite model API"""
-    payload = {
-        "system_prompt": system_prompt,
-        "user_prompt": user_prompt,
-        "context": context
-    }
+# How often a panel waiting on a background generation checks whether it has finished
+ANALYSIS_POLL_SECONDS = 1.0
+
+@st.cache_resource
+def get_granite_client():
+    """One pooled client per server process, reused across Streamlit reruns and sessions"""
+    return GraniteClient()
 
+
+@st.cache_resource
+def get_granite_executor():
+    """Worker threads for generations that run while the script keeps rendering"""
+    return ThreadPoolExecutor(max_workers=12, thread_name_prefix="granite-prefetch")
+
+
+@st.cache_resource
+def get_explanation_store():
+    """Precomputed baseline explanations (see precompute_explanations.py)"""
+    return ExplanationStore()
+
+
+@st.cache_resource
+def get_tutor_cache():
+    """Semantic cache of tutor answers, shared by every session"""
+    return SemanticCache()
+
+
+def query_granite(user_prompt, system_prompt="You are a math reasoning assistant.", context="",
+                  timeout=300, priority="default", client=None):
+    """Send query to Granite model API (pass `client` when calling from a worker thread)"""
+    client = client or get_granite_client()
     try:
-        response = requests.post(
-            api_url,
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(payload),
+        return client.generate(
+            user_prompt,
+            system_prompt=system_prompt,
+            context=context,
+            priority=priority,
             timeout=timeout
         )
+    except GraniteError as e:
+        return f"❌ {e}"
 
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("output", "No output found in response.")
-        else:
-            return f"❌ Non-200 response: {response.status_code}"
-            
-    except requests.exceptions.Timeout:
-        return "❌ Request timed out. Model may still be loading."
-    except requests.exceptions.ConnectionError:
-        return "❌ Cannot connect to the server. Check the proxy URL."
-    except Exception as e:
-        return f"❌ Unexpected error: {e}"
-
-# ==================== PROMPT TEMPLATES ====================
-MARKING_PROMPTS = {
-    "evaluate_solution": """You are an expert mathematics examiner for VCE (Victorian Certificate of Education) exams.
-
-EVALUATION TASK:
-Compare the student's solution against the correct answer and provide:
-1. ✅ CORRECT or ❌ INCORRECT verdict
-2. Score out of 10
-3. Step-by-step feedback
-4. Common mistakes to avoid
-5. Suggested improvements
-
-QUESTION:
-{question_text}
-
-CORRECT ANSWER (from exam):
-{detailed_answer}
-
-STUDENT'S SOLUTION:
-{student_solution}
-
-ADDITIONAL CONTEXT:
-- Subject: {subject}
-- Year: {year}
-- Exam: {exam_name}
-- Area of Study: {aos}
-- Difficulty: {difficulty}
-- Skill Type: {skill_type}
-
-Provide your evaluation in this exact format:
-VERDICT: [✅ CORRECT or ❌ INCORRECT]
-SCORE: [X/10]
-FEEDBACK: [Detailed feedback here...]
-MISTAKES: [Common mistakes section...]
-IMPROVEMENTS: [Suggested improvements...]""",
-
-    "explain_correct_answer": """You are a mathematics tutor explaining a VCE exam question solution.
-
-QUESTION:
-{question_text}
-
-CORRECT SOLUTION:
-{detailed_answer}
-
-STUDENT'S ATTEMPT:
-{student_solution}
-
-Explain the correct solution clearly, highlighting:
-1. Key concepts tested
-2. Step-by-step reasoning
-3. How it differs from the student's approach (if incorrect)
-4. Tips for similar problems
-
-Make your explanation engaging and educational.""",
-
-    "rubric_evaluation": """As a VCE mathematics assessor, evaluate this solution against the official marking rubric.
-
-QUESTION DETAILS:
-{question_text}
-Difficulty: {difficulty}
-Skill Type: {skill_type}
-Area of Study: {aos}
-
-RUBRIC CRITERIA:
-1. Conceptual Understanding (0-3 points)
-2. Procedural Accuracy (0-3 points)
-3. Problem Solving Strategy (0-2 points)
-4. Communication of Reasoning (0-2 points)
-
-STUDENT'S SOLUTION:
-{student_solution}
-
-CORRECT ANSWER:
-{detailed_answer}
-
-Provide rubric scores and brief justification for each criterion."""
-}
-
-TUTOR_PROMPTS = {
-    "general_tutor": """You are a highly experienced VCE Mathematics tutor with expertise across:
-- Mathematical Methods (CAS and non-CAS)
-- Specialist Mathematics
-- Further Mathematics
-- Foundation Mathematics
-
-You excel at:
-1. Breaking down complex problems into manageable steps
-2. Using VCE-specific terminology and notation
-3. Relating concepts to VCAA study design
-4. Providing multiple solution approaches when appropriate
-5. Highlighting common pitfalls and exam techniques
-
-Always structure your explanations with:
-1. **Understanding the Problem** - What's being asked, key terms
-2. **Relevant Theory** - VCAA Study Design references
-3. **Step-by-Step Solution** - Clear, logical progression
-4. **Check & Verify** - How to verify the answer
-5. **Key Takeaways** - Summary of learning points
-
-Use VCE-appropriate mathematical notation and terminology.""",
-
-    "methods_tutor": """You are a VCE Mathematical Methods specialist tutor.
-
-Key VCAA Study Design Areas you excel in:
-- Functions and graphs (polynomial, exponential, logarithmic, circular)
-- Calculus (differentiation, integration, applications)
-- Probability and statistics (discrete/continuous random variables, distributions)
-
-Teaching Approach:
-1. Start with what the student knows
-2. Connect to prior learning
-3. Use CAS/non-CAS appropriate methods
-4. Emphasize practical applications
-5. Include exam-style practice tips
-
-Always reference:
-- Appropriate technology use (CAS calculators)
-- VCAA examination report insights
-- Common student errors from past exams
-- Efficient solving techniques for exam conditions""",
-
-    "specialist_tutor": """You are a VCE Specialist Mathematics expert tutor.
-
-VCAA Specialist Mathematics Focus Areas:
-- Vector calculus and kinematics
-- Complex numbers and polar forms
-- Differential equations and modelling
-- Mechanics and proof techniques
-
-Specialist Mathematics Pedagogy:
-1. Emphasize rigorous mathematical reasoning
-2. Connect theoretical concepts to physical applications
-3. Demonstrate elegant solution methods
-4. Highlight connections between different areas of mathematics
-5. Prepare students for proof-based questions
-
-Include in explanations:
-- Formal mathematical notation
-- Proof techniques when applicable
-- Real-world applications (physics, engineering)
-- Extension material for high-achieving students""",
-
-    "step_by_step": """You are explaining a mathematical concept to a VCE student who wants to understand it thoroughly.
-
-Follow this exact 5-step framework:
-
-**Step 1: Problem Analysis**
-- Restate the problem in your own words
-- Identify key mathematical concepts involved
-- Note any constraints or special conditions
-
-**Step 2: Theory Review**
-- Briefly recall relevant formulas, theorems, or definitions
-- Reference VCAA Study Design points if applicable
-- Connect to previously learned concepts
-
-**Step 3: Detailed Solution Walkthrough**
-- Break into logical substeps
-- Show all working clearly
-- Explain the "why" behind each step
-- Include diagrams if helpful (describe verbally)
-- Use proper mathematical notation
-
-**Step 4: Verification & Alternative Approaches**
-- Check the solution makes sense
-- Suggest alternative methods if applicable
-- Point out common errors to avoid
-- Discuss how to verify the answer
-
-**Step 5: Learning Extension**
-- Summarize key techniques learned
-- Suggest similar practice problems
-- Connect to exam question types
-- Provide study tips for this topic
-
-Always use student-friendly language while maintaining mathematical rigor."""
-}
+
+def stream_granite(placeholder, render, user_prompt, system_prompt="You are a math reasoning assistant.",
+                   context="", timeout=300, priority="default", **params):
+    """Show the answer in `placeholder` as it is generated and return the final text.
+
+    render(placeholder, text) draws partial output; errors are appended to whatever
+    arrived before them, like query_granite's error messages. `params` are extra
+    request fields (e.g. json_schema).
+    """
+    text = ""
+    try:
+        for delta in get_granite_client().stream(
+            user_prompt,
+            system_prompt=system_prompt,
+            context=context,
+            priority=priority,
+            timeout=timeout,
+            **params
+        ):
+            text += delta
+            render(placeholder, text + " ▌")
+    except GraniteError as e:
+        text = f"{text}\n\n❌ {e}" if text else f"❌ {e}"
+    render(placeholder, text)
+    return text
+
+def collect_granite(user_prompt, system_prompt="You are a math reasoning assistant.", cancel=None,
+                    timeout=300, priority="default", client=None):
+    """Streamed answer as one string, for worker threads; gives up once `cancel` is set.
+
+    Giving up closes the HTTP stream, which cancels the generation on the server,
+    so abandoned work stops using the model. Errors come back like query_granite's.
+    """
+    if cancel is not None and cancel.is_set():
+        return ""
+    client = client or get_granite_client()
+    text = ""
+    deltas = client.stream(user_prompt, system_prompt=system_prompt, priority=priority, timeout=timeout)
+    try:
+        for delta in deltas:
+            if cancel is not None and cancel.is_set():
+                break
+            text += delta
+    except GraniteError as e:
+        return f"{text}\n\n❌ {e}" if text else f"❌ {e}"
+    finally:
+        deltas.close()
+    return text
 
 # ==================== STREAMLIT APPLICATION ====================
 def main():
@@ -526,11 +418,25 @@ def main():
         
         elif page == "📚 Question Bank":
             if st.button("🔄 Refresh Questions"):
-                st.session_state.questions_list = get_questions_list(limit=20)
+                get_question_facets.clear()
+                count_questions.clear()
+                st.session_state.bank_cursors = [None]
                 st.rerun()
         
         st.markdown("---")
         
+        with st.expander("🗄️ Database"):
+            health = get_db_health()
+            pool_stats = get_db_pool().stats()
+            col_db1, col_db2 = st.columns(2)
+            col_db1.metric("Status", "✅ Up" if health['ok'] else "❌ Down", f"{health['latency_ms']:.0f} ms",
+                           delta_color="off")
+            col_db2.metric("Avg Wait", f"{pool_stats['avg_wait_ms']:.1f} ms")
+            st.caption(f"{pool_stats['in_use']}/{pool_stats['max_size']} connections in use · "
+                       f"max wait {pool_stats['max_wait_ms']:.0f} ms · {pool_stats['timeouts']} timeouts")
+            if health['error']:
+                st.caption(f"❌ {health['error']}")
+        
         # About Section
         with st.expander("ℹ️ About this Platform"):
             st.info("""
@@ -562,8 +468,12 @@ def init_session_state():
         st.session_state.student_solution = ""
     if 'feedback_result' not in st.session_state:
         st.session_state.feedback_result = None
-    if 'questions_list' not in st.session_state:
-        st.session_state.questions_list = []
+    if 'marking_futures' not in st.session_state:
+        st.session_state.marking_futures = None
+    if 'marking_cancel' not in st.session_state:
+        st.session_state.marking_cancel = None
+    if 'baseline_explanation' not in st.session_state:
+        st.session_state.baseline_explanation = None
     
     # Tutor Chat
     if 'tutor_messages' not in st.session_state:
@@ -574,6 +484,11 @@ def init_session_state():
     # Question Bank
     if 'current_question_index' not in st.session_state:
         st.session_state.current_question_index = 0
+    if 'bank_filters' not in st.session_state:
+        st.session_state.bank_filters = None
+    if 'bank_cursors' not in st.session_state:
+        # Last question_id of each page visited so far; the current page starts after the last entry
+        st.session_state.bank_cursors = [None]
 
 def load_random_question():
     """Load a random question for marking system"""
@@ -581,7 +496,7 @@ def load_random_question():
     if questions:
         st.session_state.selected_question = get_question_by_id(questions[0]['question_id'])
         st.session_state.student_solution = ""
-        st.session_state.feedback_result = None
+        reset_marking()
 
 # ==================== TUTOR CHAT PAGE ====================
 def show_tutor_chat():
@@ -631,6 +546,14 @@ def show_tutor_chat():
         
         include_exam_tips = st.checkbox("Include Exam Tips", value=True)
         include_cas = st.checkbox("Include CAS Instructions", value=True)
+        
+        with st.expander("⚡ Answer Cache"):
+            cache_stats = get_tutor_cache().stats()
+            col_cache1, col_cache2 = st.columns(2)
+            col_cache1.metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+            col_cache2.metric("Evictions", cache_stats['evictions'])
+            st.caption(f"{cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+                       f"threshold {cache_stats['threshold']:.2f}")
     
     # Display chat messages
     chat_container = st.container()
@@ -651,22 +574,7 @@ def show_tutor_chat():
             """, unsafe_allow_html=True)
         else:
             for message in st.session_state.tutor_messages:
-                if message["role"] == "user":
-                    st.markdown(f"""
-                    <div class="chat-message user">
-                        <strong>You:</strong><br>
-                        {message["content"]}
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    # Format the assistant's response
-                    formatted_response = format_tutor_response(message["content"])
-                    st.markdown(f"""
-                    <div class="chat-message assistant">
-                        <strong>AI Tutor:</strong><br>
-                        {formatted_response}
-                    </div>
-                    """, unsafe_allow_html=True)
+                render_chat_message(st, message["role"], message["content"])
     
     # Quick example questions
     st.markdown("### 💡 Try These Questions:")
@@ -683,7 +591,8 @@ def show_tutor_chat():
         with example_cols[idx]:
             if st.button(example[:25] + "...", key=f"example_{idx}", use_container_width=True):
                 st.session_state.tutor_mode = mode
-                process_tutor_input(example, curriculum_area, year_level, include_exam_tips, include_cas)
+                process_tutor_input(example, curriculum_area, year_level, include_exam_tips, include_cas,
+                                    chat_container)
     
     # Chat input
     st.markdown("---")
@@ -702,12 +611,13 @@ def show_tutor_chat():
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("📤 Send", use_container_width=True, type="primary"):
             if user_input.strip():
-                process_tutor_input(user_input, curriculum_area, year_level, include_exam_tips, include_cas)
+                process_tutor_input(user_input, curriculum_area, year_level, include_exam_tips, include_cas,
+                                    chat_container)
             else:
                 st.warning("Please enter a question.")
 
-def process_tutor_input(user_input, curriculum_area, year_level, include_exam_tips, include_cas):
-    """Process user input and get tutor response"""
+def process_tutor_input(user_input, curriculum_area, year_level, include_exam_tips, include_cas, chat_container):
+    """Process user input and stream the tutor response into the chat"""
     # Add user message to chat
     st.session_state.tutor_messages.append({
         "role": "user", 
@@ -744,13 +654,34 @@ def process_tutor_input(user_input, curriculum_area, year_level, include_exam_ti
     if include_cas:
         system_prompt += "\n\nInclude CAS calculator instructions where applicable."
     
-    # Show loading and get response
-    with st.spinner("🤔 AI Tutor is thinking..."):
-        response = query_granite(
-            user_prompt=user_input,
-            system_prompt=system_prompt,
-            context=context_info
-        )
+    # Near-identical questions asked with the same settings reuse an earlier answer
+    tutor_settings = {
+        "tutor_mode": st.session_state.tutor_mode,
+        "curriculum_area": curriculum_area,
+        "year_level": year_level,
+        "include_exam_tips": include_exam_tips,
+        "include_cas": include_cas
+    }
+    cache = get_tutor_cache()
+    cached = cache.lookup(user_input, tutor_settings)
+    
+    if cached:
+        response = cached["answer"]
+    else:
+        # Show the new question and stream the answer below it as it is generated
+        with chat_container:
+            render_chat_message(st, "user", user_input)
+            response_placeholder = st.empty()
+            render_chat_message(response_placeholder, "assistant", "🤔 AI Tutor is thinking...")
+            response = stream_granite(
+                response_placeholder,
+                lambda placeholder, text: render_chat_message(placeholder, "assistant", text),
+                user_prompt=user_input,
+                system_prompt=system_prompt,
+                context=context_info
+            )
+        if not response.startswith("❌") and "\n\n❌ " not in response:
+            cache.store(user_input, tutor_settings, response)
     
     # Add assistant response to chat
     st.session_state.tutor_messages.append({
@@ -760,6 +691,25 @@ def process_tutor_input(user_input, curriculum_area, year_level, include_exam_ti
     
     st.rerun()
 
+def render_chat_message(target, role, content):
+    """Draw one chat bubble into `target` (the page, a container or a placeholder)"""
+    if role == "user":
+        target.markdown(f"""
+        <div class="chat-message user">
+            <strong>You:</strong><br>
+            {content}
+        </div>
+        """, unsafe_allow_html=True)
+    else:
+        # Format the assistant's response
+        formatted_response = format_tutor_response(content)
+        target.markdown(f"""
+        <div class="chat-message assistant">
+            <strong>AI Tutor:</strong><br>
+            {formatted_response}
+        </div>
+        """, unsafe_allow_html=True)
+
 def format_tutor_response(response_text):
     """Format the tutor's response with enhanced visual elements"""
     # Simple formatting - you can enhance this based on your needs
@@ -771,10 +721,7 @@ def show_marking_system():
     st.title("📝 VCE Mathematics Marking System")
     st.markdown("### AI-Powered Practice & Evaluation Platform")
     
-    # Load questions if not loaded
-    if not st.session_state.questions_list:
-        with st.spinner("Loading questions from database..."):
-            st.session_state.questions_list = get_questions_list(limit=20)
+    facets = get_question_facets()
     
     # Sidebar for question selection
     with st.sidebar:
@@ -784,26 +731,20 @@ def show_marking_system():
         search_term = st.text_input("🔍 Search questions", placeholder="Type keywords...")
         
         # Filter by difficulty
-        difficulties = ["All"] + sorted(list(set([q['difficulty'] for q in st.session_state.questions_list if q['difficulty']])))
+        difficulties = ["All"] + facets['difficulties']
         selected_difficulty = st.selectbox("Filter by difficulty", difficulties)
         
         # Filter by subject
-        subjects = ["All"] + sorted(list(set([q['subject'] for q in st.session_state.questions_list if q['subject']])))
+        subjects = ["All"] + facets['subjects']
         selected_subject = st.selectbox("Filter by subject", subjects)
         
-        # Filtered questions
-        filtered_questions = st.session_state.questions_list
-        
-        if search_term:
-            filtered_questions = [q for q in filtered_questions 
-                                if search_term.lower() in q['preview_text'].lower() 
-                                or search_term.lower() in str(q['question_number']).lower()]
-        
-        if selected_difficulty != "All":
-            filtered_questions = [q for q in filtered_questions if q['difficulty'] == selected_difficulty]
-        
-        if selected_subject != "All":
-            filtered_questions = [q for q in filtered_questions if q['subject'] == selected_subject]
+        # Best matches first when searching, otherwise the first questions in the bank
+        filters = question_bank.question_filters(
+            search_term,
+            subjects=[] if selected_subject == "All" else [selected_subject],
+            difficulties=[] if selected_difficulty == "All" else [selected_difficulty]
+        )
+        filtered_questions, _ = question_bank.fetch_page(filters, limit=15)
     
     # Main content area
     col1, col2 = st.columns([2, 1])
@@ -864,40 +805,37 @@ def show_marking_system():
             
             if clear_button:
                 st.session_state.student_solution = ""
-                st.session_state.feedback_result = None
+                reset_marking()
                 st.rerun()
             
             if show_answer:
                 with st.expander("📘 Correct Solution", expanded=True):
                     st.markdown(question_data['detailed_answer'])
             
-            # Process submission
+            # Process submission: explanation and rubric generate in the background
+            # while the evaluation streams into the feedback panel
             if submit_button and student_solution:
-                with st.spinner("🔍 Evaluating your solution with AI..."):
-                    # Prepare prompt for Granite
-                    prompt = MARKING_PROMPTS["evaluate_solution"].format(
-                        question_text=question_data['question_text'],
-                        detailed_answer=question_data['detailed_answer'],
-                        student_solution=student_solution,
-                        subject=question_data['exam']['subject'],
-                        year=question_data['exam']['year'],
-                        exam_name=question_data['exam']['exam_name'],
-                        aos=question_data['aos'],
-                        difficulty=question_data['difficulty_level'],
-                        skill_type=question_data['skill_type']
-                    )
-                    
-                    # Get AI feedback
-                    feedback = query_granite(
-                        user_prompt=prompt,
-                        system_prompt="You are an expert VCE mathematics examiner providing detailed feedback."
-                    )
-                    
-                    # Store feedback in session state
-                    st.session_state.feedback_result = feedback
-                    st.session_state.student_solution = student_solution
-                    
-                    st.rerun()
+                reset_marking()
+                st.session_state.marking_futures = submit_marking(question_data, student_solution)
+                st.session_state.student_solution = student_solution
+                
+                st.markdown("---")
+                st.subheader("🎯 AI Feedback & Evaluation")
+                feedback_placeholder = st.empty()
+                feedback_placeholder.info("🔍 Evaluating your solution with AI...")
+                st.session_state.feedback_result = stream_granite(
+                    feedback_placeholder,
+                    lambda placeholder, text: placeholder.markdown(
+                        format_marking_feedback(parse_marking_feedback(text)) or text
+                    ),
+                    user_prompt=MARKING_PROMPTS["evaluate_solution"].format(
+                        **marking_fields(question_data, student_solution)
+                    ),
+                    system_prompt=MARKING_SYSTEM_PROMPTS["evaluate_solution"],
+                    priority="interactive",
+                    json_schema=MARKING_SCHEMAS["evaluate_solution"]
+                )
+                st.rerun()
             
             # Display feedback if available
             if st.session_state.feedback_result:
@@ -928,7 +866,7 @@ def show_marking_system():
         if not filtered_questions:
             st.warning("No questions match your filters.")
         else:
-            for idx, q in enumerate(filtered_questions[:15]):  # Show first 15
+            for idx, q in enumerate(filtered_questions):
                 is_selected = (st.session_state.selected_question and 
                              st.session_state.selected_question['question_id'] == q['question_id'])
                 
@@ -951,7 +889,7 @@ def show_marking_system():
                             with st.spinner(f"Loading question {q['question_id']}..."):
                                 st.session_state.selected_question = get_question_by_id(q['question_id'])
                                 st.session_state.student_solution = ""
-                                st.session_state.feedback_result = None
+                                reset_marking()
                                 st.rerun()
                     
                     if is_selected:
@@ -959,6 +897,54 @@ def show_marking_system():
                 
                 st.markdown("---")
 
+def reset_marking():
+    """Forget the current feedback and stop generations nobody is waiting for"""
+    # Queued jobs are cancelled outright; running ones stop streaming at their next token
+    if st.session_state.get('marking_cancel') is not None:
+        st.session_state.marking_cancel.set()
+    for future in (st.session_state.get('marking_futures') or {}).values():
+        future.cancel()
+    st.session_state.marking_futures = None
+    st.session_state.marking_cancel = None
+    st.session_state.feedback_result = None
+    st.session_state.baseline_explanation = None
+
+def submit_marking(question_data, student_solution):
+    """Start the explain and rubric prompts in the background; returns their futures by prompt name.
+
+    The evaluation itself is streamed by the caller, so all three generate concurrently.
+    When the question has a stored baseline explanation, only the part about this
+    student's attempt (explanation_delta) is generated.
+    """
+    fields = marking_fields(question_data, student_solution)
+    client = get_granite_client()
+    executor = get_granite_executor()
+    
+    st.session_state.baseline_explanation = get_explanation_store().get(question_data['question_id'])
+    explain_name = "explanation_delta" if st.session_state.baseline_explanation else "explain_correct_answer"
+    
+    st.session_state.marking_cancel = threading.Event()
+    futures = {}
+    for name in (explain_name, "rubric_evaluation"):
+        futures[name] = executor.submit(
+            collect_granite,
+            user_prompt=MARKING_PROMPTS[name].format(**fields),
+            system_prompt=MARKING_SYSTEM_PROMPTS[name],
+            cancel=st.session_state.marking_cancel,
+            client=client
+        )
+    return futures
+
+@st.fragment(run_every=ANALYSIS_POLL_SECONDS)
+def pending_analysis_panel(future, waiting_text):
+    """Poll a background generation, rerunning only this panel, so the page never waits on it"""
+    if future.cancelled():
+        st.info("Submit a solution to see this analysis.")
+    elif future.done():
+        st.markdown(future.result())
+    else:
+        st.info(waiting_text)
+
 def display_feedback(question_data):
     """Display the feedback from AI evaluation"""
     st.markdown("---")
@@ -967,37 +953,12 @@ def display_feedback(question_data):
     feedback_text = st.session_state.feedback_result
     
     # Parse feedback sections
-    verdict = ""
-    score = ""
-    feedback_content = ""
-    mistakes = ""
-    improvements = ""
-    
-    lines = feedback_text.split('\n')
-    current_section = ""
-    
-    for line in lines:
-        if line.startswith("VERDICT:"):
-            verdict = line.replace("VERDICT:", "").strip()
-            current_section = "verdict"
-        elif line.startswith("SCORE:"):
-            score = line.replace("SCORE:", "").strip()
-            current_section = "score"
-        elif line.startswith("FEEDBACK:"):
-            feedback_content = line.replace("FEEDBACK:", "").strip()
-            current_section = "feedback"
-        elif line.startswith("MISTAKES:"):
-            mistakes = line.replace("MISTAKES:", "").strip()
-            current_section = "mistakes"
-        elif line.startswith("IMPROVEMENTS:"):
-            improvements = line.replace("IMPROVEMENTS:", "").strip()
-            current_section = "improvements"
-        elif current_section == "feedback" and line.strip() and not line.startswith("MISTAKES:"):
-            feedback_content += "\n" + line.strip()
-        elif current_section == "mistakes" and line.strip() and not line.startswith("IMPROVEMENTS:"):
-            mistakes += "\n" + line.strip()
-        elif current_section == "improvements" and line.strip():
-            improvements += "\n" + line.strip()
+    sections = parse_marking_feedback(feedback_text)
+    verdict = sections["verdict"]
+    score = sections["score"]
+    feedback_content = sections["feedback"]
+    mistakes = sections["mistakes"]
+    improvements = sections["improvements"]
     
     # Display verdict with appropriate styling
     if "✅ CORRECT" in verdict:
@@ -1035,44 +996,30 @@ def display_feedback(question_data):
         else:
             st.info("No improvement suggestions available.")
     
-    # Additional analysis options
+    # Additional analysis, generated in the background since submission
     st.markdown("---")
     st.subheader("🔍 Additional Analysis")
     
-    col_anal1, col_anal2 = st.columns(2)
-    
-    with col_anal1:
-        if st.button("🤔 Explain Correct Solution", use_container_width=True):
-            with st.spinner("Generating explanation..."):
-                explain_prompt = MARKING_PROMPTS["explain_correct_answer"].format(
-                    question_text=question_data['question_text'],
-                    detailed_answer=question_data['detailed_answer'],
-                    student_solution=st.session_state.student_solution
-                )
-                explanation = query_granite(
-                    user_prompt=explain_prompt,
-                    system_prompt="You are a patient mathematics tutor explaining concepts clearly."
-                )
-                with st.expander("📘 Step-by-Step Explanation", expanded=True):
-                    st.markdown(explanation)
-    
-    with col_anal2:
-        if st.button("📊 Rubric Breakdown", use_container_width=True):
-            with st.spinner("Analyzing against rubric..."):
-                rubric_prompt = MARKING_PROMPTS["rubric_evaluation"].format(
-                    question_text=question_data['question_text'],
-                    detailed_answer=question_data['detailed_answer'],
-                    student_solution=st.session_state.student_solution,
-                    difficulty=question_data['difficulty_level'],
-                    skill_type=question_data['skill_type'],
-                    aos=question_data['aos']
-                )
-                rubric_analysis = query_granite(
-                    user_prompt=rubric_prompt,
-                    system_prompt="You are a VCE mathematics assessor applying marking rubrics."
-                )
-                with st.expander("📋 Rubric Evaluation", expanded=True):
-                    st.markdown(rubric_analysis)
+    futures = st.session_state.marking_futures or {}
+    tab_explain, tab_rubric = st.tabs(["🤔 Explain Correct Solution", "📊 Rubric Breakdown"])
+    
+    baseline = st.session_state.baseline_explanation
+    for tab, name, waiting_text in (
+        (tab_explain, "explanation_delta" if baseline else "explain_correct_answer", "⏳ Generating explanation..."),
+        (tab_rubric, "rubric_evaluation", "⏳ Analyzing against rubric...")
+    ):
+        with tab:
+            if name == "explanation_delta":
+                st.markdown(baseline)
+                st.markdown("#### 🔎 Your Attempt Compared")
+                waiting_text = "⏳ Comparing with your attempt..."
+            future = futures.get(name)
+            if future is None or future.cancelled():
+                st.info("Submit a solution to see this analysis.")
+            elif future.done():
+                st.markdown(future.result())
+            else:
+                pending_analysis_panel(future, waiting_text)
 
 # ==================== QUESTION BANK PAGE ====================
 def show_question_bank():
@@ -1080,10 +1027,7 @@ def show_question_bank():
     st.title("📚 VCE Question Bank")
     st.markdown("### Browse and Search VCE Mathematics Questions")
     
-    # Load questions if not loaded
-    if not st.session_state.questions_list:
-        with st.spinner("Loading questions from database..."):
-            st.session_state.questions_list = get_questions_list(limit=50)
+    facets = get_question_facets()
     
     # Search and filter controls
     col_search1, col_search2, col_search3, col_search4 = st.columns(4)
@@ -1092,68 +1036,32 @@ def show_question_bank():
         search_term = st.text_input("🔍 Search", placeholder="Keyword...")
     
     with col_search2:
-        year_filter = st.multiselect(
-            "Year",
-            options=sorted(list(set([str(q['year']) for q in st.session_state.questions_list]))),
-            default=[]
-        )
+        year_filter = st.multiselect("Year", options=[str(y) for y in facets['years']], default=[])
     
     with col_search3:
-        subject_filter = st.multiselect(
-            "Subject",
-            options=sorted(list(set([q['subject'] for q in st.session_state.questions_list if q['subject']]))),
-            default=[]
-        )
+        subject_filter = st.multiselect("Subject", options=facets['subjects'], default=[])
     
     with col_search4:
-        difficulty_filter = st.multiselect(
-            "Difficulty",
-            options=sorted(list(set([q['difficulty'] for q in st.session_state.questions_list if q['difficulty']]))),
-            default=[]
-        )
-    
-    # Filter questions
-    filtered_questions = st.session_state.questions_list
-    
-    if search_term:
-        filtered_questions = [q for q in filtered_questions 
-                            if search_term.lower() in q['preview_text'].lower() 
-                            or search_term.lower() in str(q['question_number']).lower()
-                            or search_term.lower() in str(q['year']).lower()]
+        difficulty_filter = st.multiselect("Difficulty", options=facets['difficulties'], default=[])
     
-    if year_filter:
-        filtered_questions = [q for q in filtered_questions if str(q['year']) in year_filter]
+    # Filtering and paging run in SQL; changing a filter starts again from the first page
+    filters = question_bank.question_filters(search_term, year_filter, subject_filter, difficulty_filter)
+    if st.session_state.bank_filters != filters:
+        st.session_state.bank_filters = filters
+        st.session_state.bank_cursors = [None]
     
-    if subject_filter:
-        filtered_questions = [q for q in filtered_questions if q['subject'] in subject_filter]
-    
-    if difficulty_filter:
-        filtered_questions = [q for q in filtered_questions if q['difficulty'] in difficulty_filter]
+    page_number = len(st.session_state.bank_cursors)
+    page_questions, next_after = question_bank.fetch_page(filters, after=st.session_state.bank_cursors[-1])
+    total = count_questions(filters)
     
     # Display question count
-    st.markdown(f"**Showing {len(filtered_questions)} of {len(st.session_state.questions_list)} questions**")
+    total_label = f"{total:,}+" if total >= question_bank.COUNT_LIMIT else f"{total:,}"
+    st.markdown(f"**{total_label} questions match**")
     
     # Display questions in a grid
-    if filtered_questions:
-        # Pagination
-        items_per_page = 10
-        total_pages = max(1, (len(filtered_questions) + items_per_page - 1) // items_per_page)
-        
-        # Page selector
-        if total_pages > 1:
-            page_number = st.number_input(
-                "Page", 
-                min_value=1, 
-                max_value=total_pages, 
-                value=1,
-                step=1
-            )
-        else:
-            page_number = 1
-        
+    if page_questions:
+        items_per_page = question_bank.PAGE_SIZE
         start_idx = (page_number - 1) * items_per_page
-        end_idx = min(start_idx + items_per_page, len(filtered_questions))
-        page_questions = filtered_questions[start_idx:end_idx]
         
         # Display questions
         for idx, q in enumerate(page_questions):
@@ -1186,10 +1094,21 @@ def show_question_bank():
                 st.markdown("---")
         
         # Page navigation
-        if total_pages > 1:
-            col_nav1, col_nav2, col_nav3 = st.columns([1, 2, 1])
-            with col_nav2:
+        total_pages = max(1, (total + items_per_page - 1) // items_per_page)
+        col_nav1, col_nav2, col_nav3 = st.columns([1, 2, 1])
+        with col_nav1:
+            if st.button("◀ Previous", disabled=page_number == 1, use_container_width=True):
+                st.session_state.bank_cursors.pop()
+                st.rerun()
+        with col_nav2:
+            if total >= question_bank.COUNT_LIMIT:
+                st.caption(f"Page {page_number}")
+            else:
                 st.caption(f"Page {page_number} of {total_pages}")
+        with col_nav3:
+            if st.button("Next ▶", disabled=next_after is None, use_container_width=True):
+                st.session_state.bank_cursors.append(next_after)
+                st.rerun()
     else:
         st.warning("No questions match your filters. Try different search criteria.")
 
@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import torch
+import transformers
+from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+from backends import (
+    BACKENDS,
+    CPU_DTYPES,
+    NF4_SETTINGS,
+    compile_model,
+    configure_cpu_threads,
+    load_model,
+    load_phase,
+    usable_cpu_dtypes
+)
+
+# Bump when the on-disk layout changes; older artifacts then stop matching
+ARTIFACT_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+INT8_WEIGHTS_NAME = "int8_dynamic.pt"
+# Files of a local model directory whose size/mtime go into the fingerprint
+WEIGHT_EXTENSIONS = (".safetensors", ".bin", ".pt", ".pth")
+
+
+# ============================================================
+# Fingerprint
+# ============================================================
+def artifact_fingerprint(model_name: str, backend: str, cpu_dtype: str = "int8") -> tuple:
+    """(sha256 hex, inputs) of everything that decides what the quantized weights look like.
+
+    Any change to the upstream config/revision, the quantization settings or the
+    library versions that produce them yields a different fingerprint. A local
+    model directory has no revision, so its weight files' sizes and modification
+    times stand in for it (retrained weights under an unchanged config.json).
+    """
+    config = AutoConfig.from_pretrained(model_name)
+    try:
+        import bitsandbytes
+        bnb_version = bitsandbytes.__version__
+    except ImportError:
+        bnb_version = None
+
+    inputs = {
+        "format": ARTIFACT_FORMAT,
+        "model_name": model_name,
+        "revision": getattr(config, "_commit_hash", None),
+        "weights": local_weight_files(model_name),
+        "config": config.to_dict(),
+        "backend": backend,
+        "cpu_dtype": cpu_dtype if backend == "cpu" else None,
+        "quantization": {k: str(v) for k, v in NF4_SETTINGS.items()} if backend == "cuda" else None,
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "bitsandbytes": bnb_version if backend == "cuda" else None
+    }
+    payload = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest(), inputs
+
+
+def local_weight_files(model_name: str) -> list:
+    """(name, size, mtime_ns) of each weight file when model_name is a local directory, else None"""
+    if not os.path.isdir(model_name):
+        return None
+    weights = []
+    for entry in sorted(os.scandir(model_name), key=lambda e: e.name):
+        if entry.is_file() and entry.name.endswith(WEIGHT_EXTENSIONS):
+            stat = entry.stat()
+            weights.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return weights
+
+
+def artifact_path(artifact_dir: str, model_name: str, backend: str, cpu_dtype: str, fingerprint: str) -> str:
+    variant = backend if backend == "cuda" else f"{backend}-{cpu_dtype}"
+    return os.path.join(artifact_dir, f"{model_name.replace('/', '--')}-{variant}-{fingerprint[:16]}")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_artifact(path: str, manifest: dict) -> bool:
+    """Whether every file of an artifact still has the checksum recorded when it was written"""
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or file_sha256(file_path) != expected:
+            print(f"⚠️  Ignoring artifact {path}: checksum mismatch for {name}")
+            return False
+    return True
+
+
+# ============================================================
+# Export
+# ============================================================
+def _check_cpu_dtype(backend: str, cpu_dtype: str):
+    """Same checks as load_cpu, made before any artifact is named after cpu_dtype"""
+    if backend != "cpu":
+        return
+    if cpu_dtype not in CPU_DTYPES:
+        raise ValueError(f"Unknown CPU dtype '{cpu_dtype}', expected one of {CPU_DTYPES}")
+    if cpu_dtype not in usable_cpu_dtypes():
+        raise ValueError(f"CPU has no native bf16 support, use one of {usable_cpu_dtypes()} instead")
+
+
+def export_artifact(model_name: str, artifact_dir: str, backend: str = "cuda", cpu_dtype: str = "int8") -> str:
+    """Quantize once and save the result; returns the artifact directory.
+
+    cuda and cpu bf16/fp32 are written with save_pretrained (safetensors, memory-mapped
+    on load). int8 dynamic quantization has no safetensors form, so its packed weights
+    go into one torch file that is loaded with mmap=True.
+    """
+    # The fingerprint, path and save format all follow cpu_dtype, so it has to be what gets loaded
+    _check_cpu_dtype(backend, cpu_dtype)
+
+    fingerprint, inputs = artifact_fingerprint(model_name, backend, cpu_dtype)
+    target = artifact_path(artifact_dir, model_name, backend, cpu_dtype, fingerprint)
+
+    model = load_model(model_name, backend=backend, cpu_dtype=cpu_dtype)
+
+    staging = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        if backend == "cpu" and cpu_dtype == "int8":
+            torch.save({"state_dict": model.state_dict(), "buffers": _non_persistent_buffers(model)},
+                       os.path.join(staging, INT8_WEIGHTS_NAME))
+            model.config.save_pretrained(staging)
+            model.generation_config.save_pretrained(staging)
+        else:
+            model.save_pretrained(staging, safe_serialization=True)
+
+        files = {}
+        for name in sorted(os.listdir(staging)):
+            files[name] = file_sha256(os.path.join(staging, name))
+
+        with open(os.path.join(staging, MANIFEST_NAME), "w") as f:
+            json.dump({
+                "fingerprint": fingerprint,
+                "inputs": inputs,
+                "files": files,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            }, f, indent=2, default=str)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Publish atomically so a half-written export is never picked up
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    return target
+
+
+# ============================================================
+# Load
+# ============================================================
+def load_artifact(model_name: str, artifact_dir: str, backend: str = "cuda", cpu_dtype: str = "int8",
+                  verify: bool = False, timings: dict = None):
+    """The exported model, or None when there is no artifact matching the current fingerprint.
+
+    Checksums are recorded at export time; re-hashing every file costs as much as
+    reading the weights, so it only happens with verify=True.
+    """
+    timings = {} if timings is None else timings
+
+    try:
+        with load_phase(timings, "fingerprint"):
+            fingerprint, _ = artifact_fingerprint(model_name, backend, cpu_dtype)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Can't fingerprint {model_name}, skipping pre-quantized artifacts: {e}")
+        return None
+    path = artifact_path(artifact_dir, model_name, backend, cpu_dtype, fingerprint)
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    if manifest.get("fingerprint") != fingerprint:
+        print(f"⚠️  Ignoring artifact {path}: fingerprint mismatch")
+        return None
+
+    if verify:
+        with load_phase(timings, "verify_checksum"):
+            if not verify_artifact(path, manifest):
+                return None
+
+    with load_phase(timings, "read_artifact"):
+        if backend == "cuda":
+            model = AutoModelForCausalLM.from_pretrained(path, device_map="auto")
+        elif cpu_dtype == "int8":
+            model = _load_int8(path)
+        else:
+            model = AutoModelForCausalLM.from_pretrained(
+                path,
+                torch_dtype=torch.bfloat16 if cpu_dtype == "bf16" else torch.float32,
+                low_cpu_mem_usage=True
+            )
+
+    return model.eval()
+
+
+def load_model_with_artifact(model_name: str, artifact_dir: str = None, verify: bool = False,
+                             timings: dict = None, backend: str = "cuda", cpu_dtype: str = "int8",
+                             cpu_threads: int = None, compile_forward: bool = False):
+    """load_model(), but from a pre-quantized artifact when a valid one exists"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    _check_cpu_dtype(backend, cpu_dtype)
+
+    timings = {} if timings is None else timings
+    model = None
+    if artifact_dir:
+        if backend == "cpu":
+            configure_cpu_threads(cpu_threads)
+        model = load_artifact(model_name, artifact_dir, backend, cpu_dtype, verify=verify, timings=timings)
+
+    if model is None:
+        if artifact_dir:
+            dtype_flag = f" --cpu-dtype {cpu_dtype}" if backend == "cpu" else ""
+            print(f"ℹ️  No pre-quantized artifact for {model_name} in {artifact_dir}; "
+                  f"create one with: python artifacts.py --model {model_name} --backend {backend}{dtype_flag}")
+        return load_model(model_name, backend=backend, cpu_dtype=cpu_dtype, cpu_threads=cpu_threads,
+                          compile_forward=compile_forward, timings=timings)
+
+    print(f"📦 Loaded pre-quantized artifact for {model_name}")
+    if compile_forward:
+        with load_phase(timings, "compile"):
+            model = compile_model(model)
+    return model
+
+
+def _non_persistent_buffers(model) -> dict:
+    """Buffers missing from state_dict(), e.g. rotary inv_freq, which the meta skeleton can't rebuild"""
+    buffers = {}
+    for module_name, module in model.named_modules():
+        for buffer_name in module._non_persistent_buffers_set:
+            buffers[f"{module_name}.{buffer_name}" if module_name else buffer_name] = getattr(module, buffer_name)
+    return buffers
+
+
+def _load_int8(path: str):
+    """Rebuild the dynamic-quantized module tree on the meta device and assign the mmapped weights"""
+    config = AutoConfig.from_pretrained(path)
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=torch.float32)
+
+    # Same module swap quantize_dynamic performs, without quantizing anything
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if type(child) is torch.nn.Linear:
+                setattr(module, child_name, torch.ao.nn.quantized.dynamic.Linear(
+                    child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8
+                ))
+
+    saved = torch.load(os.path.join(path, INT8_WEIGHTS_NAME), mmap=True, weights_only=True)
+    model.load_state_dict(saved["state_dict"], strict=True, assign=True)
+    for name, tensor in saved["buffers"].items():
+        module_name, _, buffer_name = name.rpartition(".")
+        model.get_submodule(module_name).register_buffer(buffer_name, tensor, persistent=False)
+
+    model.generation_config = GenerationConfig.from_pretrained(path)
+    return model
+
+
+# ============================================================
+# Entry Point
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Export a pre-quantized model artifact for fast server start-up")
+    parser.add_argument("--model", default="ibm-granite/granite-3.3-8b-base")
+    parser.add_argument("--backend", choices=BACKENDS, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--cpu-dtype", choices=CPU_DTYPES, default="int8")
+    parser.add_argument("--out", default=os.environ.get("GRANITE_ARTIFACT_DIR") or os.path.expanduser(
+        "~/.cache/granite-artifacts"
+    ))
+    parser.add_argument("--verify", action="store_true",
+                        help="Check the checksums of the existing artifact instead of exporting")
+    args = parser.parse_args()
+
+    if args.verify:
+        fingerprint, _ = artifact_fingerprint(args.model, args.backend, args.cpu_dtype)
+        path = artifact_path(args.out, args.model, args.backend, args.cpu_dtype, fingerprint)
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            print(f"❌ No artifact for {args.model} ({args.backend}) at {path}")
+            raise SystemExit(1)
+        with open(manifest_path, "r") as f:
+            ok = verify_artifact(path, json.load(f))
+        print(f"✅ {path} matches its manifest" if ok else f"❌ {path} is corrupt; export it again")
+        raise SystemExit(0 if ok else 1)
+
+    start = time.perf_counter()
+    path = export_artifact(args.model, args.out, backend=args.backend, cpu_dtype=args.cpu_dtype)
+    print(f"✅ Exported {args.model} ({args.backend}) to {path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
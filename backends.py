@@ -0,0 +1,152 @@
+import os
+import time
+from contextlib import contextmanager
+
+import torch
+from transformers import AutoModelForCausalLM, BitsAndBytesConfig
+
+BACKENDS = ("cuda", "cpu")
+CPU_DTYPES = ("int8", "bf16", "fp32")
+
+NF4_SETTINGS = {
+    "load_in_4bit": True,
+    "bnb_4bit_use_double_quant": True,
+    "bnb_4bit_quant_type": "nf4",
+    "bnb_4bit_compute_dtype": torch.bfloat16
+}
+
+
+# ============================================================
+# Backend Selection
+# ============================================================
+def load_model(model_name: str, backend: str = "cuda", cpu_dtype: str = "int8",
+               cpu_threads: int = None, compile_forward: bool = False, timings: dict = None):
+    """Load the causal LM for the requested backend.
+
+    cuda: bitsandbytes NF4 with device_map="auto" (the original server setup)
+    cpu:  int8 dynamic quantization, bf16 or fp32 weights on CPU
+
+    Seconds spent per load phase are added to `timings` when given.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+    timings = {} if timings is None else timings
+
+    if backend == "cuda":
+        model = load_cuda_nf4(model_name, timings)
+    else:
+        model = load_cpu(model_name, dtype=cpu_dtype, threads=cpu_threads, timings=timings)
+
+    model.eval()
+
+    if compile_forward:
+        with load_phase(timings, "compile"):
+            model = compile_model(model)
+
+    return model
+
+
+@contextmanager
+def load_phase(timings: dict, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def load_cuda_nf4(model_name: str, timings: dict = None):
+    quant_config = BitsAndBytesConfig(**NF4_SETTINGS)
+
+    # bitsandbytes quantizes each weight as it is placed on the GPU, so reading,
+    # quantizing and moving to the device are a single phase here
+    with load_phase({} if timings is None else timings, "read_quantize_to_device"):
+        return AutoModelForCausalLM.from_pretrained(
+            model_name,
+            quantization_config=quant_config,
+            device_map="auto"
+        )
+
+
+def load_cpu(model_name: str, dtype: str = "int8", threads: int = None, timings: dict = None):
+    if dtype not in CPU_DTYPES:
+        raise ValueError(f"Unknown CPU dtype '{dtype}', expected one of {CPU_DTYPES}")
+
+    if dtype not in usable_cpu_dtypes():
+        # Loading something else instead would leave /stats, benchmarks and artifacts reporting bf16
+        raise ValueError(f"CPU has no native bf16 support, use one of {usable_cpu_dtypes()} instead")
+
+    configure_cpu_threads(threads)
+
+    timings = {} if timings is None else timings
+    with load_phase(timings, "read"):
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=torch.bfloat16 if dtype == "bf16" else torch.float32,
+            low_cpu_mem_usage=True
+        )
+
+    return prepare_cpu_model(model, dtype, timings)
+
+
+def prepare_cpu_model(model, dtype: str = "int8", timings: dict = None):
+    """Convert an already loaded fp32 model for CPU inference"""
+    timings = {} if timings is None else timings
+    with load_phase(timings, "to_device"):
+        model = model.to("cpu").eval()
+
+    with load_phase(timings, "quantize"):
+        if dtype == "int8":
+            # Weights of every nn.Linear are stored as int8; activations are quantized on the fly
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif dtype == "bf16":
+            model = model.to(torch.bfloat16)
+
+    return model
+
+
+def compile_model(model):
+    """Compile the forward pass; shapes change every decode step, so keep them dynamic"""
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+# ============================================================
+# CPU Helpers
+# ============================================================
+def configure_cpu_threads(threads: int = None):
+    if threads:
+        torch.set_num_threads(threads)
+    print(f"🧵 Using {torch.get_num_threads()} CPU threads")
+
+
+def cpu_supports_bf16() -> bool:
+    """True when the CPU has native bf16 instructions (AVX512-BF16 or AMX)"""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def usable_cpu_dtypes() -> tuple:
+    """CPU_DTYPES this machine can run"""
+    return tuple(dtype for dtype in CPU_DTYPES if dtype != "bf16" or cpu_supports_bf16())
+
+
+def backend_from_env() -> dict:
+    """Backend settings from GRANITE_BACKEND / GRANITE_CPU_* / GRANITE_COMPILE"""
+    backend = os.environ.get("GRANITE_BACKEND")
+    if not backend:
+        backend = "cuda" if torch.cuda.is_available() else "cpu"
+
+    threads = os.environ.get("GRANITE_CPU_THREADS")
+
+    return {
+        "backend": backend,
+        "cpu_dtype": os.environ.get("GRANITE_CPU_DTYPE", "int8"),
+        "cpu_threads": int(threads) if threads else None,
+        "compile_forward": os.environ.get("GRANITE_COMPILE", "0") == "1"
+    }
@@ -0,0 +1,201 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import db
+from granite_client import DEFAULT_BASE_URL, GraniteClient, GraniteError
+from marking import marking_fields, parse_marking_feedback, parse_score, verdict_is_correct
+from prompts import MARKING_PROMPTS, MARKING_SCHEMAS, MARKING_SYSTEM_PROMPTS
+
+REQUIRED_FIELDS = ("student", "question_id", "solution")
+
+
+# ============================================================
+# Input / Output
+# ============================================================
+def read_submissions(path: str) -> list:
+    """(student, question_id, solution) rows from a .jsonl or .csv file"""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    submissions = []
+    for line_no, row in enumerate(rows, start=1):
+        missing = [field for field in REQUIRED_FIELDS if not str(row.get(field) or "").strip()]
+        if missing:
+            print(f"⚠️  Skipping row {line_no}: missing {', '.join(missing)}")
+            continue
+        submissions.append({field: str(row[field]).strip() for field in REQUIRED_FIELDS})
+    return submissions
+
+
+def submission_key(submission: dict) -> tuple:
+    return submission["student"], submission["question_id"]
+
+
+def completed_keys(output_path: str) -> set:
+    """Submissions already marked in a previous (possibly interrupted) run"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run killed mid-write leaves at most one partial last line
+                continue
+            done.add(submission_key(record))
+    return done
+
+
+# ============================================================
+# Questions
+# ============================================================
+def fetch_questions(question_ids) -> dict:
+    """question_id -> question_data (the fields the marking prompt needs), in one query"""
+    with db.cursor() as cursor:
+        cursor.execute("""
+            SELECT
+                q.question_id, q.question_text, q.detailed_answer, q.aos,
+                q.difficulty_level, q.skill_type,
+                e.year, e.subject, e.exam_name
+            FROM questions q
+            JOIN exams e ON q.exam_id = e.exam_id
+            WHERE q.question_id = ANY(%s);
+        """, (list(question_ids),))
+        rows = cursor.fetchall()
+
+    return {
+        r[0]: {
+            "question_id": r[0],
+            "question_text": r[1],
+            "detailed_answer": r[2],
+            "aos": r[3],
+            "difficulty_level": r[4],
+            "skill_type": r[5],
+            "exam": {"year": r[6], "subject": r[7], "exam_name": r[8]}
+        }
+        for r in rows
+    }
+
+
+# ============================================================
+# Marking
+# ============================================================
+def mark_submission(client: GraniteClient, submission: dict, question_data: dict, max_new_tokens: int) -> dict:
+    """Evaluate one solution; returns the output record"""
+    body = client.complete(
+        MARKING_PROMPTS["evaluate_solution"].format(**marking_fields(question_data, submission["solution"])),
+        system_prompt=MARKING_SYSTEM_PROMPTS["evaluate_solution"],
+        priority="batch",
+        max_new_tokens=max_new_tokens,
+        json_schema=MARKING_SCHEMAS["evaluate_solution"]
+    )
+    sections = parse_marking_feedback(body.get("output", ""))
+    return {
+        "student": submission["student"],
+        "question_id": submission["question_id"],
+        "verdict": sections["verdict"],
+        "correct": verdict_is_correct(sections["verdict"]),
+        "score": parse_score(sections["score"]),
+        "feedback": sections["feedback"],
+        "mistakes": sections["mistakes"],
+        "improvements": sections["improvements"],
+        "raw_output": body.get("output", ""),
+        "completion_tokens": body.get("completion_tokens", 0),
+        "schema_valid": body.get("schema_valid"),
+        "marked_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    }
+
+
+def run(args) -> int:
+    submissions = read_submissions(args.input)
+    done = completed_keys(args.output)
+    pending = [s for s in submissions if submission_key(s) not in done]
+    print(f"📄 {len(submissions)} submissions, {len(submissions) - len(pending)} already marked, "
+          f"{len(pending)} to go")
+    if not pending:
+        return 0
+
+    questions = fetch_questions({s["question_id"] for s in pending})
+    unknown = [s for s in pending if s["question_id"] not in questions]
+    for s in unknown:
+        print(f"⚠️  Unknown question {s['question_id']} for {s['student']}")
+    pending = [s for s in pending if s["question_id"] in questions]
+
+    client = GraniteClient(args.url, timeout=args.timeout, pool_size=args.concurrency)
+    marked, failed, tokens = 0, len(unknown), 0
+    start = time.perf_counter()
+
+    # One writer (this thread) appends results as they finish; each line is flushed so an
+    # interrupted run loses nothing that was already marked
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {
+            pool.submit(mark_submission, client, s, questions[s["question_id"]], args.max_new_tokens): s
+            for s in pending
+        }
+        try:
+            for future in as_completed(futures):
+                submission = futures[future]
+                try:
+                    record = future.result()
+                except GraniteError as e:
+                    failed += 1
+                    print(f"❌ {submission['student']} / {submission['question_id']}: {e}")
+                    continue
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                marked += 1
+                tokens += record["completion_tokens"]
+                if marked % args.progress_every == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f"⏱️  {marked}/{len(pending)} marked, {marked / elapsed:.2f} submissions/s")
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            print("⏹️  Interrupted; run the same command again to resume")
+            raise
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Marked {marked} submissions in {elapsed:.1f}s "
+          f"({marked / elapsed:.2f} submissions/s, {tokens / elapsed:.1f} tokens/s), {failed} failed")
+    if failed:
+        print("ℹ️  Failed submissions are not written; rerun to retry them")
+    return 1 if failed else 0
+
+
+# ============================================================
+# Entry Point
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mark a class set of solutions with the evaluate_solution prompt. "
+                    "Results are appended to --output; rerunning skips what is already marked."
+    )
+    parser.add_argument("input", help=".jsonl or .csv with student, question_id and solution")
+    parser.add_argument("--output", default=None, help="Results JSONL (default: <input>.marked.jsonl)")
+    parser.add_argument("--url", default=DEFAULT_BASE_URL, help="Granite API base URL")
+    parser.add_argument("--concurrency", type=int, default=4, help="Submissions in flight at once")
+    parser.add_argument("--max-new-tokens", type=int, default=512)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--progress-every", type=int, default=10)
+    args = parser.parse_args()
+    args.output = args.output or f"{os.path.splitext(args.input)[0]}.marked.jsonl"
+
+    try:
+        sys.exit(run(args))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
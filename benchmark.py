@@ -0,0 +1,357 @@
+import argparse
+import random
+import tempfile
+import threading
+import time
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, decoders, trainers
+from transformers import AutoTokenizer, LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+from artifacts import export_artifact, load_model_with_artifact
+from backends import CPU_DTYPES, load_model, usable_cpu_dtypes
+from inference import BatchScheduler
+
+SAMPLE_PROMPTS = [
+    "You are an expert VCE mathematics examiner providing detailed feedback.",
+    "Find the domain of the square root of x^2 - 4x + 3.",
+    "Explain the chain rule with examples.",
+    "Solve the complex number (2+3i)/(1-i) and give the answer in cartesian form.",
+    "Find the derivative of inverse trigonometric functions.",
+    "Compare the student's solution against the correct answer and give a score out of 10.",
+    "VERDICT: CORRECT\nSCORE: 8/10\nFEEDBACK: The working is clear.",
+]
+
+
+# ============================================================
+# Stand-in Model
+# ============================================================
+def build_stand_in_model(vocab_size: int = 512, hidden_size: int = 128, num_layers: int = 4, seed: int = 0):
+    """Tiny randomly-initialised causal LM + tokenizer; runs fully offline"""
+    torch.manual_seed(seed)
+
+    bpe = Tokenizer(models.BPE(unk_token="<unk>"))
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator(
+        SAMPLE_PROMPTS * 10,
+        trainers.BpeTrainer(
+            vocab_size=vocab_size,
+            special_tokens=["<pad>", "<eos>", "<unk>"],
+            initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+            show_progress=False
+        )
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=bpe, pad_token="<pad>", eos_token="<eos>", unk_token="<unk>"
+    )
+
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=2048,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id
+    )
+    model = LlamaForCausalLM(config).eval()
+    return model, tokenizer
+
+
+def build_draft_model(target: LlamaForCausalLM, num_layers: int = 2, agreement: float = 0.98):
+    """Draft stand-in: the target's embeddings, head and first `num_layers` layers.
+
+    Random weights give no real draft/target agreement, so the target's remaining
+    layers are damped by (1 - agreement) to mimic a well-matched draft model.
+    """
+    for layer in target.model.layers[num_layers:]:
+        layer.self_attn.o_proj.weight.data.mul_(1 - agreement)
+        layer.mlp.down_proj.weight.data.mul_(1 - agreement)
+
+    config = LlamaConfig(**target.config.to_dict())
+    config.num_hidden_layers = num_layers
+    draft = LlamaForCausalLM(config).eval()
+    draft.load_state_dict(target.state_dict(), strict=False)
+    return draft
+
+
+def make_prompt(rng: random.Random) -> str:
+    system_prompt = rng.choice(SAMPLE_PROMPTS)
+    user_prompt = " ".join(rng.choice(SAMPLE_PROMPTS) for _ in range(rng.randint(1, 4)))
+    return f"{system_prompt}\n\nUSER:\n{user_prompt}\n\nASSISTANT:"
+
+
+# ============================================================
+# Batching Benchmark
+# ============================================================
+def run_batching(scheduler: BatchScheduler, concurrency: int, requests_per_client: int, seed: int = 0):
+    """Closed loop: `concurrency` clients each send requests back to back"""
+    completion_tokens = [0] * concurrency
+
+    def client(idx):
+        rng = random.Random(seed + idx)
+        for _ in range(requests_per_client):
+            # Mix of short and long answers so early finishers are visible
+            result = scheduler.submit(
+                make_prompt(rng),
+                max_new_tokens=rng.choice([16, 32, 64, 128]),
+                temperature=0.2,
+                top_p=0.9
+            ).result()
+            completion_tokens[idx] += result.completion_tokens
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total_requests = concurrency * requests_per_client
+    return total_requests / elapsed, sum(completion_tokens) / elapsed
+
+
+def bench_batching(args):
+    model, tokenizer = build_stand_in_model()
+    torch.set_num_threads(args.threads)
+
+    print(f"{'mode':<10} {'conc':>5} {'req/s':>10} {'tok/s':>10}")
+    for label, max_batch in (("unbatched", 1), ("batched", args.max_batch_size)):
+        scheduler = BatchScheduler(model, tokenizer, max_batch_size=max_batch,
+                                   batch_window_ms=args.window_ms)
+        for concurrency in args.concurrency:
+            per_client = max(1, args.requests // concurrency)
+            req_s, tok_s = run_batching(scheduler, concurrency, per_client)
+            print(f"{label:<10} {concurrency:>5} {req_s:>10.2f} {tok_s:>10.1f}")
+
+
+# ============================================================
+# Streaming Benchmark
+# ============================================================
+def bench_ttft(args):
+    """Time until the first streamed text vs. time until a blocking call returns"""
+    model, tokenizer = build_stand_in_model()
+    scheduler = BatchScheduler(model, tokenizer, max_batch_size=args.max_batch_size)
+    rng = random.Random(0)
+
+    ttft, full = [], []
+    for _ in range(args.requests):
+        prompt = make_prompt(rng)
+        start = time.perf_counter()
+        stream = scheduler.stream(prompt, max_new_tokens=args.max_new_tokens)
+        for _delta in stream:
+            ttft.append(time.perf_counter() - start)
+            break
+        stream.cancel()
+        stream.result()
+
+        start = time.perf_counter()
+        scheduler.submit(prompt, max_new_tokens=args.max_new_tokens).result()
+        full.append(time.perf_counter() - start)
+
+    ttft.sort()
+    full.sort()
+    print(f"streaming  time-to-first-token p50: {ttft[len(ttft) // 2] * 1000:8.1f} ms")
+    print(f"blocking   time-to-response    p50: {full[len(full) // 2] * 1000:8.1f} ms")
+
+
+# ============================================================
+# Backend Benchmark
+# ============================================================
+def measure_decode(model, tokenizer, requests: int, max_new_tokens: int) -> float:
+    """Single-stream tokens/s, i.e. what one interactive user sees"""
+    scheduler = BatchScheduler(model, tokenizer, max_batch_size=1)
+    rng = random.Random(0)
+
+    # Warm up kernels (and the compiler, for compiled variants) before timing
+    scheduler.submit(make_prompt(rng), max_new_tokens=8, temperature=0).result()
+
+    tokens = 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        result = scheduler.submit(make_prompt(rng), max_new_tokens=max_new_tokens, temperature=0).result()
+        tokens += result.completion_tokens
+    return tokens / (time.perf_counter() - start)
+
+
+def skip_unusable(requested, usable):
+    for dtype in requested:
+        if dtype not in usable:
+            print(f"⚠️  Skipping cpu-{dtype}: not supported on this CPU")
+
+
+def bench_backends(args):
+    with tempfile.TemporaryDirectory() as stand_in_dir:
+        model_name = args.model
+        if model_name is None:
+            model, tokenizer = build_stand_in_model(hidden_size=512, num_layers=8)
+            model.save_pretrained(stand_in_dir)
+            tokenizer.save_pretrained(stand_in_dir)
+            model_name = stand_in_dir
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        cpu_dtypes = usable_cpu_dtypes()
+        skip_unusable(CPU_DTYPES, cpu_dtypes)
+        variants = [("cpu", dtype, False) for dtype in cpu_dtypes]
+        if args.compile:
+            variants += [("cpu", dtype, True) for dtype in cpu_dtypes]
+        if torch.cuda.is_available():
+            variants.insert(0, ("cuda", None, False))
+
+        print(f"{'backend':<22} {'load s':>8} {'tok/s':>10}")
+        for backend, dtype, compiled in variants:
+            start = time.perf_counter()
+            model = load_model(model_name, backend=backend, cpu_dtype=dtype or "int8",
+                               cpu_threads=args.threads, compile_forward=compiled)
+            load_seconds = time.perf_counter() - start
+
+            tok_s = measure_decode(model, tokenizer, args.requests, args.max_new_tokens)
+            label = backend + (f"-{dtype}" if dtype else "") + ("-compiled" if compiled else "")
+            print(f"{label:<22} {load_seconds:>8.2f} {tok_s:>10.1f}")
+            del model
+
+
+# ============================================================
+# Restart Benchmark
+# ============================================================
+def bench_restart(args):
+    """Model load time from the original weights vs from a pre-quantized artifact"""
+    with tempfile.TemporaryDirectory() as stand_in_dir, tempfile.TemporaryDirectory() as artifact_dir:
+        model_name = args.model
+        if model_name is None:
+            model, tokenizer = build_stand_in_model(hidden_size=args.hidden_size, num_layers=args.num_layers)
+            model.save_pretrained(stand_in_dir)
+            tokenizer.save_pretrained(stand_in_dir)
+            model_name = stand_in_dir
+            del model
+
+        cpu_dtypes = [dtype for dtype in args.cpu_dtypes if dtype in usable_cpu_dtypes()]
+        skip_unusable(args.cpu_dtypes, cpu_dtypes)
+        backends = [("cpu", dtype) for dtype in cpu_dtypes]
+        if torch.cuda.is_available():
+            backends.insert(0, ("cuda", None))
+
+        print(f"{'backend':<12} {'export s':>9} {'cold s':>8} {'artifact s':>11} {'verified s':>11}")
+        for backend, dtype in backends:
+            dtype = dtype or "int8"
+            start = time.perf_counter()
+            export_artifact(model_name, artifact_dir, backend=backend, cpu_dtype=dtype)
+            export_seconds = time.perf_counter() - start
+
+            def timed_load(artifacts, verify=False):
+                best = float("inf")
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    model = load_model_with_artifact(model_name, artifacts, verify=verify,
+                                                     backend=backend, cpu_dtype=dtype, cpu_threads=args.threads)
+                    best = min(best, time.perf_counter() - start)
+                    del model
+                return best
+
+            cold = timed_load(None)
+            fast = timed_load(artifact_dir)
+            verified = timed_load(artifact_dir, verify=True)
+            label = backend if backend == "cuda" else f"cpu-{dtype}"
+            print(f"{label:<12} {export_seconds:>9.2f} {cold:>8.2f} {fast:>11.2f} {verified:>11.2f}")
+
+
+# ============================================================
+# Speculative Decoding Benchmark
+# ============================================================
+def bench_speculative(args):
+    """Per-request latency of marking prompts with and without the draft model"""
+    model, tokenizer = build_stand_in_model(hidden_size=512, num_layers=args.target_layers)
+    draft = build_draft_model(model, num_layers=args.draft_layers, agreement=args.agreement)
+    torch.set_num_threads(args.threads)
+
+    prompts = [make_prompt(random.Random(i)) for i in range(args.requests)]
+    baseline = None
+
+    print(f"{'mode':<14} {'p50 ms':>9} {'tok/s':>9} {'accept':>8} {'tok/pass':>9} {'same':>6}")
+    for num_draft in [0] + args.draft_tokens:
+        scheduler = BatchScheduler(model, tokenizer, max_batch_size=1,
+                                   draft_model=draft if num_draft else None,
+                                   num_draft_tokens=max(1, num_draft))
+        # Warm up before timing
+        scheduler.submit(prompts[0], max_new_tokens=8, temperature=0, speculative=True).result()
+
+        latencies, tokens, texts = [], 0, []
+        for prompt in prompts:
+            start = time.perf_counter()
+            result = scheduler.submit(prompt, max_new_tokens=args.max_new_tokens,
+                                      temperature=args.temperature, seed=0, speculative=True).result()
+            latencies.append(time.perf_counter() - start)
+            tokens += result.completion_tokens
+            texts.append(result.text)
+
+        if baseline is None:
+            baseline = texts
+        stats = scheduler.speculative_stats()
+        same = sum(a == b for a, b in zip(texts, baseline))
+        label = f"draft k={num_draft}" if num_draft else "baseline"
+        print(f"{label:<14} {sorted(latencies)[len(latencies) // 2] * 1000:>9.1f} "
+              f"{tokens / sum(latencies):>9.1f} {stats['acceptance_rate']:>8.2f} "
+              f"{stats['tokens_per_target_pass'] or 1.0:>9.2f} {same:>3}/{len(texts)}")
+
+
+# ============================================================
+# Entry Point
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Inference benchmarks against a tiny stand-in model")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batching = sub.add_parser("batching", help="Throughput of the micro-batching scheduler")
+    batching.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    batching.add_argument("--requests", type=int, default=64, help="Total requests per concurrency level")
+    batching.add_argument("--max-batch-size", type=int, default=32)
+    batching.add_argument("--window-ms", type=float, default=10.0)
+    batching.add_argument("--threads", type=int, default=torch.get_num_threads())
+    batching.set_defaults(func=bench_batching)
+
+    ttft = sub.add_parser("ttft", help="Time-to-first-token of streaming vs blocking generation")
+    ttft.add_argument("--requests", type=int, default=20)
+    ttft.add_argument("--max-new-tokens", type=int, default=256)
+    ttft.add_argument("--max-batch-size", type=int, default=8)
+    ttft.set_defaults(func=bench_ttft)
+
+    backends = sub.add_parser("backends", help="Decode tokens/s for each inference backend")
+    backends.add_argument("--model", default=None, help="Model name/path (default: stand-in model)")
+    backends.add_argument("--requests", type=int, default=8)
+    backends.add_argument("--max-new-tokens", type=int, default=64)
+    backends.add_argument("--threads", type=int, default=None)
+    backends.add_argument("--compile", action="store_true", help="Also measure torch.compile'd forward")
+    backends.set_defaults(func=bench_backends)
+
+    restart = sub.add_parser("restart", help="Model load time with and without a pre-quantized artifact")
+    restart.add_argument("--model", default=None, help="Model name/path (default: stand-in model)")
+    restart.add_argument("--cpu-dtypes", nargs="+", choices=CPU_DTYPES, default=["int8", "bf16"])
+    restart.add_argument("--hidden-size", type=int, default=1024)
+    restart.add_argument("--num-layers", type=int, default=12)
+    restart.add_argument("--repeats", type=int, default=3)
+    restart.add_argument("--threads", type=int, default=None)
+    restart.set_defaults(func=bench_restart)
+
+    speculative = sub.add_parser("speculative", help="Latency with and without a draft model")
+    speculative.add_argument("--requests", type=int, default=12)
+    speculative.add_argument("--max-new-tokens", type=int, default=128)
+    speculative.add_argument("--draft-tokens", type=int, nargs="+", default=[2, 4, 8])
+    speculative.add_argument("--target-layers", type=int, default=12)
+    speculative.add_argument("--draft-layers", type=int, default=2)
+    speculative.add_argument("--agreement", type=float, default=0.98,
+                             help="How closely the stand-in draft tracks the target (0-1)")
+    speculative.add_argument("--temperature", type=float, default=0.0)
+    speculative.add_argument("--threads", type=int, default=torch.get_num_threads())
+    speculative.set_defaults(func=bench_speculative)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
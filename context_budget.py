@@ -0,0 +1,148 @@
+from functools import lru_cache
+from typing import List, Tuple, Union
+
+TRUNCATION_MARKER = "\n[...truncated]"
+
+# A context is either one string (paragraphs are kept in order, the tail is dropped first)
+# or a list of sections: plain strings or {"text": ..., "priority": int}, lower priority
+# numbers are kept first and equal priorities keep their original order.
+Context = Union[str, List[Union[str, dict]]]
+
+
+# ============================================================
+# Context Sections
+# ============================================================
+def context_sections(context: Context) -> List[Tuple[int, str]]:
+    """(priority, text) for every non-empty section, in prompt order"""
+    if not context:
+        return []
+
+    if isinstance(context, str):
+        return [(0, part.strip()) for part in context.split("\n\n") if part.strip()]
+
+    sections = []
+    for section in context:
+        if isinstance(section, str):
+            priority, text = 0, section
+        elif isinstance(section, dict) and isinstance(section.get("text"), str):
+            try:
+                priority, text = int(section.get("priority", 0)), section["text"]
+            except (TypeError, ValueError):
+                raise ValueError("context section priority must be an integer")
+        else:
+            raise ValueError("context sections must be strings or objects with a 'text' field")
+        if text.strip():
+            sections.append((priority, text.strip()))
+    return sections
+
+
+def render_context(context: Context) -> str:
+    """The CONTEXT block text as it appears in the prompt when nothing has to be dropped;
+    a plain string is used verbatim"""
+    if isinstance(context, str):
+        return context if context.strip() else ""
+    return "\n\n".join(text for _, text in context_sections(context))
+
+
+# ============================================================
+# Budgeting
+# ============================================================
+class ContextBudget:
+    """Fits system prompt + CONTEXT + user prompt into an input token budget.
+
+    Token counts of recurring strings (system prompts and context sections that are
+    re-sent on every call) are memoised; assembled prompts are unique per request and
+    are counted directly instead of filling the cache.
+    """
+
+    def __init__(self, tokenizer, max_input_tokens: int, cache_size: int = 2048):
+        self.tokenizer = tokenizer
+        self.max_input_tokens = max_input_tokens
+        self.count_tokens = lru_cache(maxsize=cache_size)(self._count_tokens)
+
+    def _count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def fit(self, build_prompt, system_prompt: str, user_prompt: str, context: Context = "",
+            max_new_tokens: int = 0):
+        """(context text that fits, truncation report).
+
+        build_prompt(system_prompt, user_prompt, context) renders the final prompt. Only the
+        CONTEXT block is trimmed; a system + user prompt that alone exceeds the budget is
+        sent as is and flagged with over_budget.
+        """
+        sections = context_sections(context)
+        budget = self.limit(max_new_tokens)
+        full_context = render_context(context)
+        prompt_tokens = self._count_tokens(build_prompt(system_prompt, user_prompt, full_context))
+
+        report = {
+            "input_budget": budget,
+            "prompt_tokens": prompt_tokens,
+            "truncated": False,
+            "over_budget": False,
+            "context_tokens_dropped": 0,
+            "sections_dropped": 0,
+            "sections_truncated": 0
+        }
+        if prompt_tokens <= budget:
+            return full_context, report
+
+        # Everything except the CONTEXT block has to fit; what is left goes to the sections
+        base_tokens = self._count_tokens(build_prompt(system_prompt, user_prompt, ""))
+        context_tokens = prompt_tokens - base_tokens
+        available = budget - base_tokens - self.count_tokens("CONTEXT:\n\n\n")
+
+        kept = {}
+        for index in sorted(range(len(sections)), key=lambda i: sections[i][0]):
+            text = sections[index][1]
+            tokens = self.count_tokens(text) + 1
+            if tokens <= available:
+                kept[index] = text
+                available -= tokens
+            elif available > self.count_tokens(TRUNCATION_MARKER) + 8:
+                kept[index] = self.truncate(text, available - self.count_tokens(TRUNCATION_MARKER) - 1)
+                available = 0
+                report["sections_truncated"] += 1
+            else:
+                report["sections_dropped"] += 1
+
+        fitted = "\n\n".join(kept[i] for i in sorted(kept))
+        # Per-section counts don't add up exactly at the joins; shave off any remainder
+        overflow = self._count_tokens(build_prompt(system_prompt, user_prompt, fitted)) - budget
+        if overflow > 0 and fitted:
+            keep = self._count_tokens(fitted) - overflow - self.count_tokens(TRUNCATION_MARKER)
+            fitted = self.truncate(fitted, keep)
+            report["sections_truncated"] = max(report["sections_truncated"], 1)
+
+        report["prompt_tokens"] = self._count_tokens(build_prompt(system_prompt, user_prompt, fitted))
+        report["truncated"] = True
+        report["over_budget"] = report["prompt_tokens"] > budget
+        report["context_tokens_dropped"] = max(0, context_tokens - (report["prompt_tokens"] - base_tokens))
+        return fitted, report
+
+    def limit(self, max_new_tokens: int = 0) -> int:
+        """Input budget, leaving room for the answer inside the model's context window"""
+        model_max = getattr(self.tokenizer, "model_max_length", None)
+        # Tokenizers without a configured window report a huge sentinel value
+        if model_max and model_max < 10 ** 7:
+            return max(0, min(self.max_input_tokens, model_max - max_new_tokens))
+        return self.max_input_tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the first max_tokens tokens of text and mark the cut"""
+        if max_tokens <= 0:
+            return ""
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= max_tokens:
+            return text
+        return self.tokenizer.decode(ids[:max_tokens]).rstrip() + TRUNCATION_MARKER
+
+    def stats(self) -> dict:
+        info = self.count_tokens.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "max_input_tokens": self.max_input_tokens,
+            "token_count_cache_entries": info.currsize,
+            "token_count_cache_hit_rate": info.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from pgvector.psycopg2 import register_vector
+
+DB_CONFIG = {
+    "host": os.environ.get("DB_HOST", "localhost"),
+    "database": os.environ.get("DB_NAME", "vce_learning_platform"),
+    "user": os.environ.get("DB_USER", "postgres"),
+    "password": os.environ.get("DB_PASSWORD", "postgres1234"),
+    "port": int(os.environ.get("DB_PORT", 5432))
+}
+
+# Connections kept open / allowed at once, per process
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+# How long a caller waits for a free connection before giving up
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get("DB_POOL_ACQUIRE_TIMEOUT", 10))
+# Connections idle for longer than this are pinged before being handed out
+POOL_CHECK_AFTER = float(os.environ.get("DB_POOL_CHECK_AFTER", 30))
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+# ============================================================
+# Connection Pool
+# ============================================================
+class ConnectionPool:
+    def __init__(self, db_config: dict = None, min_size: int = POOL_MIN_SIZE, max_size: int = POOL_MAX_SIZE,
+                 acquire_timeout: float = POOL_ACQUIRE_TIMEOUT, check_after: float = POOL_CHECK_AFTER):
+        """Thread-safe pool of PostgreSQL connections with pgvector registered on each.
+
+        When every connection is in use, callers wait up to acquire_timeout for one
+        to be returned (psycopg2's pool would raise straight away). Connections that
+        sat idle for more than check_after seconds are pinged first, and broken ones
+        are replaced, so a database restart costs one retry rather than an error.
+        """
+        self.db_config = db_config or DB_CONFIG
+        self.min_size = min_size
+        self.max_size = max(1, max_size)
+        self.acquire_timeout = acquire_timeout
+        self.check_after = check_after
+
+        # Opened on first checkout, so creating (and caching) a pool works while the database is down
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+        # id(connection) -> last time it was returned to the pool
+        self._last_used = {}
+        self._vector_ready = set()
+
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.replaced = 0
+        self.in_use = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @contextmanager
+    def connection(self):
+        """A connection for the duration of the block; committed on success, rolled back on error"""
+        conn = self._acquire()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            raise
+        finally:
+            self._release(conn, broken or conn.closed != 0)
+
+    @contextmanager
+    def cursor(self):
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                yield cur
+
+    def register_vector(self, conn) -> bool:
+        """Register the pgvector type on a connection once; False until the extension exists"""
+        if id(conn) in self._vector_ready:
+            return True
+        try:
+            register_vector(conn)
+        except psycopg2.ProgrammingError:
+            conn.rollback()
+            return False
+        with self._lock:
+            self._vector_ready.add(id(conn))
+        return True
+
+    def _acquire(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeoutError(f"No database connection became free within {self.acquire_timeout:g}s")
+        wait = time.perf_counter() - start
+
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.acquisitions += 1
+            self.in_use += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return conn
+
+    def _checkout(self):
+        """A live connection from the pool, replacing one that turns out to be broken"""
+        conn = self._connections().getconn()
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
+        if conn.closed or (last_used is not None and time.monotonic() - last_used > self.check_after
+                           and not _ping(conn)):
+            self._discard(conn)
+            with self._lock:
+                self.replaced += 1
+            conn = self._connections().getconn()
+        self.register_vector(conn)
+        return conn
+
+    def _connections(self) -> ThreadedConnectionPool:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(self.min_size, self.max_size, **self.db_config)
+            return self._pool
+
+    def _release(self, conn, broken: bool):
+        if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            # Left mid-transaction (e.g. a generator abandoned inside the block)
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken:
+            self._discard(conn)
+        else:
+            with self._lock:
+                self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn)
+        with self._lock:
+            self.in_use -= 1
+        self._slots.release()
+
+    def _discard(self, conn):
+        with self._lock:
+            self._last_used.pop(id(conn), None)
+            self._vector_ready.discard(id(conn))
+        self._pool.putconn(conn, close=True)
+
+    def health_check(self) -> dict:
+        """Round trip to the database through the pool"""
+        start = time.perf_counter()
+        try:
+            with self.cursor() as cur:
+                cur.execute("SELECT 1;")
+                cur.fetchone()
+        except (psycopg2.Error, PoolTimeoutError) as e:
+            return {"ok": False, "error": str(e), "latency_ms": (time.perf_counter() - start) * 1000}
+        return {"ok": True, "error": None, "latency_ms": (time.perf_counter() - start) * 1000}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "replaced": self.replaced,
+                "avg_wait_ms": self.total_wait / self.acquisitions * 1000 if self.acquisitions else 0.0,
+                "max_wait_ms": self.max_wait * 1000
+            }
+
+    @property
+    def closed(self) -> bool:
+        return self._pool is not None and self._pool.closed
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+
+
+def _ping(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+# ============================================================
+# Shared Pool
+# ============================================================
+_shared_pool: Optional[ConnectionPool] = None
+_shared_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """The process-wide pool, created on first use"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None or _shared_pool.closed:
+            _shared_pool = ConnectionPool()
+        return _shared_pool
+
+
+@contextmanager
+def connection():
+    """Shorthand for get_pool().connection()"""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+@contextmanager
+def cursor():
+    """Shorthand for get_pool().cursor()"""
+    with get_pool().cursor() as cur:
+        yield cur
@@ -0,0 +1,128 @@
+import hashlib
+from contextlib import contextmanager
+from typing import Optional
+
+import db
+from prompts import MARKING_PROMPTS, MARKING_SYSTEM_PROMPTS
+
+CREATE_EXPLANATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS question_explanations (
+    explanation_id SERIAL PRIMARY KEY,
+    question_id VARCHAR(100) NOT NULL REFERENCES questions(question_id) ON DELETE CASCADE,
+    prompt_version VARCHAR(64) NOT NULL,
+    model VARCHAR(200) NOT NULL,
+    source_hash VARCHAR(32) NOT NULL,
+    explanation TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (question_id, prompt_version, model)
+);
+
+CREATE INDEX IF NOT EXISTS idx_question_explanations_question ON question_explanations(question_id);
+"""
+
+# Hash of the question fields the baseline prompt uses; must match source_hash() below
+SOURCE_HASH_SQL = "md5(coalesce(q.question_text, '') || E'\\n---\\n' || coalesce(q.detailed_answer, ''))"
+
+
+def prompt_version() -> str:
+    """Identifies the baseline prompt; editing it makes every stored explanation stale"""
+    prompt = MARKING_SYSTEM_PROMPTS["baseline_explanation"] + "\0" + MARKING_PROMPTS["baseline_explanation"]
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def source_hash(question_text: str, detailed_answer: str) -> str:
+    """Same value as SOURCE_HASH_SQL for a question row"""
+    text = (question_text or "") + "\n---\n" + (detailed_answer or "")
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def baseline_prompt(question_text: str, detailed_answer: str) -> str:
+    return MARKING_PROMPTS["baseline_explanation"].format(
+        question_text=question_text,
+        detailed_answer=detailed_answer
+    )
+
+
+class ExplanationStore:
+    def __init__(self, pool: db.ConnectionPool = None):
+        """Baseline explanations per question, versioned by prompt and model.
+
+        A stored explanation is only served while the prompt is unchanged and the
+        question's text and answer still hash to what it was generated from.
+        """
+        self._pool = pool
+        self.version = prompt_version()
+        self._schema_ready = False
+
+    @property
+    def pool(self) -> db.ConnectionPool:
+        return self._pool or db.get_pool()
+
+    @contextmanager
+    def _cursor(self):
+        with self.pool.connection() as conn:
+            if not self._schema_ready:
+                with conn.cursor() as cur:
+                    cur.execute(CREATE_EXPLANATIONS_SQL)
+                conn.commit()
+                self._schema_ready = True
+            with conn.cursor() as cur:
+                yield cur
+
+    def get(self, question_id: str) -> Optional[str]:
+        """Current baseline explanation of a question (newest model first), or None.
+
+        Database errors count as "not stored", so the caller falls back to generating.
+        """
+        try:
+            with self._cursor() as cur:
+                cur.execute(f"""
+                    SELECT x.explanation
+                    FROM question_explanations x
+                    JOIN questions q ON q.question_id = x.question_id
+                    WHERE x.question_id = %s
+                      AND x.prompt_version = %s
+                      AND x.source_hash = {SOURCE_HASH_SQL}
+                    ORDER BY x.created_at DESC
+                    LIMIT 1;
+                """, (question_id, self.version))
+                row = cur.fetchone()
+        except Exception as e:
+            print(f"⚠️  Explanation lookup failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def stale_questions(self, model: str, limit: Optional[int] = None) -> list:
+        """Questions with no explanation for this prompt and model, or whose text changed since"""
+        with self._cursor() as cur:
+            cur.execute(f"""
+                SELECT q.question_id, q.question_text, q.detailed_answer
+                FROM questions q
+                LEFT JOIN question_explanations x
+                    ON x.question_id = q.question_id
+                   AND x.prompt_version = %s
+                   AND x.model = %s
+                   AND x.source_hash = {SOURCE_HASH_SQL}
+                WHERE x.explanation_id IS NULL
+                ORDER BY q.question_id
+                LIMIT %s;
+            """, (self.version, model, limit))
+            rows = cur.fetchall()
+
+        return [
+            {"question_id": r[0], "question_text": r[1], "detailed_answer": r[2]}
+            for r in rows
+        ]
+
+    def save(self, question_id: str, model: str, source: str, explanation: str):
+        """Store (or replace) the explanation of a question for the current prompt and this model"""
+        with self._cursor() as cur:
+            cur.execute("""
+                INSERT INTO question_explanations
+                    (question_id, prompt_version, model, source_hash, explanation)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (question_id, prompt_version, model) DO UPDATE
+                SET source_hash = EXCLUDED.source_hash,
+                    explanation = EXCLUDED.explanation,
+                    created_at = CURRENT_TIMESTAMP;
+            """, (question_id, self.version, model, source, explanation))
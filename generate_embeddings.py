@@ -4,18 +4,11 @@ import psycopg2
 from psycopg2.extras import execute_batch
 from nomic import embed
 
+from db import DB_CONFIG
+
 # --- Provide your API key ---
 os.environ["NOMIC_API_KEY"] = ""
 
-# --- PostgreSQL config ---
-DB_CONFIG = {
-    "host": "localhost",
-    "database": "vce_learning_platform",
-    "user": "postgres",
-    "password": "postgres1234",
-    "port": 5432
-}
-
 def main():
     conn = psycopg2.connect(**DB_CONFIG)
     cur = conn.cursor()
@@ -0,0 +1,265 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Base of the Granite API routes (/generate, /generate/stream, ...) behind the proxy
+DEFAULT_BASE_URL = os.environ.get("GRANITE_API_URL", "https://nab6wk9x0oev1u-8888.proxy.runpod.net/api/granite")
+
+# Responses that mean the request was never run, so sending it again is safe
+RETRYABLE_STATUS = {429, 502, 503}
+
+
+# ============================================================
+# Errors
+# ============================================================
+class GraniteError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        """A failed call to the Granite API; status is the HTTP status if the server answered"""
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(GraniteError):
+    pass
+
+
+# ============================================================
+# Circuit Breaker
+# ============================================================
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Fail fast after `failure_threshold` consecutive server failures.
+
+        Once open, calls are rejected until `reset_timeout` seconds have passed; then a
+        single trial call is let through and its outcome closes or re-opens the circuit.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+# ============================================================
+# Client
+# ============================================================
+class GraniteClient:
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, timeout: float = 300, max_retries: int = 2,
+                 backoff: float = 0.5, max_backoff: float = 8.0, pool_size: int = 10,
+                 breaker: Optional[CircuitBreaker] = None):
+        """Keep-alive HTTP client for the Granite API; safe to share between threads.
+
+        Requests that the server never ran (connection refused, 429, 502, 503) are
+        retried up to max_retries times with jittered exponential backoff. Timeouts
+        and other errors are not retried, since the generation may still be running.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def complete(self, user_prompt: str, system_prompt: str = "You are a math reasoning assistant.",
+                 context="", priority: str = "default", timeout: Optional[float] = None, **params) -> dict:
+        """The /generate response body; `params` are extra request fields (max_new_tokens, stop, ...)"""
+        timeout = timeout or self.timeout
+        payload = self._payload(user_prompt, system_prompt, context, priority, timeout, params)
+        return self.post("/generate", payload, timeout=timeout).json()
+
+    def generate(self, user_prompt: str, system_prompt: str = "You are a math reasoning assistant.",
+                 context="", priority: str = "default", timeout: Optional[float] = None, **params) -> str:
+        """Just the generated text"""
+        body = self.complete(user_prompt, system_prompt, context, priority=priority, timeout=timeout, **params)
+        if "output" not in body:
+            raise GraniteError("No output found in response.")
+        return body["output"]
+
+    def stream(self, user_prompt: str, system_prompt: str = "You are a math reasoning assistant.",
+               context="", priority: str = "default", timeout: Optional[float] = None, **params) -> Iterator[str]:
+        """Text deltas from /generate/stream as they are decoded.
+
+        Closing the iterator early closes the connection, which cancels the generation
+        on the server. `timeout` applies to the gaps between chunks, not the whole answer.
+        """
+        timeout = timeout or self.timeout
+        payload = self._payload(user_prompt, system_prompt, context, priority, timeout, params)
+        response = self.post("/generate/stream", payload, timeout=timeout, stream=True)
+
+        with response:
+            event = None
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        data = json.loads(line[len("data:"):])
+                        if event == "error":
+                            raise GraniteError(data.get("error") or "Generation failed.")
+                        if event == "done":
+                            return
+                        if data.get("token"):
+                            yield data["token"]
+                    elif not line:
+                        event = None
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                raise GraniteError("The connection to the AI model server was lost.") from e
+        raise GraniteError("The response stream ended before the answer was complete.")
+
+    def stats(self, timeout: float = 10) -> dict:
+        """The server's /stats body (model name, queue and cache statistics)"""
+        try:
+            response = self.session.get(f"{self.base_url}/stats", timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            raise GraniteError("Cannot connect to the AI model server.") from e
+        if response.status_code != 200:
+            raise GraniteError(_error_message(response, None), status=response.status_code)
+        return response.json()
+
+    def post(self, path: str, payload: dict, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """POST with retries and the circuit breaker; returns the 200 response or raises GraniteError"""
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    "The AI model server is unavailable. Please try again shortly.",
+                    retry_after=self.breaker.retry_after()
+                )
+
+            try:
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                # Includes connect timeouts: the request never reached the server
+                self.breaker.record_failure()
+                if self._retry(attempt, None):
+                    attempt += 1
+                    continue
+                raise GraniteError("Cannot connect to the AI model server.") from e
+            except requests.exceptions.Timeout as e:
+                self.breaker.record_failure()
+                raise GraniteError("Request timed out. The model may be overloaded.") from e
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                raise GraniteError(f"Request failed: {e}") from e
+
+            if response.status_code == 200:
+                self.breaker.record_success()
+                return response
+
+            retry_after = _retry_after(response)
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                # A 4xx is an answer from a healthy server
+                self.breaker.record_success()
+
+            if response.status_code in RETRYABLE_STATUS and self._retry(attempt, retry_after):
+                attempt += 1
+                continue
+            raise GraniteError(_error_message(response, retry_after), status=response.status_code,
+                               retry_after=retry_after)
+
+    def _payload(self, user_prompt: str, system_prompt: str, context, priority: str, timeout: float,
+                 params: dict) -> dict:
+        return {
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "context": context,
+            "priority": priority,
+            # Let the server drop the work once we've stopped waiting for it
+            "timeout_s": timeout,
+            **params
+        }
+
+    def _retry(self, attempt: int, retry_after: Optional[float]) -> bool:
+        """Sleep before the next attempt; False when the retry budget is used up"""
+        if attempt >= self.max_retries:
+            return False
+        # Full jitter keeps clients that failed together from retrying in lockstep
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        if retry_after is not None:
+            if retry_after > self.max_backoff:
+                return False
+            delay = max(delay, retry_after)
+        time.sleep(delay)
+        return True
+
+    def close(self):
+        self.session.close()
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _error_message(response: requests.Response, retry_after: Optional[float]) -> str:
+    if response.status_code == 429:
+        wait = f"{retry_after:g}" if retry_after is not None else "a few"
+        return f"The AI model is busy right now. Please try again in {wait} seconds."
+    if response.status_code == 503:
+        return "The AI model is still starting up. Please try again in a minute."
+    try:
+        detail = response.json().get("error")
+    except ValueError:
+        detail = None
+    return f"Non-200 response: {response.status_code}" + (f" ({detail})" if detail else "")
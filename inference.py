@@ -0,0 +1,1118 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+from typing import AsyncIterator, Iterator, List, Optional
+
+import torch
+from transformers import DynamicCache
+
+from structured_output import TokenConstraint, compile_schema, token_texts
+
+
+# Lower value is served first
+PRIORITY_CLASSES = {
+    "interactive": 0,
+    "default": 1,
+    "batch": 2
+}
+
+
+# ============================================================
+# Errors
+# ============================================================
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Request queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    pass
+
+
+# ============================================================
+# Request / Result Objects
+# ============================================================
+class GenerationRequest:
+    def __init__(self, prompt: str, max_new_tokens: int = 256,
+                 temperature: float = 0.2, top_p: float = 0.9, stream: bool = False,
+                 prefix: str = "", seed: Optional[int] = None,
+                 priority: str = "default", timeout_s: Optional[float] = None,
+                 speculative: bool = False, stop: Optional[List[str]] = None,
+                 json_schema: Optional[dict] = None):
+        """A single prompt waiting to be decoded as part of a batch"""
+        self.prompt = prompt
+        # Leading part of `prompt` that is shared across requests (e.g. the system prompt)
+        self.prefix = prefix
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        # A seed gives this request its own RNG so its samples don't depend on batch mates
+        self.seed = seed
+        self.generator = None
+        # Decode with draft-model speculation (if the scheduler has a draft model)
+        self.speculative = speculative
+        self.draft_tokens = 0
+        self.accepted_draft_tokens = 0
+        # Generation ends as soon as the output contains one of these strings (which is cut off)
+        self.stop = [s for s in (stop or []) if s]
+        self.stop_sequence = None
+        # Output is constrained to a JSON object matching this schema (see structured_output.py)
+        self.json_schema = json_schema
+        self.constraint = None
+        self.grammar_state = None
+        self.priority = PRIORITY_CLASSES[priority]
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+        # Past this point the client has given up, so the work is dropped
+        self.deadline = self.enqueued_at + timeout_s if timeout_s else None
+        self.dequeued_at = None
+        self.prefill_done_at = None
+        self.prefill_ms = None
+        self.first_token_at = None
+        self.cancelled = threading.Event()
+        # Text deltas for streaming callers (anything with put()); None marks the end of the stream
+        if stream is True:
+            stream = queue.Queue()
+        self.stream = stream or None
+        self.streamed_text = ""
+
+    def cancel(self):
+        """Stop decoding this request at the next step (e.g. the client went away)"""
+        self.cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        # Cancelling the future (e.g. via asyncio.wrap_future) counts as well
+        return self.cancelled.is_set() or self.future.cancelled()
+
+    def expired(self, now: float) -> bool:
+        return self.deadline is not None and now > self.deadline
+
+
+class GenerationResult:
+    def __init__(self, text: str, prompt_tokens: int, completion_tokens: int,
+                 finish_reason: str, batch_size: int, ttft_ms: Optional[float] = None,
+                 queue_wait_ms: Optional[float] = None, draft_tokens: int = 0,
+                 accepted_draft_tokens: int = 0, prefill_ms: Optional[float] = None,
+                 decode_ms: Optional[float] = None, total_ms: Optional[float] = None,
+                 stop_sequence: Optional[str] = None, tokens_saved: int = 0,
+                 schema_valid: Optional[bool] = None):
+        """Decoded output for one request plus a few bookkeeping numbers"""
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.finish_reason = finish_reason
+        self.batch_size = batch_size
+        self.ttft_ms = ttft_ms
+        self.queue_wait_ms = queue_wait_ms
+        # Prefill of the whole batch the request was part of, then its own decode loop
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.total_ms = total_ms
+        # Speculative decoding only: tokens proposed by the draft model / accepted by the target
+        self.draft_tokens = draft_tokens
+        self.accepted_draft_tokens = accepted_draft_tokens
+        # Stop sequence that ended generation, and the max_new_tokens budget left unused because of it
+        self.stop_sequence = stop_sequence
+        self.tokens_saved = tokens_saved
+        # json_schema requests only: whether the output is a complete object of the schema
+        self.schema_valid = schema_valid
+
+
+class TokenStream:
+    def __init__(self, req: GenerationRequest):
+        """Iterate over text deltas of a streaming request as they are decoded"""
+        self._req = req
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            delta = self._req.stream.get()
+            if delta is None:
+                return
+            yield delta
+
+    def cancel(self):
+        self._req.cancel()
+
+    def result(self, timeout: Optional[float] = None) -> GenerationResult:
+        """Final result once the stream is exhausted (raises if generation failed)"""
+        return self._req.future.result(timeout=timeout)
+
+
+class _LoopQueue:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        """Thread-safe put() from the inference worker into an asyncio.Queue"""
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+
+class AsyncTokenStream:
+    def __init__(self, req: GenerationRequest):
+        """Async counterpart of TokenStream for use on an event loop"""
+        self._req = req
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            delta = await self._req.stream.queue.get()
+            if delta is None:
+                return
+            yield delta
+
+    def cancel(self):
+        self._req.cancel()
+
+    async def result(self) -> GenerationResult:
+        return await asyncio.wrap_future(self._req.future)
+
+
+# ============================================================
+# Prefix KV Cache
+# ============================================================
+class PrefixCache:
+    def __init__(self, max_bytes: int):
+        """LRU store of past_key_values for recurring token prefixes, capped by tensor memory"""
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # token tuple -> (layers, nbytes)
+        self._lock = threading.Lock()
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tokens_reused = 0
+
+    def lookup(self, tokens: tuple):
+        """Return (layers, n) for the cached entry sharing the longest common prefix with `tokens`.
+
+        Keys and values at position i only depend on tokens[:i + 1], so a
+        partially matching entry is still usable once cropped to n tokens.
+        """
+        best_key, best_len = None, 0
+        with self._lock:
+            for key in self._entries:
+                n = _common_prefix_len(key, tokens)
+                if n > best_len:
+                    best_key, best_len = key, n
+            if best_key is None:
+                return None, 0
+            self._entries.move_to_end(best_key)
+            layers = self._entries[best_key][0]
+
+        if best_len < len(best_key):
+            layers = [(k[:, :, :best_len], v[:, :, :best_len]) for k, v in layers]
+        return layers, best_len
+
+    def put(self, tokens: tuple, layers):
+        nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in layers)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if tokens in self._entries:
+                self.bytes_used -= self._entries.pop(tokens)[1]
+            self._entries[tokens] = (layers, nbytes)
+            self.bytes_used += nbytes
+            while self.bytes_used > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes_used -= evicted
+                self.evictions += 1
+
+    def record(self, hit: bool, tokens_reused: int):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.tokens_reused += tokens_reused
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "prefill_tokens_saved": self.tokens_reused
+            }
+
+
+# ============================================================
+# Response Cache
+# ============================================================
+class ResponseCache:
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400,
+                 path: Optional[str] = None):
+        """LRU + TTL cache of finished responses, optionally persisted to a JSON file"""
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._entries = OrderedDict()  # key -> (stored_at, response dict)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path and os.path.exists(path):
+            self._load()
+
+    @staticmethod
+    def make_key(system_prompt: str, user_prompt: str, context: str, **params) -> str:
+        """Hash of the whitespace-normalised prompt triple and the sampling params"""
+        payload = json.dumps({
+            "system_prompt": _normalise(system_prompt),
+            "user_prompt": _normalise(user_prompt),
+            "context": _normalise(context),
+            "params": params
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, key: str, response: dict):
+        with self._lock:
+            self._entries[key] = (time.time(), dict(response))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if self.path:
+                self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring unreadable response cache {self.path}: {e}")
+            return
+
+        now = time.time()
+        for key, stored_at, response in stored:
+            if now - stored_at <= self.ttl_seconds:
+                self._entries[key] = (stored_at, response)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        """Write atomically so a crash mid-write never leaves a truncated file"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([[key, stored_at, response] for key, (stored_at, response) in self._entries.items()], f)
+        os.replace(tmp_path, self.path)
+
+
+# ============================================================
+# Batch Scheduler
+# ============================================================
+class BatchScheduler:
+    def __init__(self, model, tokenizer, max_batch_size: int = 8,
+                 batch_window_ms: float = 10.0, prefix_cache: Optional[PrefixCache] = None,
+                 max_queue_size: int = 0, draft_model=None, num_draft_tokens: int = 4):
+        """Collect concurrent requests and decode them together on one worker thread.
+
+        max_queue_size bounds the number of waiting requests (0 = unbounded);
+        beyond it submit() raises QueueFullError instead of queueing.
+
+        draft_model is a small causal LM sharing the tokenizer; requests submitted
+        with speculative=True are decoded one at a time, with the draft proposing
+        num_draft_tokens tokens per step for the model to verify in one pass.
+        Requests with a json_schema always take the regular batched path.
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = max(0.0, batch_window_ms) / 1000.0
+        self.prefix_cache = prefix_cache
+        self.max_queue_size = max_queue_size
+        self.draft_model = draft_model
+        self.num_draft_tokens = max(1, num_draft_tokens)
+        # Decoded vocabulary and per-schema token masks, built on first use by the worker
+        self._token_texts = None
+        self._constraints = OrderedDict()
+
+        eos = model.generation_config.eos_token_id
+        if eos is None:
+            eos = tokenizer.eos_token_id
+        self.eos_token_ids = set(eos if isinstance(eos, (list, tuple)) else [eos])
+        self.pad_token_id = tokenizer.pad_token_id
+        if self.pad_token_id is None:
+            self.pad_token_id = next(iter(self.eos_token_ids))
+
+        # Priority queue of (priority, arrival order, request)
+        self._heap = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+        self._stats_lock = threading.Lock()
+        self.rejected = 0
+        self.expired = 0
+        self.served = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.avg_batch_seconds = 0.0
+        self.speculative_requests = 0
+        self.target_passes = 0
+        self.draft_tokens = 0
+        self.accepted_draft_tokens = 0
+
+        self._worker = threading.Thread(target=self._run, name="granite-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt: str, **params) -> Future:
+        """Queue a prompt; the returned future resolves to a GenerationResult.
+
+        `params` are passed through to GenerationRequest (max_new_tokens,
+        temperature, top_p, prefix, seed, priority, timeout_s, speculative, stop,
+        json_schema).
+        """
+        req = GenerationRequest(prompt, **params)
+        self._enqueue(req)
+        return req.future
+
+    def stream(self, prompt: str, **params) -> TokenStream:
+        """Queue a prompt and get its text back incrementally"""
+        req = GenerationRequest(prompt, stream=True, **params)
+        self._enqueue(req)
+        return TokenStream(req)
+
+    def stream_async(self, prompt: str, **params) -> AsyncTokenStream:
+        """Like stream(), but deltas are delivered to the calling event loop"""
+        req = GenerationRequest(prompt, stream=_LoopQueue(asyncio.get_running_loop()), **params)
+        self._enqueue(req)
+        return AsyncTokenStream(req)
+
+    def is_alive(self) -> bool:
+        return self._worker.is_alive()
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def stats(self) -> dict:
+        with self._cond:
+            by_priority = {name: 0 for name in PRIORITY_CLASSES}
+            names = {value: name for name, value in PRIORITY_CLASSES.items()}
+            for priority, _, _ in self._heap:
+                by_priority[names[priority]] += 1
+            depth = len(self._heap)
+
+        with self._stats_lock:
+            return {
+                "depth": depth,
+                "depth_by_priority": by_priority,
+                "max_queue_size": self.max_queue_size,
+                "served": self.served,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "avg_wait_ms": self.total_wait / self.served * 1000 if self.served else 0.0,
+                "max_wait_ms": self.max_wait * 1000
+            }
+
+    def speculative_stats(self) -> dict:
+        with self._stats_lock:
+            emitted = self.accepted_draft_tokens + self.target_passes
+            return {
+                "enabled": self.draft_model is not None,
+                "num_draft_tokens": self.num_draft_tokens,
+                "requests": self.speculative_requests,
+                "draft_tokens": self.draft_tokens,
+                "accepted_draft_tokens": self.accepted_draft_tokens,
+                "acceptance_rate": self.accepted_draft_tokens / self.draft_tokens if self.draft_tokens else 0.0,
+                # Tokens produced per forward pass of the large model (1.0 without speculation)
+                "tokens_per_target_pass": emitted / self.target_passes if self.target_passes else 0.0
+            }
+
+    def _enqueue(self, req: GenerationRequest):
+        with self._cond:
+            if self.max_queue_size and len(self._heap) >= self.max_queue_size:
+                with self._stats_lock:
+                    self.rejected += 1
+                raise QueueFullError(self._retry_after(len(self._heap)))
+            heapq.heappush(self._heap, (req.priority, next(self._sequence), req))
+            self._cond.notify()
+
+    def _retry_after(self, depth: int) -> int:
+        """Rough seconds until the current backlog drains"""
+        batches_ahead = math.ceil(depth / self.max_batch_size)
+        return max(1, math.ceil(batches_ahead * self.avg_batch_seconds))
+
+    def _collect_batch(self) -> List[GenerationRequest]:
+        """Block for one request, then keep gathering until the window closes or the batch is full.
+
+        Higher priority classes are always taken first.
+        """
+        with self._cond:
+            while not self._heap:
+                self._cond.wait()
+            batch = [heapq.heappop(self._heap)[2]]
+            deadline = time.perf_counter() + self.batch_window
+
+            while len(batch) < self.max_batch_size:
+                if self._heap:
+                    batch.append(heapq.heappop(self._heap)[2])
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+        # Requests abandoned or timed out while queued never reach the model
+        now = time.perf_counter()
+        live = []
+        for req in batch:
+            req.dequeued_at = now
+            if req.is_cancelled():
+                self._finish(req, [], 0, "cancelled", 0)
+            elif req.expired(now):
+                self._fail(req, DeadlineExceededError("Request deadline passed while queued"))
+                with self._stats_lock:
+                    self.expired += 1
+            else:
+                live.append(req)
+
+        with self._stats_lock:
+            for req in live:
+                wait = now - req.enqueued_at
+                self.served += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+        return live
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            speculative = [r for r in batch if r.speculative and r.json_schema is None and self.draft_model is not None]
+            regular = [r for r in batch if r not in speculative]
+            # Speculative requests decode one at a time, so an error only fails the request it came from
+            if regular:
+                try:
+                    self._generate(regular)
+                except Exception as e:
+                    self._fail_unfinished(regular, e)
+            for req in speculative:
+                try:
+                    self._generate_speculative(req)
+                except Exception as e:
+                    self._fail_unfinished([req], e)
+            elapsed = time.perf_counter() - start
+            self.avg_batch_seconds = 0.8 * self.avg_batch_seconds + 0.2 * elapsed if self.avg_batch_seconds else elapsed
+
+    # --------------------------------------------------------
+    # Decoding
+    # --------------------------------------------------------
+    @torch.no_grad()
+    def _generate(self, batch: List[GenerationRequest]):
+        """Left-pad the batch, prefill once, then decode step by step.
+
+        Rows are dropped from the batch (and their KV cache rows discarded) as
+        soon as they hit EOS, one of their stop sequences, their own
+        max_new_tokens, complete their json_schema, are cancelled or miss their
+        deadline, and the caller's future is resolved right away.
+        """
+        device = self.model.device
+        encoded = [self.tokenizer(r.prompt)["input_ids"] for r in batch]
+        for req in batch:
+            if req.json_schema is not None:
+                req.constraint = self._constraint(req.json_schema)
+                req.grammar_state = req.constraint.grammar.start()
+
+        prefill_start = time.perf_counter()
+        if self.prefix_cache is not None and any(r.prefix for r in batch):
+            cache, logits, attention_mask, next_positions = self._prefill_with_prefixes(batch, encoded)
+        else:
+            cache, logits, attention_mask, next_positions = self._prefill(encoded)
+        _mark_prefilled(batch, prefill_start)
+
+        active = list(range(len(batch)))
+        generated = [[] for _ in batch]
+
+        while active:
+            logits = self._constrain(logits, [batch[i] for i in active], [len(generated[i]) for i in active])
+            next_tokens = self._sample(logits, [batch[i] for i in active])
+
+            now = time.perf_counter()
+            keep = []
+            for row, idx in enumerate(active):
+                token = next_tokens[row].item()
+                req = batch[idx]
+                if req.is_cancelled():
+                    self._finish(req, generated[idx], len(encoded[idx]), "cancelled", len(batch))
+                    continue
+                if req.expired(now):
+                    self._fail(req, DeadlineExceededError("Request deadline passed during generation"))
+                    with self._stats_lock:
+                        self.expired += 1
+                    continue
+                if token in self.eos_token_ids:
+                    self._finish(req, generated[idx], len(encoded[idx]), "stop", len(batch))
+                    continue
+                if req.first_token_at is None:
+                    req.first_token_at = time.perf_counter()
+                generated[idx].append(token)
+                if self._hit_stop(req, generated[idx]):
+                    self._finish(req, generated[idx], len(encoded[idx]), "stop", len(batch))
+                    continue
+                if req.constraint is not None:
+                    req.grammar_state = req.constraint.consume(req.grammar_state, token)
+                    if req.constraint.grammar.is_complete(req.grammar_state):
+                        self._finish(req, generated[idx], len(encoded[idx]), "stop", len(batch))
+                        continue
+                if req.stream is not None:
+                    self._emit(req, generated[idx])
+                if len(generated[idx]) >= req.max_new_tokens:
+                    self._finish(req, generated[idx], len(encoded[idx]), "length", len(batch))
+                    continue
+                keep.append(row)
+
+            if not keep:
+                break
+
+            if len(keep) < len(active):
+                rows = torch.tensor(keep, dtype=torch.long, device=device)
+                cache = _select_cache_rows(cache, rows)
+                attention_mask = attention_mask[rows]
+                next_positions = next_positions[rows]
+                next_tokens = next_tokens[rows]
+                active = [active[r] for r in keep]
+
+            attention_mask = torch.cat(
+                [attention_mask, attention_mask.new_ones((len(active), 1))], dim=-1
+            )
+            outputs = self.model(
+                input_ids=next_tokens.unsqueeze(-1),
+                attention_mask=attention_mask,
+                position_ids=next_positions.unsqueeze(-1),
+                past_key_values=cache,
+                use_cache=True
+            )
+            cache = outputs.past_key_values
+            logits = outputs.logits[:, -1, :]
+            next_positions = next_positions + 1
+
+    @torch.no_grad()
+    def _generate_speculative(self, req: GenerationRequest):
+        """Decode one request with draft-and-verify speculative sampling.
+
+        Each step the draft model proposes up to num_draft_tokens tokens, the
+        model scores all of them in a single forward pass, and the longest
+        prefix that passes rejection sampling is kept plus one token drawn by
+        the model itself. The output follows the model's own (temperature /
+        top-p) distribution; greedy requests produce the same tokens as
+        without speculation.
+        """
+        device = self.model.device
+        ids = self.tokenizer(req.prompt)["input_ids"]
+
+        prefill_start = time.perf_counter()
+        if self.prefix_cache is not None and req.prefix:
+            cache, logits, _, _ = self._prefill_with_prefixes([req], [ids])
+        else:
+            cache, logits, _, _ = self._prefill([ids])
+        _mark_prefilled([req], prefill_start)
+        vocab_size = logits.shape[-1]
+        token = self._sample(logits, [req])[0].item()
+        target_passes = 1
+
+        # Tokens held in the model's KV cache; a single row has no padding, so
+        # positions are plain offsets into this list
+        sequence = list(ids)
+        draft_cache, draft_len = None, 0
+        generated = []
+
+        def commit(candidate):
+            """Append one decoded token; returns a finish reason once the request is done"""
+            if candidate in self.eos_token_ids:
+                return "stop"
+            if req.first_token_at is None:
+                req.first_token_at = time.perf_counter()
+            generated.append(candidate)
+            if self._hit_stop(req, generated):
+                return "stop"
+            if req.stream is not None:
+                self._emit(req, generated)
+            if len(generated) >= req.max_new_tokens:
+                return "length"
+            return None
+
+        finish_reason = commit(token)
+        while finish_reason is None:
+            if req.is_cancelled():
+                finish_reason = "cancelled"
+                break
+            if req.expired(time.perf_counter()):
+                self._fail(req, DeadlineExceededError("Request deadline passed during generation"))
+                with self._stats_lock:
+                    self.expired += 1
+                return
+
+            # `token` is committed but not in either KV cache yet; never draft past max_new_tokens
+            k = min(self.num_draft_tokens, req.max_new_tokens - len(generated) - 1)
+            draft_input = sequence[draft_len:] + [token]
+            drafted, draft_probs = [], []
+            for _ in range(k):
+                draft_out = self.draft_model(
+                    input_ids=torch.tensor([draft_input], dtype=torch.long, device=self.draft_model.device),
+                    position_ids=torch.arange(
+                        draft_len, draft_len + len(draft_input), device=self.draft_model.device
+                    ).unsqueeze(0),
+                    past_key_values=draft_cache,
+                    use_cache=True
+                )
+                draft_cache = draft_out.past_key_values
+                draft_len += len(draft_input)
+                q = self._token_probs(draft_out.logits[0, -1].to(device), req, vocab_size)
+                draft_input = [self._draw(q, req)]
+                drafted.append(draft_input[0])
+                draft_probs.append(q)
+
+            # Score `token` and every draft in one pass of the large model
+            verify = torch.tensor([[token] + drafted], dtype=torch.long, device=device)
+            cache_len = len(sequence)
+            outputs = self.model(
+                input_ids=verify,
+                attention_mask=torch.ones((1, cache_len + verify.shape[1]), dtype=torch.long, device=device),
+                position_ids=torch.arange(cache_len, cache_len + verify.shape[1], device=device).unsqueeze(0),
+                past_key_values=cache,
+                use_cache=True
+            )
+            cache = outputs.past_key_values
+            target_passes += 1
+
+            # Keep draft i with probability min(1, p(d_i) / q(d_i)); at the first
+            # rejection draw from the residual max(0, p - q) instead
+            accepted, next_token = [], None
+            for i, (proposal, q) in enumerate(zip(drafted, draft_probs)):
+                p = self._token_probs(outputs.logits[0, i], req)
+                if self._uniform(req, device) < (p[proposal] / q[proposal].clamp(min=1e-20)).item():
+                    accepted.append(proposal)
+                    continue
+                residual = (p - q).clamp(min=0)
+                next_token = self._draw(residual / residual.sum() if residual.sum() > 0 else p, req)
+                break
+            if next_token is None:
+                # Every draft was accepted, so the pass also yields one extra token for free
+                next_token = self._draw(self._token_probs(outputs.logits[0, len(drafted)], req), req)
+
+            req.draft_tokens += len(drafted)
+            req.accepted_draft_tokens += len(accepted)
+
+            # Drop KV entries of rejected drafts from both caches
+            sequence += [token] + accepted
+            _crop_cache(cache, len(sequence))
+            if draft_len > len(sequence):
+                _crop_cache(draft_cache, len(sequence))
+                draft_len = len(sequence)
+
+            for candidate in accepted:
+                finish_reason = commit(candidate)
+                if finish_reason is not None:
+                    break
+            else:
+                token = next_token
+                finish_reason = commit(token)
+
+        with self._stats_lock:
+            self.speculative_requests += 1
+            self.target_passes += target_passes
+            self.draft_tokens += req.draft_tokens
+            self.accepted_draft_tokens += req.accepted_draft_tokens
+        self._finish(req, generated, len(ids), finish_reason, 1)
+
+    def _token_probs(self, logits: torch.Tensor, req: GenerationRequest, vocab_size: int = None) -> torch.Tensor:
+        """Next-token distribution of one row after temperature / top-p; one-hot when greedy"""
+        logits = logits.float()
+        if vocab_size is not None and logits.shape[-1] != vocab_size:
+            # Draft vocabularies may be padded differently; align them with the model's
+            logits = logits[:vocab_size] if logits.shape[-1] > vocab_size else torch.nn.functional.pad(
+                logits, (0, vocab_size - logits.shape[-1]), value=float("-inf")
+            )
+        if req.temperature <= 0:
+            return torch.nn.functional.one_hot(logits.argmax(), logits.shape[-1]).float()
+        temperature = torch.tensor([req.temperature], device=logits.device)
+        top_p = torch.tensor([req.top_p], device=logits.device)
+        return _warp_probs(logits.unsqueeze(0), temperature, top_p)[0]
+
+    def _draw(self, probs: torch.Tensor, req: GenerationRequest) -> int:
+        if req.temperature <= 0:
+            return probs.argmax().item()
+        return torch.multinomial(probs, num_samples=1, generator=self._generator(req, probs.device)).item()
+
+    def _uniform(self, req: GenerationRequest, device) -> float:
+        # Greedy acceptance ratios are exactly 0 or 1, so no randomness is needed
+        if req.temperature <= 0:
+            return 0.0
+        return torch.rand(1, device=device, generator=self._generator(req, device)).item()
+
+    def _generator(self, req: GenerationRequest, device):
+        """The request's own RNG when it is seeded, else the global one"""
+        if req.seed is None:
+            return None
+        if req.generator is None:
+            req.generator = torch.Generator(device=device).manual_seed(req.seed)
+        return req.generator
+
+    def _prefill(self, encoded: List[List[int]]):
+        """Plain left-padded prefill over the full prompts"""
+        device = self.model.device
+        max_len = max(len(ids) for ids in encoded)
+
+        input_ids = torch.full((len(encoded), max_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(encoded), max_len), dtype=torch.long)
+        for i, ids in enumerate(encoded):
+            input_ids[i, max_len - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[i, max_len - len(ids):] = 1
+
+        input_ids = input_ids.to(device)
+        attention_mask = attention_mask.to(device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            use_cache=True
+        )
+        return outputs.past_key_values, outputs.logits[:, -1, :], attention_mask, position_ids[:, -1] + 1
+
+    def _prefill_with_prefixes(self, batch: List[GenerationRequest], encoded: List[List[int]]):
+        """Reuse cached KV for shared prefixes and only prefill the per-request suffixes.
+
+        Each row is laid out as [pad][prefix][pad][suffix]; padding is masked
+        out and position ids are derived from the mask, so the suffix
+        continues at the position its prefix ended on.
+        """
+        device = self.model.device
+
+        prefix_layers, prefix_lens = [], []
+        for req, ids in zip(batch, encoded):
+            n = 0
+            if req.prefix:
+                # Split on tokens of the full prompt so tokenization matches the uncached path
+                prefix_ids = self.tokenizer(req.prefix)["input_ids"]
+                n = min(_common_prefix_len(prefix_ids, ids), len(ids) - 1)
+            if n == 0:
+                prefix_layers.append(None)
+                prefix_lens.append(0)
+                continue
+            prefix_layers.append(self._prefix_kv(tuple(ids[:n])))
+            prefix_lens.append(n)
+
+        suffixes = [ids[n:] for ids, n in zip(encoded, prefix_lens)]
+        max_prefix = max(prefix_lens)
+        max_suffix = max(len(s) for s in suffixes)
+
+        input_ids = torch.full((len(batch), max_suffix), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), max_prefix + max_suffix), dtype=torch.long)
+        for i, (suffix, n) in enumerate(zip(suffixes, prefix_lens)):
+            input_ids[i, max_suffix - len(suffix):] = torch.tensor(suffix, dtype=torch.long)
+            attention_mask[i, max_prefix - n:max_prefix] = 1
+            attention_mask[i, max_prefix + max_suffix - len(suffix):] = 1
+
+        input_ids = input_ids.to(device)
+        attention_mask = attention_mask.to(device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, max_prefix:]
+
+        past = None
+        if max_prefix > 0:
+            reference = next(layers for layers in prefix_layers if layers is not None)
+            merged = []
+            for layer_idx, (ref_k, ref_v) in enumerate(reference):
+                keys, values = [], []
+                for layers, n in zip(prefix_layers, prefix_lens):
+                    if layers is None:
+                        k = ref_k.new_zeros(ref_k.shape[:2] + (0,) + ref_k.shape[3:])
+                        v = ref_v.new_zeros(ref_v.shape[:2] + (0,) + ref_v.shape[3:])
+                    else:
+                        k, v = layers[layer_idx]
+                    keys.append(_left_pad(k, max_prefix))
+                    values.append(_left_pad(v, max_prefix))
+                merged.append((torch.cat(keys, dim=0), torch.cat(values, dim=0)))
+            past = _build_cache(merged)
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=past,
+            use_cache=True
+        )
+        return outputs.past_key_values, outputs.logits[:, -1, :], attention_mask, position_ids[:, -1] + 1
+
+    def _prefix_kv(self, tokens: tuple):
+        """KV tensors for a prefix, extending the closest cached entry if it is not cached yet"""
+        layers, n = self.prefix_cache.lookup(tokens)
+        if n == len(tokens):
+            self.prefix_cache.record(hit=True, tokens_reused=n)
+            return layers
+
+        device = self.model.device
+        remaining = torch.tensor([tokens[n:]], dtype=torch.long, device=device)
+        outputs = self.model(
+            input_ids=remaining,
+            position_ids=torch.arange(n, len(tokens), device=device).unsqueeze(0),
+            past_key_values=_build_cache(layers) if n else None,
+            use_cache=True
+        )
+        layers = _cache_layers(outputs.past_key_values)
+        self.prefix_cache.put(tokens, layers)
+        self.prefix_cache.record(hit=False, tokens_reused=n)
+        return layers
+
+    def _sample(self, logits: torch.Tensor, requests: List[GenerationRequest]) -> torch.Tensor:
+        """Per-row temperature / top-p sampling; temperature <= 0 means greedy"""
+        logits = logits.float()
+        temperature = torch.tensor([r.temperature for r in requests], device=logits.device)
+        top_p = torch.tensor([r.top_p for r in requests], device=logits.device)
+
+        probs = _warp_probs(logits, temperature, top_p)
+
+        sampled = torch.multinomial(probs, num_samples=1).squeeze(-1)
+        for row, req in enumerate(requests):
+            if req.seed is not None and req.temperature > 0:
+                generator = self._generator(req, probs.device)
+                sampled[row] = torch.multinomial(probs[row], num_samples=1, generator=generator)[0]
+
+        return torch.where(temperature <= 0, logits.argmax(dim=-1), sampled)
+
+    def _constraint(self, json_schema: dict) -> TokenConstraint:
+        """Token masks for a schema, kept for the most recently used schemas"""
+        grammar = compile_schema(json_schema)
+        constraint = self._constraints.get(grammar)
+        if constraint is None:
+            if self._token_texts is None:
+                self._token_texts = token_texts(self.tokenizer)
+            vocab_size = max(self.model.config.vocab_size, len(self._token_texts))
+            constraint = TokenConstraint(grammar, self._token_texts, vocab_size)
+            self._constraints[grammar] = constraint
+            while len(self._constraints) > 16:
+                self._constraints.popitem(last=False)
+        self._constraints.move_to_end(grammar)
+        return constraint
+
+    def _constrain(self, logits: torch.Tensor, requests: List[GenerationRequest],
+                   lengths: List[int]) -> torch.Tensor:
+        """Rule out, per row, every token that would leave the request's json_schema"""
+        rows = [row for row, req in enumerate(requests) if req.constraint is not None]
+        if not rows:
+            return logits
+        logits = logits.clone()
+        for row in rows:
+            req = requests[row]
+            mask = req.constraint.mask(req.grammar_state, req.max_new_tokens - lengths[row], logits.device)
+            if mask.shape[-1] < logits.shape[-1]:
+                mask = torch.nn.functional.pad(mask, (0, logits.shape[-1] - mask.shape[-1]))
+            mask = mask[:logits.shape[-1]]
+            if not mask.any():
+                # Nothing fits (e.g. the tokenizer cannot spell a required value): end the answer
+                mask = mask.clone()
+                mask[list(self.eos_token_ids)] = True
+            logits[row] = logits[row].masked_fill(~mask, float("-inf"))
+        return logits
+
+    def _hit_stop(self, req: GenerationRequest, tokens: List[int]) -> bool:
+        """Whether the latest token completed one of the request's stop sequences.
+
+        Every token decodes to at least one character, so a stop sequence that
+        was not there one step earlier must lie within the last len(stop) tokens.
+        """
+        if not req.stop:
+            return False
+        window = max(len(s) for s in req.stop)
+        tail = self.tokenizer.decode(tokens[-window:], skip_special_tokens=True)
+        for stop in req.stop:
+            if stop in tail:
+                req.stop_sequence = stop
+                return True
+        return False
+
+    def _emit(self, req: GenerationRequest, tokens: List[int]):
+        """Push the newly decoded text to a streaming caller"""
+        text = self.tokenizer.decode(tokens, skip_special_tokens=True).lstrip()
+        # Hold back partial multi-byte characters until the next token completes them
+        if text.endswith("\ufffd") or not text.startswith(req.streamed_text):
+            return
+        # ...and anything that may turn out to be the start of a stop sequence
+        text = text[:len(text) - _stop_overlap(text, req.stop)]
+        delta = text[len(req.streamed_text):]
+        if delta:
+            req.streamed_text += delta
+            req.stream.put(delta)
+
+    def _finish(self, req: GenerationRequest, tokens: List[int], prompt_tokens: int,
+                finish_reason: str, batch_size: int):
+        text = self.tokenizer.decode(tokens, skip_special_tokens=True)
+        tokens_saved = 0
+        if req.stop_sequence is not None:
+            if req.stop_sequence in text:
+                text = text[:text.index(req.stop_sequence)]
+            tokens_saved = max(0, req.max_new_tokens - len(tokens))
+        text = text.strip()
+        now = time.perf_counter()
+        ttft_ms = None
+        if req.first_token_at is not None:
+            ttft_ms = (req.first_token_at - req.enqueued_at) * 1000
+        queue_wait_ms = None
+        if req.dequeued_at is not None:
+            queue_wait_ms = (req.dequeued_at - req.enqueued_at) * 1000
+        decode_ms = None
+        if req.prefill_done_at is not None:
+            decode_ms = (now - req.prefill_done_at) * 1000
+        # The caller may cancel the future at any moment, even between a check and set_result
+        try:
+            req.future.set_result(GenerationResult(
+                text=text,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=len(tokens),
+                finish_reason=finish_reason,
+                batch_size=batch_size,
+                ttft_ms=ttft_ms,
+                queue_wait_ms=queue_wait_ms,
+                draft_tokens=req.draft_tokens,
+                accepted_draft_tokens=req.accepted_draft_tokens,
+                prefill_ms=req.prefill_ms,
+                decode_ms=decode_ms,
+                total_ms=(now - req.enqueued_at) * 1000,
+                stop_sequence=req.stop_sequence,
+                tokens_saved=tokens_saved,
+                schema_valid=req.constraint.grammar.is_complete(req.grammar_state) if req.constraint else None
+            ))
+        except InvalidStateError:
+            pass
+        if req.stream is not None:
+            if text.startswith(req.streamed_text) and len(text) > len(req.streamed_text):
+                req.stream.put(text[len(req.streamed_text):])
+            req.stream.put(None)
+
+    def _fail_unfinished(self, reqs: List[GenerationRequest], error: Exception):
+        for req in reqs:
+            if not req.future.done():
+                self._fail(req, error)
+
+    def _fail(self, req: GenerationRequest, error: Exception):
+        try:
+            req.future.set_exception(error)
+        except InvalidStateError:
+            pass
+        if req.stream is not None:
+            req.stream.put(None)
+
+
+def _mark_prefilled(batch: List[GenerationRequest], started: float):
+    now = time.perf_counter()
+    for req in batch:
+        req.prefill_done_at = now
+        req.prefill_ms = (now - started) * 1000
+
+
+def _warp_probs(logits: torch.Tensor, temperature: torch.Tensor, top_p: torch.Tensor) -> torch.Tensor:
+    """Row-wise softmax with temperature, then zero everything outside the top-p nucleus"""
+    probs = torch.softmax(logits / temperature.clamp(min=1e-5).unsqueeze(-1), dim=-1)
+    sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+    outside_nucleus = sorted_probs.cumsum(dim=-1) - sorted_probs > top_p.unsqueeze(-1)
+    sorted_probs = sorted_probs.masked_fill(outside_nucleus, 0.0)
+    return torch.zeros_like(probs).scatter(-1, sorted_idx, sorted_probs)
+
+
+def _stop_overlap(text: str, stops: List[str]) -> int:
+    """Length of the longest tail of `text` that is a proper prefix of a stop sequence"""
+    longest = 0
+    for stop in stops:
+        for n in range(min(len(stop) - 1, len(text)), longest, -1):
+            if text.endswith(stop[:n]):
+                longest = n
+                break
+    return longest
+
+
+def _normalise(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+def _common_prefix_len(a, b) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def _left_pad(t: torch.Tensor, length: int) -> torch.Tensor:
+    """Zero-pad a (batch, heads, seq, dim) tensor on the sequence axis up to `length`"""
+    pad = t.new_zeros(t.shape[:2] + (length - t.shape[2],) + t.shape[3:])
+    return torch.cat([pad, t], dim=2)
+
+
+def _cache_layers(cache):
+    """List of per-layer (keys, values) tensors regardless of the cache class in use"""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    if hasattr(cache, "key_cache"):
+        return list(zip(cache.key_cache, cache.value_cache))
+    return [(k, v) for k, v in cache]
+
+
+def _build_cache(layers):
+    cache = DynamicCache()
+    for layer_idx, (k, v) in enumerate(layers):
+        cache.update(k, v, layer_idx)
+    return cache
+
+
+def _crop_cache(cache, length: int):
+    """Truncate a DynamicCache to its first `length` positions"""
+    excess = cache.get_seq_length() - length
+    if excess > 0:
+        # Negative values remove that many trailing positions (positive ones are deprecated)
+        cache.crop(-excess)
+
+
+def _select_cache_rows(cache, rows: torch.Tensor):
+    """Keep only the given batch rows of a KV cache (DynamicCache or legacy tuples)"""
+    if hasattr(cache, "batch_select_indices"):
+        cache.batch_select_indices(rows)
+        return cache
+    return tuple(tuple(t[rows] for t in layer) for layer in cache)
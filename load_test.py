@@ -0,0 +1,394 @@
+import argparse
+import glob
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from prompts import MARKING_PROMPTS, MARKING_SCHEMAS, MARKING_SYSTEM_PROMPTS, TUTOR_PROMPTS
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_DIR = os.path.join(ROOT, "data_preparation", "outputs")
+
+# Relative frequency of each marking action, roughly how often the app's buttons are used
+MARKING_MIX = {"evaluate_solution": 6, "explain_correct_answer": 2, "rubric_evaluation": 2}
+
+CURRICULUM_AREAS = ["Functions & Graphs", "Calculus", "Probability & Statistics", "Algebra", "Complex Numbers"]
+
+
+# ============================================================
+# Workload
+# ============================================================
+def load_questions(directory: str = QUESTIONS_DIR) -> list:
+    """Every extracted question, with its exam details attached like the app's question_data"""
+    questions = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Skipping {path}: {e}")
+            continue
+        for exam in data.get("exams", []):
+            for question in exam.get("questions", []):
+                if not question.get("question_text"):
+                    continue
+                questions.append({
+                    **question,
+                    "exam": {"year": exam.get("year"), "subject": exam.get("subject"), "exam_name": exam.get("exam")}
+                })
+    return questions
+
+
+def student_solution(rng: random.Random, question: dict) -> str:
+    """A correct, a worked or a stuck attempt, so answers differ in length"""
+    return rng.choice([
+        question.get("answer_text") or "",
+        question.get("detailed_answer") or "",
+        "I wasn't sure how to start, so I tried substituting values."
+    ])
+
+
+def marking_request(rng: random.Random, question: dict) -> dict:
+    """Same request the Question Bank marking flow sends"""
+    action = rng.choices(list(MARKING_MIX), weights=list(MARKING_MIX.values()))[0]
+    fields = {
+        "question_text": question["question_text"],
+        "detailed_answer": question.get("detailed_answer") or "",
+        "student_solution": student_solution(rng, question),
+        "subject": question["exam"]["subject"],
+        "year": question["exam"]["year"],
+        "exam_name": question["exam"]["exam_name"],
+        "aos": question.get("aos"),
+        "difficulty": question.get("difficulty_level"),
+        "skill_type": question.get("skill_type")
+    }
+    body = {
+        "kind": action,
+        "system_prompt": MARKING_SYSTEM_PROMPTS[action],
+        "user_prompt": MARKING_PROMPTS[action].format(**fields),
+        "priority": "interactive" if action == "evaluate_solution" else "default"
+    }
+    if action in MARKING_SCHEMAS:
+        body["json_schema"] = MARKING_SCHEMAS[action]
+    return body
+
+
+def tutor_request(rng: random.Random, question: dict) -> dict:
+    """Same request the AI Tutor chat sends for a student asking about `question`"""
+    mode = rng.choice(list(TUTOR_PROMPTS))
+    areas = rng.sample(CURRICULUM_AREAS, rng.randint(0, 2))
+    year_level = rng.choice(["Unit 1/2", "Unit 3/4"])
+
+    system_prompt = TUTOR_PROMPTS[mode]
+    if areas:
+        system_prompt += f"\n\nFocus specifically on: {', '.join(areas)}"
+    if year_level == "Unit 3/4":
+        system_prompt += "\n\nFocus on Unit 3/4 content with exam preparation emphasis."
+
+    context = f"""
+    Additional Context for Tutor:
+    - Curriculum Areas: {', '.join(areas) if areas else 'General'}
+    - Year Level: {year_level}
+    - Include Exam Tips: True
+    - Include CAS Instructions: False
+    """
+    return {
+        "kind": "tutor",
+        "system_prompt": system_prompt,
+        "user_prompt": f"Can you help me with this question? {question['question_text']}",
+        "context": context
+    }
+
+
+def build_workload(questions: list, count: int, marking_share: float, max_new_tokens: int, seed: int = 0) -> list:
+    """`count` request bodies; the same seed always gives the same sequence"""
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(count):
+        question = rng.choice(questions)
+        body = marking_request(rng, question) if rng.random() < marking_share else tutor_request(rng, question)
+        body["max_new_tokens"] = max_new_tokens
+        workload.append(body)
+    return workload
+
+
+# ============================================================
+# Stand-in Server
+# ============================================================
+def start_stand_in_server(args, workdir: str):
+    """Serve a tiny randomly-initialised model with model.py (or model_asgi.py); returns (process, url)"""
+    from benchmark import build_stand_in_model
+
+    model_dir = os.path.join(workdir, "stand-in")
+    model, tokenizer = build_stand_in_model(hidden_size=args.hidden_size, num_layers=args.num_layers)
+    model.save_pretrained(model_dir)
+    tokenizer.save_pretrained(model_dir)
+    del model
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "GRANITE_MODEL": model_dir,
+        "GRANITE_BACKEND": "cpu",
+        "GRANITE_CPU_DTYPE": "fp32",
+        "GRANITE_ARTIFACT_DIR": "",
+        "HF_HUB_OFFLINE": "1",
+        "TRANSFORMERS_OFFLINE": "1"
+    }
+    script = "model_asgi.py" if args.server == "asgi" else "model.py"
+    with open(os.path.join(workdir, "server.log"), "w") as log:
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, script)], env=env, cwd=ROOT,
+                                   stdout=log, stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_until_ready(url: str, timeout: float, process=None):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before becoming ready")
+        try:
+            response = requests.get(f"{url}/readyz", timeout=2)
+            if response.status_code == 200:
+                return
+            if response.json().get("status") == "failed":
+                raise RuntimeError(f"Server failed to load: {response.json().get('error')}")
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {url} was not ready after {timeout:.0f}s")
+
+
+# ============================================================
+# Load Generation
+# ============================================================
+def send(session: requests.Session, url: str, body: dict, stream: bool, timeout: float) -> dict:
+    """One request; returns its sample (latency and TTFT in seconds, error None on success)"""
+    kind = body["kind"]
+    payload = {key: value for key, value in body.items() if key != "kind"}
+    start = time.perf_counter()
+    sample = {"kind": kind, "start": start, "latency": None, "ttft": None, "completion_tokens": 0, "error": None}
+
+    try:
+        if not stream:
+            response = session.post(f"{url}/generate", json=payload, timeout=timeout)
+            if response.status_code != 200:
+                sample["error"] = f"http_{response.status_code}"
+                return sample
+            result = response.json()
+            # Blocking calls only learn about the first token from the server's own measurement
+            sample["ttft"] = result["ttft_ms"] / 1000 if result.get("ttft_ms") is not None else None
+        else:
+            result = None
+            with session.post(f"{url}/generate/stream", json=payload, stream=True, timeout=timeout) as response:
+                if response.status_code != 200:
+                    sample["error"] = f"http_{response.status_code}"
+                    return sample
+                event = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:"):
+                        data = json.loads(line[len("data:"):])
+                        if event == "done":
+                            result = data
+                        elif event == "error":
+                            sample["error"] = "stream_error"
+                            return sample
+                        elif sample["ttft"] is None and data.get("token"):
+                            sample["ttft"] = time.perf_counter() - start
+                    elif not line:
+                        event = None
+            if result is None:
+                sample["error"] = "stream_incomplete"
+                return sample
+
+        sample["latency"] = time.perf_counter() - start
+        sample["completion_tokens"] = result.get("completion_tokens", 0)
+
+    except requests.exceptions.Timeout:
+        sample["error"] = "timeout"
+    except requests.exceptions.RequestException as e:
+        sample["error"] = type(e).__name__
+    return sample
+
+
+def run_load(url: str, workload: list, concurrency: int, rate: float, stream: bool,
+             timeout: float, seed: int = 0):
+    """Replay the workload; returns (samples, wall-clock seconds).
+
+    rate > 0 is an open loop: arrivals follow a Poisson process at `rate` req/s and
+    latency is measured from the scheduled arrival, so time spent waiting for a free
+    client counts (no coordinated omission). rate == 0 is a closed loop where
+    `concurrency` clients send back to back.
+    """
+    local = threading.local()
+
+    def session() -> requests.Session:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return local.session
+
+    def timed(body, scheduled):
+        sample = send(session(), url, body, stream, timeout)
+        if scheduled is not None:
+            queued = sample["start"] - scheduled
+            if sample["latency"] is not None:
+                sample["latency"] += queued
+            if sample["ttft"] is not None and stream:
+                sample["ttft"] += queued
+        return sample
+
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = []
+        arrival = start
+        for body in workload:
+            if rate > 0:
+                arrival += rng.expovariate(rate)
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(pool.submit(timed, body, arrival))
+            else:
+                futures.append(pool.submit(timed, body, None))
+        samples = [f.result() for f in futures]
+    return samples, time.perf_counter() - start
+
+
+# ============================================================
+# Report
+# ============================================================
+def percentile(values: list, q: float):
+    """Nearest-rank percentile; None for an empty list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(q / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def summarise(samples: list, elapsed: float) -> dict:
+    ok = [s for s in samples if s["error"] is None]
+    errors = {}
+    for s in samples:
+        if s["error"] is not None:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+
+    def distribution(values):
+        return {f"p{q}_ms": None if percentile(values, q) is None else percentile(values, q) * 1000
+                for q in (50, 95, 99)}
+
+    by_kind = {}
+    for kind in sorted({s["kind"] for s in samples}):
+        kind_ok = [s["latency"] for s in ok if s["kind"] == kind]
+        by_kind[kind] = {"requests": sum(s["kind"] == kind for s in samples), **distribution(kind_ok)}
+
+    return {
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "errors": errors,
+        "duration_s": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "throughput_tokens_per_s": sum(s["completion_tokens"] for s in ok) / elapsed if elapsed else 0.0,
+        "latency": distribution([s["latency"] for s in ok]),
+        "ttft": distribution([s["ttft"] for s in ok if s["ttft"] is not None]),
+        "by_kind": by_kind
+    }
+
+
+def print_report(summary: dict):
+    def ms(value):
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+    print(f"requests {summary['requests']}  ok {summary['succeeded']}  "
+          f"error rate {summary['error_rate']:.1%}  {summary['errors'] or ''}")
+    print(f"throughput {summary['throughput_rps']:.2f} req/s, "
+          f"{summary['throughput_tokens_per_s']:.1f} tok/s over {summary['duration_s']:.1f}s")
+    print(f"{'':<30} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = [("latency", summary["latency"]), ("time to first token", summary["ttft"])]
+    rows += [(f"  {kind} ({info['requests']})", info) for kind, info in summary["by_kind"].items()]
+    for label, dist in rows:
+        print(f"{label:<30} {ms(dist['p50_ms'])} {ms(dist['p95_ms'])} {ms(dist['p99_ms'])}")
+
+
+# ============================================================
+# Entry Point
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay tutor and marking traffic against the inference server. "
+                    "Without --url a stand-in model is served locally, fully offline."
+    )
+    parser.add_argument("--url", default=None, help="Running server to test (default: start a stand-in server)")
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask",
+                        help="Stand-in server flavour: model.py or model_asgi.py")
+    parser.add_argument("--hidden-size", type=int, default=128, help="Stand-in model width")
+    parser.add_argument("--num-layers", type=int, default=4, help="Stand-in model depth")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients (closed loop) or max in-flight requests")
+    parser.add_argument("--rate", type=float, default=0.0, help="Poisson arrival rate in req/s (0 = closed loop)")
+    parser.add_argument("--marking-share", type=float, default=0.5, help="Fraction of marking vs tutor requests")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--blocking", action="store_true",
+                        help="Use /generate instead of /generate/stream (TTFT is then server-reported)")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--questions", default=QUESTIONS_DIR, help="Directory of extracted question JSON files")
+    parser.add_argument("--json", default=None, help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    if not questions:
+        parser.error(f"No questions found in {args.questions}")
+    workload = build_workload(questions, args.requests, args.marking_share, args.max_new_tokens, seed=args.seed)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        url = args.url.rstrip("/") if args.url else None
+        try:
+            if url is None:
+                print(f"🔄 Starting stand-in {args.server} server...")
+                process, url = start_stand_in_server(args, workdir)
+            wait_until_ready(url, timeout=args.timeout, process=process)
+
+            mode = f"open loop at {args.rate:g} req/s" if args.rate > 0 else "closed loop"
+            print(f"🚀 {args.requests} requests from {len(questions)} questions, "
+                  f"concurrency {args.concurrency}, {mode}")
+            samples, elapsed = run_load(url, workload, args.concurrency, args.rate,
+                                        stream=not args.blocking, timeout=args.timeout, seed=args.seed)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            if process is not None:
+                with open(os.path.join(workdir, "server.log"), "r") as f:
+                    print(f.read()[-4000:])
+            sys.exit(1)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    summary = summarise(samples, elapsed)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import json
+import re
+from typing import Optional
+
+# Marking helpers shared by the Streamlit app and the batch marking job (batch_marking.py)
+
+SECTIONS = ("verdict", "score", "feedback", "mistakes", "improvements")
+
+# Verdicts of the MARKING_SCHEMAS["evaluate_solution"] enum, as the free-text format writes them
+VERDICT_LABELS = {"CORRECT": "✅ CORRECT", "INCORRECT": "❌ INCORRECT"}
+
+# One "name": value pair of a (possibly still streaming) JSON answer; the closing quote may be missing
+JSON_FIELD = re.compile(r'"(\w+)":\s*(?:"((?:[^"\\]|\\.)*\\?)"?|(-?\d+(?:\.\d+)?))')
+
+
+def marking_fields(question_data, student_solution):
+    """Values for the MARKING_PROMPTS placeholders"""
+    return {
+        "question_text": question_data['question_text'],
+        "detailed_answer": question_data['detailed_answer'],
+        "student_solution": student_solution,
+        "subject": question_data['exam']['subject'],
+        "year": question_data['exam']['year'],
+        "exam_name": question_data['exam']['exam_name'],
+        "aos": question_data['aos'],
+        "difficulty": question_data['difficulty_level'],
+        "skill_type": question_data['skill_type']
+    }
+
+
+def parse_marking_feedback(feedback_text):
+    """Split an evaluate_solution answer into its VERDICT/SCORE/FEEDBACK/MISTAKES/IMPROVEMENTS sections.
+
+    Accepts both the free-text format and the JSON object of structured output,
+    including one that is still streaming in.
+    """
+    if (feedback_text or "").lstrip().startswith("{"):
+        return parse_marking_json(feedback_text)
+
+    sections = {name: "" for name in SECTIONS}
+    current_section = ""
+
+    for line in (feedback_text or "").split('\n'):
+        header = next((name for name in SECTIONS if line.startswith(f"{name.upper()}:")), None)
+        if header:
+            sections[header] = line[len(header) + 1:].strip()
+            current_section = header
+        elif current_section in ("feedback", "mistakes", "improvements") and line.strip():
+            sections[current_section] += "\n" + line.strip()
+
+    return sections
+
+
+def parse_marking_json(feedback_text):
+    """Sections of a JSON evaluate_solution answer, using whatever fields have arrived so far"""
+    sections = {name: "" for name in SECTIONS}
+    for name, text, number in JSON_FIELD.findall(feedback_text):
+        if name not in sections:
+            continue
+        if number:
+            sections[name] = f"{float(number):g}/10" if name == "score" else number
+            continue
+        value = _json_string(text)
+        sections[name] = VERDICT_LABELS.get(value, value) if name == "verdict" else value.strip()
+    return sections
+
+
+def _json_string(text):
+    """Decoded contents of a JSON string, ignoring an escape sequence cut off mid-stream"""
+    for candidate in (text, text[:-1]):
+        try:
+            return json.loads(f'"{candidate}"')
+        except ValueError:
+            continue
+    return text
+
+
+def format_marking_feedback(sections):
+    """Sections back in the free-text VERDICT:/SCORE:/... layout"""
+    return "\n".join(
+        f"{name.upper()}: {sections[name]}" for name in SECTIONS if sections[name]
+    )
+
+
+def parse_score(score: str) -> Optional[float]:
+    """Marks out of 10 from a SCORE section such as "8/10" or "7.5 / 10"; None if there is no number"""
+    match = re.search(r"(\d+(?:\.\d+)?)\s*(?:/\s*(\d+(?:\.\d+)?))?", score or "")
+    if not match:
+        return None
+    value = float(match.group(1))
+    out_of = float(match.group(2)) if match.group(2) else 10.0
+    if out_of <= 0 or value > out_of:
+        return None
+    return value * 10.0 / out_of
+
+
+def verdict_is_correct(verdict: str) -> Optional[bool]:
+    if "INCORRECT" in (verdict or "").upper():
+        return False
+    if "CORRECT" in (verdict or "").upper():
+        return True
+    return None
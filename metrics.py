@@ -0,0 +1,277 @@
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import torch
+
+from inference import DeadlineExceededError, QueueFullError
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+# ============================================================
+# Metric Types
+# ============================================================
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: tuple, extra: Optional[dict] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return "{" + body + "}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Either set() directly or read at scrape time from a callback.
+
+    The callback returns a number, or a {label tuple: value} dict for labelled gauges;
+    None means "not available here" and the gauge is left out of the output.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 callback: Optional[Callable] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[tuple, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.callback is not None:
+            value = self.callback()
+            if value is None:
+                return []
+            values = value if isinstance(value, dict) else {(): value}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{self._format_labels(key)} {_number(v)}" for key, v in sorted(values.items())]
+
+    def render(self) -> str:
+        samples = self._samples()
+        if not samples:
+            return ""
+        return "\n".join([f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + samples)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> (per-bucket counts, sum, count)
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            for bound, n in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': _number(bound)})} {n}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        blocks = [metric.render() for metric in self._metrics]
+        return "\n".join(block for block in blocks if block) + "\n"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ============================================================
+# Process / Accelerator Memory
+# ============================================================
+def process_rss_bytes() -> Optional[float]:
+    """Current resident set size; falls back to the peak RSS where /proc is missing"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in KiB on Linux
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def cuda_memory(stat: Callable) -> Optional[dict]:
+    if not torch.cuda.is_available():
+        return None
+    return {(str(i),): stat(i) for i in range(torch.cuda.device_count())}
+
+
+# ============================================================
+# Inference Metrics
+# ============================================================
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "granite_requests_total", "Generation requests by mode and outcome", ("mode", "outcome")))
+ERRORS = REGISTRY.register(Counter(
+    "granite_request_errors_total", "Failed generation requests by mode and error type", ("mode", "error")))
+QUEUE_WAIT = REGISTRY.register(Histogram(
+    "granite_queue_wait_seconds", "Time from submission until the request joined a batch"))
+TTFT = REGISTRY.register(Histogram(
+    "granite_time_to_first_token_seconds", "Time from submission until the first generated token"))
+PREFILL = REGISTRY.register(Histogram(
+    "granite_prefill_seconds", "Prompt prefill time of the batch the request was part of"))
+DECODE = REGISTRY.register(Histogram(
+    "granite_decode_seconds", "Time spent decoding after prefill"))
+DURATION = REGISTRY.register(Histogram(
+    "granite_request_duration_seconds", "Time from submission until the request finished", ("mode",)))
+PROMPT_TOKENS = REGISTRY.register(Counter(
+    "granite_prompt_tokens_total", "Prompt tokens processed"))
+COMPLETION_TOKENS = REGISTRY.register(Counter(
+    "granite_completion_tokens_total", "Tokens generated"))
+STOP_SEQUENCE_TOKENS_SAVED = REGISTRY.register(Counter(
+    "granite_stop_sequence_tokens_saved_total", "max_new_tokens left undecoded because a stop sequence ended generation"))
+STRUCTURED_OUTPUTS = REGISTRY.register(Counter(
+    "granite_structured_outputs_total", "json_schema generations by whether the output completed the schema",
+    ("result",)))
+TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "granite_decode_tokens_per_second", "Per-request decode speed", buckets=TOKENS_PER_SECOND_BUCKETS))
+RSS = REGISTRY.register(Gauge(
+    "granite_process_resident_memory_bytes", "Resident memory of the server process",
+    callback=process_rss_bytes))
+CUDA_ALLOCATED = REGISTRY.register(Gauge(
+    "granite_cuda_memory_allocated_bytes", "Memory held by tensors on each CUDA device", ("device",),
+    callback=lambda: cuda_memory(torch.cuda.memory_allocated)))
+CUDA_RESERVED = REGISTRY.register(Gauge(
+    "granite_cuda_memory_reserved_bytes", "Memory reserved by the caching allocator on each CUDA device",
+    ("device",), callback=lambda: cuda_memory(torch.cuda.memory_reserved)))
+CUDA_PEAK = REGISTRY.register(Gauge(
+    "granite_cuda_max_memory_allocated_bytes", "Peak tensor memory on each CUDA device", ("device",),
+    callback=lambda: cuda_memory(torch.cuda.max_memory_allocated)))
+
+
+def observe_result(result, mode: str):
+    """Record one finished generation (a GenerationResult)"""
+    REQUESTS.inc(mode=mode, outcome="cancelled" if result.finish_reason == "cancelled" else "ok")
+    PROMPT_TOKENS.inc(result.prompt_tokens)
+    COMPLETION_TOKENS.inc(result.completion_tokens)
+    if result.tokens_saved:
+        STOP_SEQUENCE_TOKENS_SAVED.inc(result.tokens_saved)
+    if result.schema_valid is not None and result.finish_reason != "cancelled":
+        STRUCTURED_OUTPUTS.inc(result="valid" if result.schema_valid else "malformed")
+
+    if result.queue_wait_ms is not None:
+        QUEUE_WAIT.observe(result.queue_wait_ms / 1000)
+    if result.ttft_ms is not None:
+        TTFT.observe(result.ttft_ms / 1000)
+    if result.prefill_ms is not None:
+        PREFILL.observe(result.prefill_ms / 1000)
+    if result.decode_ms is not None:
+        DECODE.observe(result.decode_ms / 1000)
+        if result.decode_ms > 0 and result.completion_tokens:
+            TOKENS_PER_SECOND.observe(result.completion_tokens / (result.decode_ms / 1000))
+    if result.total_ms is not None:
+        DURATION.observe(result.total_ms / 1000, mode=mode)
+
+
+def observe_cached(mode: str):
+    REQUESTS.inc(mode=mode, outcome="cached")
+
+
+def observe_error(mode: str, error: Exception):
+    if isinstance(error, QueueFullError):
+        kind = "queue_full"
+    elif isinstance(error, DeadlineExceededError):
+        kind = "deadline"
+    elif isinstance(error, ValueError):
+        kind = "invalid"
+    else:
+        kind = "internal"
+    ERRORS.inc(mode=mode, error=kind)
+
+
+def register_gauge(name: str, help_text: str, callback: Callable) -> Gauge:
+    """Expose a value owned elsewhere (queue depth, cache sizes) as a scrape-time gauge"""
+    return REGISTRY.register(Gauge(name, help_text, callback=callback))
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -7,6 +7,9 @@ import glob
 from typing import Dict, List, Any, Optional
 import sys
 
+from db import DB_CONFIG
+from question_bank import SEARCH_VECTOR_SQL
+
 class VCEPostgresLoader:
     def __init__(self, db_config: Dict[str, str]):
         """Initialize database connection"""
@@ -94,6 +97,11 @@ class VCEPostgresLoader:
         CREATE INDEX IF NOT EXISTS idx_questions_aos ON questions(aos);
         CREATE INDEX IF NOT EXISTS idx_questions_difficulty ON questions(difficulty_level);
         CREATE INDEX IF NOT EXISTS idx_aos_breakdown_exam_id ON aos_breakdown(exam_id);
+
+        -- Full-text search document per question (kept current by insert_questions)
+        ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector TSVECTOR;
+        CREATE INDEX IF NOT EXISTS idx_questions_search ON questions USING GIN (search_vector);
+        CREATE INDEX IF NOT EXISTS idx_questions_number ON questions(question_number);
         """
         
         try:
@@ -107,6 +115,35 @@ class VCEPostgresLoader:
             self.conn.rollback()
             print(f"❌ Error creating tables: {e}")
     
+    def create_search_indexes(self):
+        """Fill in missing search documents and add the trigram indexes used for substring and fuzzy matches"""
+        try:
+            self.cursor.execute(f"UPDATE questions SET search_vector = {SEARCH_VECTOR_SQL} WHERE search_vector IS NULL")
+            updated = self.cursor.rowcount
+            # A bulk update leaves its entries in the GIN pending list, which the planner
+            # prices as a scan of every entry until autovacuum gets round to merging them
+            self.cursor.execute("SELECT gin_clean_pending_list('idx_questions_search')")
+            self.conn.commit()
+            print(f"✅ Built search documents for {updated} questions")
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Error building search documents: {e}")
+        
+        try:
+            self.cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            self.cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_questions_text_trgm ON questions USING GIN (question_text gin_trgm_ops)"
+            )
+            self.cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_questions_answer_trgm ON questions USING GIN (answer_text gin_trgm_ops)"
+            )
+            self.conn.commit()
+            print("✅ Trigram indexes created")
+        except Exception as e:
+            # Search still works without them, just without substring and typo-tolerant matching
+            self.conn.rollback()
+            print(f"⚠️  Trigram indexes not created (is the pg_trgm extension installed?): {e}")
+    
     def parse_scraped_at(self, scraped_at_str: Optional[str]) -> Optional[datetime]:
         if not scraped_at_str:
             return None
@@ -244,6 +281,12 @@ class VCEPostgresLoader:
             
             execute_batch(self.cursor, question_sql, question_records)
             
+            # Rebuild the search document of every question just inserted or updated
+            self.cursor.execute(
+                f"UPDATE questions SET search_vector = {SEARCH_VECTOR_SQL} WHERE question_id = ANY(%s)",
+                ([record[0] for record in question_records],)
+            )
+            
             # Insert subparts if they exist
             self.insert_subparts(questions)
             
@@ -398,13 +441,8 @@ class VCEPostgresLoader:
 
 
 def main():    
-    db_config = {
-        'host': 'localhost',           # or your PostgreSQL host
-        'database': 'vce_learning_platform',
-        'user': 'postgres',            # your PostgreSQL username
-        'password': 'postgres1234',        # your PostgreSQL password
-        'port': '5432'                 # default PostgreSQL port
-    }
+    # Connection settings come from the DB_* environment variables (see db.py)
+    db_config = DB_CONFIG
     
     json_directory = r"E:\Practice\VCE-Learning-Plateform\outputs"
     
@@ -414,6 +452,7 @@ def main():
         loader.connect()
         loader.create_tables()
         loader.load_all_json_files(json_directory)
+        loader.create_search_indexes()
         loader.get_database_stats()
         
     except Exception as e:
@@ -1,92 +1,805 @@
-from flask import Flask, request, jsonify
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
-import torch
+from flask import Flask, Response, request, jsonify, stream_with_context
+from transformers import AutoTokenizer
+import json
 import os
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
 
-MODEL_NAME = "ibm-granite/granite-3.3-8b-base"
+from artifacts import load_model_with_artifact
+from backends import backend_from_env, load_phase
+from context_budget import ContextBudget, context_sections, render_context
+import metrics
+from inference import (
+    PRIORITY_CLASSES,
+    BatchScheduler,
+    DeadlineExceededError,
+    PrefixCache,
+    QueueFullError,
+    ResponseCache
+)
+from structured_output import compile_schema
 
-print("🔄 Starting server and loading Granite model...")
+# Hub id or local path (e.g. the stand-in model load_test.py serves)
+MODEL_NAME = os.environ.get("GRANITE_MODEL", "ibm-granite/granite-3.3-8b-base")
 
-quant_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_use_double_quant=True,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_compute_dtype=torch.bfloat16
-)
+# GRANITE_BACKEND=cuda|cpu, GRANITE_CPU_DTYPE=int8|bf16|fp32, GRANITE_CPU_THREADS, GRANITE_COMPILE=1
+BACKEND_CONFIG = backend_from_env()
+
+# Pre-quantized weights written by `python artifacts.py`; used when their fingerprint matches ("" disables)
+ARTIFACT_DIR = os.environ.get("GRANITE_ARTIFACT_DIR", os.path.expanduser("~/.cache/granite-artifacts"))
+# Re-hash the artifact's files against its manifest on every start (slow; off by default)
+ARTIFACT_VERIFY = os.environ.get("GRANITE_ARTIFACT_VERIFY", "0") == "1"
+
+# Requests arriving within this window (or until the batch is full) share one generate pass
+BATCH_MAX_SIZE = int(os.environ.get("GRANITE_BATCH_MAX_SIZE", 8))
+BATCH_WINDOW_MS = float(os.environ.get("GRANITE_BATCH_WINDOW_MS", 10))
+
+# KV cache for the recurring system prompts; 0 disables it
+PREFIX_CACHE_MB = int(os.environ.get("GRANITE_PREFIX_CACHE_MB", 1024))
+
+# Opt-in cache of finished responses; only deterministic requests are served from it
+RESPONSE_CACHE_ENABLED = os.environ.get("GRANITE_RESPONSE_CACHE", "0") == "1"
+RESPONSE_CACHE_SIZE = int(os.environ.get("GRANITE_RESPONSE_CACHE_SIZE", 1000))
+RESPONSE_CACHE_TTL = float(os.environ.get("GRANITE_RESPONSE_CACHE_TTL", 24 * 3600))
+RESPONSE_CACHE_PATH = os.environ.get("GRANITE_RESPONSE_CACHE_PATH") or None
+
+# "off": sample as requested; "greedy": force temperature 0; "seeded": default seed per request
+DETERMINISTIC_MODE = os.environ.get("GRANITE_DETERMINISTIC", "off")
+DETERMINISTIC_SEED = int(os.environ.get("GRANITE_SEED", 0))
+
+MAX_NEW_TOKENS_LIMIT = int(os.environ.get("GRANITE_MAX_NEW_TOKENS_LIMIT", 1024))
+
+# Generation stops at these strings unless a request sends its own "stop" list (JSON list, [] disables).
+# The base model tends to carry on with another USER:/ASSISTANT: turn after answering.
+DEFAULT_STOP_SEQUENCES = json.loads(os.environ.get("GRANITE_STOP_SEQUENCES", '["\\nUSER:", "\\nASSISTANT:"]'))
+MAX_STOP_SEQUENCES = 8
+
+# Upper bound on prompts in one /generate_batch call
+MAX_BATCH_ITEMS = int(os.environ.get("GRANITE_MAX_BATCH_ITEMS", 16))
+
+# Prompt tokens allowed per request; the CONTEXT block is trimmed by priority to fit
+MAX_INPUT_TOKENS = int(os.environ.get("GRANITE_MAX_INPUT_TOKENS", 8192))
+
+# Admission control: waiting requests beyond this get a 429 (0 = unbounded)
+MAX_QUEUE_SIZE = int(os.environ.get("GRANITE_MAX_QUEUE_SIZE", 64))
+# Matches the client-side timeout in query_granite; work older than this is dropped
+DEFAULT_TIMEOUT_S = float(os.environ.get("GRANITE_DEFAULT_TIMEOUT_S", 300))
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+# Speculative decoding: a small model with the same tokenizer drafts tokens for Granite to verify.
+# GRANITE_SPECULATIVE sets the default; requests can override it with "speculative"
+DRAFT_MODEL_NAME = os.environ.get("GRANITE_DRAFT_MODEL") or None
+DRAFT_TOKENS = int(os.environ.get("GRANITE_DRAFT_TOKENS", 4))
+SPECULATIVE_DEFAULT = DRAFT_MODEL_NAME is not None and os.environ.get("GRANITE_SPECULATIVE", "1") == "1"
 
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    quantization_config=quant_config,
-    device_map="auto"
+# Short greedy generation run before the server reports ready (0 disables it)
+WARMUP_TOKENS = int(os.environ.get("GRANITE_WARMUP_TOKENS", 16))
+WARMUP_SYSTEM_PROMPT = os.environ.get(
+    "GRANITE_WARMUP_SYSTEM_PROMPT", "You are an expert VCE mathematics examiner providing detailed feedback."
 )
 
-model.eval()
+app = Flask(__name__)
 
-print("✅ Granite model loaded and ready.")
 
+class ModelNotReadyError(Exception):
+    pass
+
+
+# ============================================================
+# Background Loading
+# ============================================================
+# The HTTP server binds right away; weights load on a background thread and
+# generation endpoints answer 503 until loading and warmup have finished.
+LOAD_STATE = {"status": "loading", "phase": None, "error": None, "timings": {}}
+_ready = threading.Event()
+
+tokenizer = None
+model = None
+draft_model = None
+context_budget = None
+scheduler = None
+
+prefix_cache = PrefixCache(max_bytes=PREFIX_CACHE_MB * 1024 * 1024) if PREFIX_CACHE_MB > 0 else None
+
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_SIZE,
+    ttl_seconds=RESPONSE_CACHE_TTL,
+    path=RESPONSE_CACHE_PATH
+) if RESPONSE_CACHE_ENABLED else None
+
+
+def load_server():
+    global tokenizer, model, draft_model, context_budget, scheduler
+
+    timings = LOAD_STATE["timings"]
+    start = time.perf_counter()
+    try:
+        print(f"🔄 Loading Granite model ({BACKEND_CONFIG['backend']} backend)...")
+
+        LOAD_STATE["phase"] = "tokenizer"
+        with load_phase(timings, "tokenizer"):
+            tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+
+        LOAD_STATE["phase"] = "model"
+        model = load_model_with_artifact(MODEL_NAME, ARTIFACT_DIR, verify=ARTIFACT_VERIFY,
+                                         timings=timings, **BACKEND_CONFIG)
+
+        if DRAFT_MODEL_NAME:
+            print(f"🔄 Loading draft model {DRAFT_MODEL_NAME} for speculative decoding...")
+            LOAD_STATE["phase"] = "draft_model"
+            if AutoTokenizer.from_pretrained(DRAFT_MODEL_NAME, use_fast=True).get_vocab() != tokenizer.get_vocab():
+                raise ValueError(f"Draft model {DRAFT_MODEL_NAME} does not share the tokenizer of {MODEL_NAME}")
+            draft_timings = {}
+            draft_model = load_model_with_artifact(DRAFT_MODEL_NAME, ARTIFACT_DIR, verify=ARTIFACT_VERIFY,
+                                                   timings=draft_timings, **BACKEND_CONFIG)
+            timings.update({f"draft_{phase}": seconds for phase, seconds in draft_timings.items()})
+
+        context_budget = ContextBudget(tokenizer, max_input_tokens=MAX_INPUT_TOKENS)
+        scheduler = BatchScheduler(
+            model,
+            tokenizer,
+            max_batch_size=BATCH_MAX_SIZE,
+            batch_window_ms=BATCH_WINDOW_MS,
+            prefix_cache=prefix_cache,
+            max_queue_size=MAX_QUEUE_SIZE,
+            draft_model=draft_model,
+            num_draft_tokens=DRAFT_TOKENS
+        )
+
+        if WARMUP_TOKENS > 0:
+            LOAD_STATE["phase"] = "warmup"
+            with load_phase(timings, "warmup"):
+                warmup()
+
+    except Exception as e:
+        LOAD_STATE.update(status="failed", error=str(e))
+        print(f"❌ Loading Granite model failed during {LOAD_STATE['phase']}: {e}")
+        return
+
+    timings["total"] = time.perf_counter() - start
+    for phase, seconds in timings.items():
+        print(f"⏱️  {phase:<24} {seconds:8.2f}s")
+
+    LOAD_STATE.update(status="ready", phase=None)
+    _ready.set()
+    print("✅ Granite model loaded and ready.")
+
+
+def warmup():
+    """One short generation so the first real request doesn't pay for cold kernels.
+
+    Uses the default marking system prompt, which also seeds the prefix cache.
+    """
+    params = {"max_new_tokens": WARMUP_TOKENS, "temperature": 0.0, "prefix": prompt_prefix(WARMUP_SYSTEM_PROMPT)}
+    prompt = build_prompt(WARMUP_SYSTEM_PROMPT, "Find the derivative of x^2 sin(x).")
+    scheduler.submit(prompt, **params).result()
+    if draft_model is not None:
+        scheduler.submit(prompt, speculative=True, **params).result()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def require_ready():
+    if not _ready.is_set():
+        raise ModelNotReadyError(
+            "Model failed to load" if LOAD_STATE["status"] == "failed" else "Model is still loading"
+        )
+
+
+def not_ready_body(e: ModelNotReadyError) -> dict:
+    return {"error": str(e), "status": LOAD_STATE["status"], "phase": LOAD_STATE["phase"]}
+
+
+def not_ready_response(e: ModelNotReadyError):
+    response = jsonify(not_ready_body(e))
+    response.status_code = 503
+    response.headers["Retry-After"] = "10"
+    return response
+
+
+metrics.register_gauge("granite_ready", "1 once the model is loaded and warmed up",
+                       lambda: 1 if _ready.is_set() else 0)
+metrics.REGISTRY.register(metrics.Gauge(
+    "granite_load_phase_seconds", "Seconds spent in each model loading phase", ("phase",),
+    callback=lambda: {(phase,): seconds for phase, seconds in list(LOAD_STATE["timings"].items())}
+))
+metrics.register_gauge("granite_queue_depth", "Requests waiting for a batch",
+                       lambda: scheduler.queue_depth() if scheduler else None)
 
 # ============================================================
 # Inference Function
 # ============================================================
+def build_prompt(system_prompt: str, user_prompt: str, context: str = "") -> str:
+    prompt = prompt_prefix(system_prompt)
+    if context:
+        prompt += f"CONTEXT:\n{context}\n\n"
+    prompt += f"USER:\n{user_prompt}\n\nASSISTANT:"
+    return prompt
+
+
+def prompt_prefix(system_prompt: str) -> str:
+    """Static head of every prompt; its KV cache is shared between requests"""
+    return f"{system_prompt}\n\n"
+
+
+def fit_prompt(system_prompt: str, user_prompt: str, context="", max_new_tokens: int = 256):
+    """(prompt, prefix, budget report) with the CONTEXT block trimmed to MAX_INPUT_TOKENS"""
+    fitted_context, report = context_budget.fit(
+        build_prompt, system_prompt, user_prompt, context, max_new_tokens=max_new_tokens
+    )
+    return build_prompt(system_prompt, user_prompt, fitted_context), prompt_prefix(system_prompt), report
+
+
+def parse_generation_request(data: dict) -> dict:
+    """granite_submit() kwargs from a request body; raises ValueError if it is invalid"""
+    user_prompt = data.get("user_prompt", "")
+    if not user_prompt:
+        raise ValueError("user_prompt is required")
+
+    return {
+        "system_prompt": data.get("system_prompt", "You are a helpful assistant."),
+        "user_prompt": user_prompt,
+        "context": parse_context(data),
+        **parse_generation_params(data),
+        **parse_scheduling_params(data)
+    }
+
+
+def parse_batch_request(data) -> list:
+    """One entry per item: granite_submit() kwargs, or the ValueError that makes that item invalid.
+
+    Top-level fields other than "items" are defaults that every item can override.
+    """
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list of prompt specs")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ValueError(f"At most {MAX_BATCH_ITEMS} items are allowed per batch")
+
+    defaults = {key: value for key, value in data.items() if key != "items"}
+    specs = []
+    for item in items:
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Each item must be a JSON object")
+            specs.append(parse_generation_request({**defaults, **item}))
+        except ValueError as e:
+            specs.append(e)
+    return specs
+
+
+def parse_context(data: dict):
+    """The request's context: a string, or a list of strings / {"text", "priority"} sections"""
+    context = data.get("context", "")
+    if not isinstance(context, (str, list)):
+        raise ValueError("context must be a string or a list of sections")
+    context_sections(context)
+    return context
+
+
+def parse_generation_params(data: dict) -> dict:
+    """Optional sampling params from a request body, validated and with server defaults"""
+    try:
+        params = {
+            "max_new_tokens": int(data.get("max_new_tokens", 256)),
+            "temperature": float(data.get("temperature", 0.2)),
+            "top_p": float(data.get("top_p", 0.9)),
+            "seed": int(data["seed"]) if data.get("seed") is not None else None
+        }
+    except (TypeError, ValueError):
+        raise ValueError("max_new_tokens, temperature, top_p and seed must be numbers")
+
+    if not 1 <= params["max_new_tokens"] <= MAX_NEW_TOKENS_LIMIT:
+        raise ValueError(f"max_new_tokens must be between 1 and {MAX_NEW_TOKENS_LIMIT}")
+    if params["temperature"] < 0:
+        raise ValueError("temperature must be >= 0")
+    if not 0 < params["top_p"] <= 1:
+        raise ValueError("top_p must be in (0, 1]")
+
+    params["json_schema"] = parse_json_schema(data.get("json_schema"))
+    params["stop"] = parse_stop_sequences(data.get("stop"), structured=params["json_schema"] is not None)
+    return params
+
+
+def parse_json_schema(json_schema):
+    """A request's "json_schema" (see structured_output.py), or None for free text"""
+    if json_schema is not None:
+        compile_schema(json_schema)
+    return json_schema
+
+
+def parse_stop_sequences(stop, structured: bool = False) -> list:
+    """A request's "stop": one string or a list of them; missing means the server defaults.
+
+    Structured (json_schema) output ends when the object is complete, so it gets no defaults.
+    """
+    if stop is None:
+        return [] if structured else list(DEFAULT_STOP_SEQUENCES)
+    if isinstance(stop, str):
+        stop = [stop]
+    if not isinstance(stop, list) or not all(isinstance(s, str) and s for s in stop):
+        raise ValueError("stop must be a non-empty string or a list of them")
+    if len(stop) > MAX_STOP_SEQUENCES:
+        raise ValueError(f"At most {MAX_STOP_SEQUENCES} stop sequences are allowed")
+    return stop
+
+
+def parse_scheduling_params(data: dict) -> dict:
+    """Priority class, deadline and speculative decoding of a request; these never affect the output"""
+    priority = data.get("priority", "default")
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"priority must be one of {list(PRIORITY_CLASSES)}")
+
+    try:
+        timeout_s = float(data.get("timeout_s", DEFAULT_TIMEOUT_S))
+    except (TypeError, ValueError):
+        raise ValueError("timeout_s must be a number")
+    if timeout_s <= 0:
+        raise ValueError("timeout_s must be > 0")
+
+    speculative = data.get("speculative", SPECULATIVE_DEFAULT)
+    if not isinstance(speculative, bool):
+        raise ValueError("speculative must be true or false")
+
+    return {"priority": priority, "timeout_s": timeout_s, "speculative": speculative}
+
+
+def resolve_sampling(params: dict) -> dict:
+    """Apply the server-wide deterministic mode to a request's sampling params"""
+    params = dict(params)
+    if DETERMINISTIC_MODE == "greedy":
+        params["temperature"] = 0.0
+    elif DETERMINISTIC_MODE == "seeded" and params.get("seed") is None:
+        params["seed"] = DETERMINISTIC_SEED
+    return params
+
+
+def response_cache_key(system_prompt: str, user_prompt: str, context: str, params: dict):
+    """Cache key for deterministic requests only; sampled answers are never reused"""
+    if response_cache is None:
+        return None
+    if params["temperature"] > 0 and params.get("seed") is None:
+        return None
+    return ResponseCache.make_key(system_prompt, user_prompt, render_context(context), **params)
+
+
+def result_body(result, budget_report: dict = None) -> dict:
+    return {
+        "output": result.text,
+        "prompt_tokens": result.prompt_tokens,
+        "completion_tokens": result.completion_tokens,
+        "finish_reason": result.finish_reason,
+        "stop_sequence": result.stop_sequence,
+        "tokens_saved": result.tokens_saved,
+        "schema_valid": result.schema_valid,
+        "ttft_ms": result.ttft_ms,
+        "queue_wait_ms": result.queue_wait_ms,
+        "context_budget": budget_report,
+        "speculative": {
+            "draft_tokens": result.draft_tokens,
+            "accepted_draft_tokens": result.accepted_draft_tokens,
+            "acceptance_rate": result.accepted_draft_tokens / result.draft_tokens
+        } if result.draft_tokens else None
+    }
+
+
+def lookup_cached_response(system_prompt: str, user_prompt: str, context: str, params: dict,
+                           mode: str = "blocking"):
+    """(cache_key, cached body or None); cache_key is None when the request can't be cached"""
+    cache_key = response_cache_key(system_prompt, user_prompt, context, params)
+    cached = response_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        cached = {**cached, "cached": True}
+        metrics.observe_cached(mode)
+    return cache_key, cached
+
+
+def finish_response(cache_key, result, budget_report: dict = None, mode: str = "blocking") -> dict:
+    metrics.observe_result(result, mode)
+    body = result_body(result, budget_report)
+    if cache_key and result.finish_reason != "cancelled":
+        response_cache.put(cache_key, body)
+    return {**body, "cached": False}
+
+
+def granite_submit(
+    system_prompt: str,
+    user_prompt: str,
+    context: str = "",
+    max_new_tokens: int = 256,
+    temperature: float = 0.2,
+    top_p: float = 0.9,
+    seed: int = None,
+    stop: list = None,
+    json_schema: dict = None,
+    priority: str = "default",
+    timeout_s: float = DEFAULT_TIMEOUT_S,
+    speculative: bool = SPECULATIVE_DEFAULT
+) -> Future:
+    """Queue one generation without blocking; the future resolves to the /generate response body.
+
+    Cancelling the returned future cancels the underlying request.
+    """
+    require_ready()
+    params = resolve_sampling({
+        "max_new_tokens": max_new_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "seed": seed,
+        "json_schema": parse_json_schema(json_schema),
+        "stop": parse_stop_sequences(stop, structured=json_schema is not None)
+    })
+
+    body_future = Future()
+    cache_key, cached = lookup_cached_response(system_prompt, user_prompt, context, params)
+    if cached is not None:
+        body_future.set_result(cached)
+        return body_future
+
+    prompt, prefix, budget_report = fit_prompt(system_prompt, user_prompt, context, max_new_tokens)
+    try:
+        generation = scheduler.submit(
+            prompt,
+            prefix=prefix,
+            priority=priority,
+            timeout_s=timeout_s,
+            speculative=speculative,
+            **params
+        )
+    except QueueFullError as e:
+        metrics.observe_error("blocking", e)
+        raise
+
+    def on_generation_done(f):
+        if f.cancelled() or body_future.done():
+            return
+        # body_future can still be cancelled by the caller until it is set
+        try:
+            if f.exception() is not None:
+                metrics.observe_error("blocking", f.exception())
+                body_future.set_exception(f.exception())
+            else:
+                body_future.set_result(finish_response(cache_key, f.result(), budget_report))
+        except InvalidStateError:
+            pass
+
+    def on_body_done(f):
+        if f.cancelled():
+            generation.cancel()
+
+    generation.add_done_callback(on_generation_done)
+    body_future.add_done_callback(on_body_done)
+    return body_future
+
+
+def granite_complete(
+    system_prompt: str,
+    user_prompt: str,
+    context: str = "",
+    max_new_tokens: int = 256,
+    temperature: float = 0.2,
+    top_p: float = 0.9,
+    seed: int = None,
+    stop: list = None,
+    json_schema: dict = None,
+    priority: str = "default",
+    timeout_s: float = DEFAULT_TIMEOUT_S,
+    speculative: bool = SPECULATIVE_DEFAULT
+) -> dict:
+    """Run one generation and return the /generate response body"""
+    return granite_submit(
+        system_prompt, user_prompt, context,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        seed=seed,
+        stop=stop,
+        json_schema=json_schema,
+        priority=priority,
+        timeout_s=timeout_s,
+        speculative=speculative
+    ).result()
+
+
 def granite_generate(
     system_prompt: str,
     user_prompt: str,
     context: str = "",
     max_new_tokens: int = 256,
     temperature: float = 0.2,
-    top_p: float = 0.9
+    top_p: float = 0.9,
+    seed: int = None,
+    stop: list = None,
+    json_schema: dict = None,
+    priority: str = "default",
+    timeout_s: float = DEFAULT_TIMEOUT_S,
+    speculative: bool = SPECULATIVE_DEFAULT
 ):
-    prompt = f"{system_prompt}\n\n"
-    if context:
-        prompt += f"CONTEXT:\n{context}\n\n"
-    prompt += f"USER:\n{user_prompt}\n\nASSISTANT:"
+    return granite_complete(
+        system_prompt, user_prompt, context,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        seed=seed,
+        stop=stop,
+        json_schema=json_schema,
+        priority=priority,
+        timeout_s=timeout_s,
+        speculative=speculative
+    )["output"]
 
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
 
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            do_sample=True
-        )
+def granite_generate_stream(
+    system_prompt: str,
+    user_prompt: str,
+    context: str = "",
+    max_new_tokens: int = 256,
+    temperature: float = 0.2,
+    top_p: float = 0.9,
+    seed: int = None,
+    stop: list = None,
+    json_schema: dict = None,
+    priority: str = "default",
+    timeout_s: float = DEFAULT_TIMEOUT_S,
+    speculative: bool = SPECULATIVE_DEFAULT
+):
+    """Same as granite_generate but returns a TokenStream of text deltas"""
+    require_ready()
+    params = resolve_sampling({
+        "max_new_tokens": max_new_tokens,
+        "temperature": temperature,
+        "top_p": top_p,
+        "seed": seed,
+        "json_schema": parse_json_schema(json_schema),
+        "stop": parse_stop_sequences(stop, structured=json_schema is not None)
+    })
+
+    prompt, prefix, _ = fit_prompt(system_prompt, user_prompt, context, max_new_tokens)
+    return scheduler.stream(
+        prompt,
+        prefix=prefix,
+        priority=priority,
+        timeout_s=timeout_s,
+        speculative=speculative,
+        **params
+    )
+
+
+def granite_submit_batch(specs: list) -> list:
+    """Queue every valid spec back to back so they share a scheduler batch.
+
+    Returns one entry per spec, in order: a Future of the response body, or the
+    exception that stopped that item from being queued.
+    """
+    require_ready()
+    submitted = []
+    for spec in specs:
+        if isinstance(spec, Exception):
+            metrics.observe_error("blocking", spec)
+            submitted.append(spec)
+            continue
+        try:
+            submitted.append(granite_submit(**spec))
+        except QueueFullError as e:
+            submitted.append(e)
+    return submitted
+
+
+def batch_item_error(e: Exception) -> dict:
+    """Per-item error entry for /generate_batch; status mirrors what /generate would return"""
+    if isinstance(e, ValueError):
+        status = 400
+    elif isinstance(e, QueueFullError):
+        status = 429
+    elif isinstance(e, DeadlineExceededError):
+        status = 504
+    else:
+        status = 500
+    return {"error": str(e), "status": status}
+
+
+def server_stats() -> dict:
+    loaded = is_ready()
+    return {
+        "model": MODEL_NAME,
+        "backend": BACKEND_CONFIG,
+        "load": LOAD_STATE,
+        "prefix_cache": prefix_cache.stats() if prefix_cache else None,
+        "response_cache": response_cache.stats() if response_cache else None,
+        "context_budget": context_budget.stats() if loaded else None,
+        "speculative": scheduler.speculative_stats() if loaded else None,
+        "queue": scheduler.stats() if loaded else None
+    }
+
+
+def readiness() -> tuple:
+    """(body, HTTP status) for /readyz"""
+    if not is_ready():
+        return {"status": LOAD_STATE["status"], "phase": LOAD_STATE["phase"], "error": LOAD_STATE["error"]}, 503
+    if not scheduler.is_alive():
+        return {"status": "unavailable"}, 503
+    return {"status": "ready", "queue_depth": scheduler.queue_depth()}, 200
 
-    return tokenizer.decode(
-        outputs[0][inputs["input_ids"].shape[-1]:],
-        skip_special_tokens=True
-    ).strip()
+
+def liveness() -> tuple:
+    """(body, HTTP status) for /healthz; a failed load needs a restart, so it counts as unhealthy"""
+    if LOAD_STATE["status"] == "failed":
+        return {"status": "failed", "error": LOAD_STATE["error"]}, 500
+    return {"status": "ok"}, 200
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def queue_full_response(e: QueueFullError):
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
 
 
 # ============================================================
 # API Endpoint
 # ============================================================
+def request_json_object() -> dict:
+    """The request body, which must be a JSON object; raises ValueError otherwise"""
+    data = request.get_json(silent=True)
+    if data is None:
+        raise ValueError("Request body must be JSON")
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    return data
+
+
 @app.route("/generate", methods=["POST"])
 def generate():
     try:
-        data = request.json
+        try:
+            spec = parse_generation_request(request_json_object())
+        except ValueError as e:
+            metrics.observe_error("blocking", e)
+            return jsonify({"error": str(e)}), 400
 
-        system_prompt = data.get("system_prompt", "You are a helpful assistant.")
-        user_prompt = data.get("user_prompt", "")
-        context = data.get("context", "")
+        return jsonify(granite_complete(**spec))
 
-        if not user_prompt:
-            return jsonify({"error": "user_prompt is required"}), 400
+    except ModelNotReadyError as e:
+        return not_ready_response(e)
 
-        output = granite_generate(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            context=context
-        )
+    except QueueFullError as e:
+        return queue_full_response(e)
 
-        return jsonify({"output": output})
+    except DeadlineExceededError as e:
+        return jsonify({"error": str(e)}), 504
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/generate_batch", methods=["POST"])
+def generate_batch():
+    """Several prompts in one call; results come back in order with per-item errors"""
+    try:
+        specs = parse_batch_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        submitted = granite_submit_batch(specs)
+    except ModelNotReadyError as e:
+        return not_ready_response(e)
+
+    results = []
+    for entry in submitted:
+        if isinstance(entry, Exception):
+            results.append(batch_item_error(entry))
+            continue
+        try:
+            results.append(entry.result())
+        except Exception as e:
+            results.append(batch_item_error(e))
+
+    return jsonify({"results": results})
+
+
+@app.route("/generate/stream", methods=["POST"])
+def generate_stream():
+    try:
+        require_ready()
+    except ModelNotReadyError as e:
+        return not_ready_response(e)
+
+    try:
+        data = request_json_object()
+    except ValueError as e:
+        metrics.observe_error("stream", e)
+        return jsonify({"error": str(e)}), 400
+
+    system_prompt = data.get("system_prompt", "You are a helpful assistant.")
+    user_prompt = data.get("user_prompt", "")
+
+    if not user_prompt:
+        return jsonify({"error": "user_prompt is required"}), 400
+
+    try:
+        context = parse_context(data)
+        params = resolve_sampling(parse_generation_params(data))
+        scheduling = parse_scheduling_params(data)
+    except ValueError as e:
+        metrics.observe_error("stream", e)
+        return jsonify({"error": str(e)}), 400
+
+    cache_key, cached = lookup_cached_response(system_prompt, user_prompt, context, params, mode="stream")
+
+    if cached is not None:
+        def cached_events():
+            yield sse_event({"token": cached["output"]})
+            yield sse_event(cached, event="done")
+
+        return Response(cached_events(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache"})
+
+    try:
+        prompt, prefix, budget_report = fit_prompt(system_prompt, user_prompt, context, params["max_new_tokens"])
+        stream = scheduler.stream(prompt, prefix=prefix, **params, **scheduling)
+    except QueueFullError as e:
+        metrics.observe_error("stream", e)
+        return queue_full_response(e)
+
+    def events():
+        try:
+            for delta in stream:
+                yield sse_event({"token": delta})
+
+            yield sse_event(finish_response(cache_key, stream.result(), budget_report, mode="stream"), event="done")
+
+        except Exception as e:
+            metrics.observe_error("stream", e)
+            yield sse_event({"error": str(e)}, event="error")
+
+        finally:
+            # Runs on normal completion and when the client disconnects mid-stream
+            # (the WSGI server closes this generator), so abandoned requests stop decoding
+            stream.cancel()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving HTTP"""
+    body, status = liveness()
+    return jsonify(body), status
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: the model is loaded and warmed up, and the inference worker can take requests"""
+    body, status = readiness()
+    return jsonify(body), status
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify(server_stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# Weights load in the background so the port is bound (and /healthz answers) immediately
+threading.Thread(target=load_server, name="granite-loader", daemon=True).start()
+
+
 # ============================================================
 # App Entry Point
 # ============================================================
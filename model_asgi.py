@@ -0,0 +1,212 @@
+import asyncio
+import os
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+import model as server
+from inference import DeadlineExceededError, QueueFullError
+
+# Async serving mode: HTTP handling runs on the event loop and only awaits futures
+# resolved by the scheduler's inference worker thread, so a long generation never
+# ties up a request handler and /healthz, /readyz stay responsive.
+#
+#   uvicorn model_asgi:app --port 8000     (or: python model_asgi.py)
+
+
+# ============================================================
+# Helpers
+# ============================================================
+async def read_generation_request(request, mode: str):
+    """(prompts, params, scheduling) from the JSON body, or a 400 JSONResponse"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Request body must be JSON"}, status_code=400)
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "Request body must be a JSON object"}, status_code=400)
+
+    prompts = {
+        "system_prompt": data.get("system_prompt", "You are a helpful assistant."),
+        "user_prompt": data.get("user_prompt", "")
+    }
+    if not prompts["user_prompt"]:
+        return JSONResponse({"error": "user_prompt is required"}, status_code=400)
+
+    try:
+        prompts["context"] = server.parse_context(data)
+        params = server.resolve_sampling(server.parse_generation_params(data))
+        scheduling = server.parse_scheduling_params(data)
+    except ValueError as e:
+        metrics.observe_error(mode, e)
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    return prompts, params, scheduling
+
+
+def not_ready_response(e: server.ModelNotReadyError):
+    return JSONResponse(server.not_ready_body(e), status_code=503, headers={"Retry-After": "10"})
+
+
+def queue_full_response(e: QueueFullError):
+    return JSONResponse(
+        {"error": str(e), "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+# ============================================================
+# API Endpoints
+# ============================================================
+async def generate(request):
+    parsed = await read_generation_request(request, "blocking")
+    if isinstance(parsed, JSONResponse):
+        return parsed
+    prompts, params, scheduling = parsed
+
+    try:
+        # Cache lookup (which may rewrite the cache file) and prompt tokenization block,
+        # so submitting happens off the event loop
+        submitted = await asyncio.to_thread(server.granite_submit, **prompts, **params, **scheduling)
+        body = await asyncio.wrap_future(submitted)
+        return JSONResponse(body)
+
+    except server.ModelNotReadyError as e:
+        return not_ready_response(e)
+
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    except DeadlineExceededError as e:
+        return JSONResponse({"error": str(e)}, status_code=504)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def generate_batch(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "Request body must be JSON"}, status_code=400)
+
+    try:
+        specs = server.parse_batch_request(data)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    try:
+        submitted = await asyncio.to_thread(server.granite_submit_batch, specs)
+    except server.ModelNotReadyError as e:
+        return not_ready_response(e)
+
+    results = []
+    for entry in submitted:
+        if isinstance(entry, Exception):
+            results.append(server.batch_item_error(entry))
+            continue
+        try:
+            results.append(await asyncio.wrap_future(entry))
+        except Exception as e:
+            results.append(server.batch_item_error(e))
+
+    return JSONResponse({"results": results})
+
+
+async def generate_stream(request):
+    try:
+        server.require_ready()
+    except server.ModelNotReadyError as e:
+        return not_ready_response(e)
+
+    parsed = await read_generation_request(request, "stream")
+    if isinstance(parsed, JSONResponse):
+        return parsed
+    prompts, params, scheduling = parsed
+
+    cache_key, cached = await asyncio.to_thread(
+        server.lookup_cached_response,
+        prompts["system_prompt"], prompts["user_prompt"], prompts["context"], params, mode="stream"
+    )
+
+    if cached is not None:
+        async def cached_events():
+            yield server.sse_event({"token": cached["output"]})
+            yield server.sse_event(cached, event="done")
+
+        return StreamingResponse(cached_events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"})
+
+    try:
+        prompt, prefix, budget_report = await asyncio.to_thread(
+            server.fit_prompt, **prompts, max_new_tokens=params["max_new_tokens"]
+        )
+        # Stays on the loop: deltas are delivered to the loop it is called from
+        stream = server.scheduler.stream_async(prompt, prefix=prefix, **params, **scheduling)
+    except QueueFullError as e:
+        metrics.observe_error("stream", e)
+        return queue_full_response(e)
+
+    async def events():
+        try:
+            async for delta in stream:
+                yield server.sse_event({"token": delta})
+
+            result = await stream.result()
+            body = await asyncio.to_thread(server.finish_response, cache_key, result, budget_report, mode="stream")
+            yield server.sse_event(body, event="done")
+
+        except Exception as e:
+            metrics.observe_error("stream", e)
+            yield server.sse_event({"error": str(e)}, event="error")
+
+        finally:
+            # Starlette cancels this generator when the client disconnects
+            stream.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def healthz(request):
+    body, status = server.liveness()
+    return JSONResponse(body, status_code=status)
+
+
+async def readyz(request):
+    body, status = server.readiness()
+    return JSONResponse(body, status_code=status)
+
+
+async def stats(request):
+    return JSONResponse(server.server_stats())
+
+
+async def prometheus_metrics(request):
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+app = Starlette(routes=[
+    Route("/generate", generate, methods=["POST"]),
+    Route("/generate_batch", generate_batch, methods=["POST"]),
+    Route("/generate/stream", generate_stream, methods=["POST"]),
+    Route("/healthz", healthz, methods=["GET"]),
+    Route("/readyz", readyz, methods=["GET"]),
+    Route("/stats", stats, methods=["GET"]),
+    Route("/metrics", prometheus_metrics, methods=["GET"])
+])
+
+
+# ============================================================
+# App Entry Point
+# ============================================================
+if __name__ == "__main__":
+    PORT = int(os.environ.get("PORT", 8000))
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
@@ -0,0 +1,86 @@
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from explanations import ExplanationStore, baseline_prompt, source_hash
+from granite_client import DEFAULT_BASE_URL, GraniteClient, GraniteError
+from prompts import MARKING_SYSTEM_PROMPTS
+
+
+# ============================================================
+# Generation
+# ============================================================
+def explain(client: GraniteClient, question: dict, max_new_tokens: int) -> str:
+    return client.generate(
+        baseline_prompt(question["question_text"], question["detailed_answer"]),
+        system_prompt=MARKING_SYSTEM_PROMPTS["baseline_explanation"],
+        priority="batch",
+        max_new_tokens=max_new_tokens
+    )
+
+
+def run(args) -> int:
+    client = GraniteClient(args.url, timeout=args.timeout, pool_size=args.concurrency)
+    model = args.model
+    if model is None:
+        try:
+            model = client.stats()["model"]
+        except (GraniteError, KeyError) as e:
+            print(f"❌ Could not ask the server which model it runs ({e}); pass --model")
+            return 1
+
+    store = ExplanationStore()
+    questions = store.stale_questions(model, limit=args.limit)
+    print(f"📄 {len(questions)} questions need a baseline explanation "
+          f"(prompt {store.version}, model {model})")
+    if not questions:
+        return 0
+
+    done, failed = 0, 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {pool.submit(explain, client, q, args.max_new_tokens): q for q in questions}
+        for future in as_completed(futures):
+            question = futures[future]
+            try:
+                explanation = future.result()
+            except GraniteError as e:
+                failed += 1
+                print(f"❌ {question['question_id']}: {e}")
+                continue
+            # Hash what the explanation was generated from, so an edit made meanwhile still counts as stale
+            store.save(
+                question["question_id"], model,
+                source_hash(question["question_text"], question["detailed_answer"]),
+                explanation.strip()
+            )
+            done += 1
+            if done % args.progress_every == 0:
+                print(f"⏱️  {done}/{len(questions)} stored")
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Stored {done} explanations in {elapsed:.1f}s ({done / elapsed:.2f} questions/s), {failed} failed")
+    return 1 if failed else 0
+
+
+# ============================================================
+# Entry Point
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate baseline explanations for new or changed questions. "
+                    "Questions that already have one for the current prompt and model are skipped."
+    )
+    parser.add_argument("--url", default=DEFAULT_BASE_URL, help="Granite API base URL")
+    parser.add_argument("--model", default=None, help="Model name to record (default: ask the server)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions in flight at once")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many questions")
+    parser.add_argument("--max-new-tokens", type=int, default=768)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--progress-every", type=int, default=10)
+    sys.exit(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,51 @@
-import psycopg2, json
+import json
+
+import db
 
 def get_question_by_index(index=5):
 
-    conn = psycopg2.connect(
-        host="localhost",
-        database="vce_learning_platform",
-        user="postgres",
-        password="postgres1234",
-        port="5432"
-    )
-    cursor = conn.cursor()
-
-    # Step 1 — get question_id at index 5
-    cursor.execute("""
-        SELECT question_id 
-        FROM questions 
-        ORDER BY question_id 
-        OFFSET %s LIMIT 1;
-    """, (index,))
-
-    row = cursor.fetchone()
-    if not row:
-        print(f"No question exists at index {index}")
-        return
-
-    question_id = row[0]
-    print(f"📌 Selected Question ID at index {index}: {question_id}")
-
-    # Step 2 — fetch full linked details
-    cursor.execute("""
-        SELECT  
-            q.question_id, q.question_number, q.section, q.unit, q.aos, q.subtopic,
-            q.skill_type, q.difficulty_level, q.question_text, q.answer_text, 
-            q.detailed_answer, q.page_number,
-
-            e.exam_id, e.year, e.subject, e.unit AS exam_unit, e.exam_name,
-            e.pdf_url, e.source, e.scraped_at,
-
-            ab.aos_name, ab.percentage,
-
-            sp.subpart_id, sp.subpart_letter, sp.subpart_text, 
-            sp.subpart_answer, sp.subpart_detailed_answer
-
-        FROM questions q
-        JOIN exams e ON q.exam_id = e.exam_id
-        LEFT JOIN aos_breakdown ab ON ab.exam_id = e.exam_id
-        LEFT JOIN question_subparts sp ON sp.question_id = q.question_id
-        WHERE q.question_id = %s
-        ORDER BY sp.subpart_letter;
-    """, (question_id,))
-
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with db.cursor() as cursor:
+
+        # Step 1 — get question_id at index 5
+        cursor.execute("""
+            SELECT question_id 
+            FROM questions 
+            ORDER BY question_id 
+            OFFSET %s LIMIT 1;
+        """, (index,))
+
+        row = cursor.fetchone()
+        if not row:
+            print(f"No question exists at index {index}")
+            return
+
+        question_id = row[0]
+        print(f"📌 Selected Question ID at index {index}: {question_id}")
+
+        # Step 2 — fetch full linked details
+        cursor.execute("""
+            SELECT  
+                q.question_id, q.question_number, q.section, q.unit, q.aos, q.subtopic,
+                q.skill_type, q.difficulty_level, q.question_text, q.answer_text, 
+                q.detailed_answer, q.page_number,
+
+                e.exam_id, e.year, e.subject, e.unit AS exam_unit, e.exam_name,
+                e.pdf_url, e.source, e.scraped_at,
+
+                ab.aos_name, ab.percentage,
+
+                sp.subpart_id, sp.subpart_letter, sp.subpart_text, 
+                sp.subpart_answer, sp.subpart_detailed_answer
+
+            FROM questions q
+            JOIN exams e ON q.exam_id = e.exam_id
+            LEFT JOIN aos_breakdown ab ON ab.exam_id = e.exam_id
+            LEFT JOIN question_subparts sp ON sp.question_id = q.question_id
+            WHERE q.question_id = %s
+            ORDER BY sp.subpart_letter;
+        """, (question_id,))
+
+        rows = cursor.fetchall()
 
     # Transform to structured JSON
     result = {
@@ -0,0 +1,205 @@
+from typing import Sequence
+
+import db
+
+PAGE_SIZE = 10
+PREVIEW_CHARS = 150
+# Counting stops here, so the total costs the same however large the bank grows
+COUNT_LIMIT = 10000
+
+SEARCH_CONFIG = "english"
+# Weighted search document of a questions row: the question itself ranks above its topic, then its answer
+SEARCH_VECTOR_SQL = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(question_text, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(subtopic, '') || ' ' || coalesce(aos, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(answer_text, '')), 'C')"
+)
+
+_trigram_available = None
+
+
+def trigram_available() -> bool:
+    """Whether pg_trgm is installed, so fuzzy matching can be used (checked once per process)"""
+    global _trigram_available
+    if _trigram_available is None:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');")
+            _trigram_available = cursor.fetchone()[0]
+    return _trigram_available
+
+
+def _exams_in_year(year: int) -> list:
+    """Ids of the exams sat in `year`"""
+    with db.cursor() as cursor:
+        cursor.execute("SELECT exam_id FROM exams WHERE year = %s;", (year,))
+        return [r[0] for r in cursor.fetchall()]
+
+
+# ============================================================
+# Filters
+# ============================================================
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def question_filters(search_term: str = "", years: Sequence = (), subjects: Sequence = (),
+                     difficulties: Sequence = ()) -> tuple:
+    """(WHERE clause, params, rank expression, rank params) for the search box and filters.
+
+    A search term matches through the full-text index (stemmed words anywhere in
+    the question, answer, subtopic or AOS) and, with pg_trgm, as a substring of or
+    fuzzily against the question and answer text (typos, "x^2"-style tokens the
+    text parser splits up). A number also matches question numbers and exam years.
+    Every alternative is an indexed predicate on questions, so the planner can
+    combine them with a BitmapOr instead of scanning the table. Without a term
+    the rank is None and results come in question_id order. Empty filters match
+    everything.
+    """
+    clauses, params = [], []
+    rank, rank_params = None, []
+
+    search_term = (search_term or "").strip()
+    if search_term:
+        matches = [f"q.search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)"]
+        params.append(search_term)
+        # Normalised to 0..1 (flag 32) so it adds up sensibly with word_similarity
+        rank = f"ts_rank_cd(q.search_vector, websearch_to_tsquery('{SEARCH_CONFIG}', %s), 32)"
+        rank_params.append(search_term)
+        if trigram_available():
+            pattern = "%" + _escape_like(search_term) + "%"
+            matches += [
+                "q.question_text ILIKE %s",
+                "q.answer_text ILIKE %s",
+                "%s <%% q.question_text",
+                "%s <%% q.answer_text"
+            ]
+            params += [pattern, pattern, search_term, search_term]
+            rank += " + GREATEST(word_similarity(%s, q.question_text), word_similarity(%s, q.answer_text))"
+            rank_params += [search_term, search_term]
+        if search_term.isdigit() and int(search_term) < 2 ** 31:
+            number = int(search_term)
+            matches.append("q.question_number = %s")
+            params.append(number)
+            # The year lives on exams. Looking its exams up first gives the planner literal ids,
+            # so it can estimate them against the exam_id index (a subquery reads as half the table)
+            exam_ids = _exams_in_year(number)
+            if exam_ids:
+                matches.append("q.exam_id = ANY(%s)")
+                params.append(exam_ids)
+        clauses.append("(" + " OR ".join(matches) + ")")
+    if years:
+        clauses.append("e.year = ANY(%s)")
+        params.append([int(y) for y in years])
+    if subjects:
+        clauses.append("e.subject = ANY(%s)")
+        params.append(list(subjects))
+    if difficulties:
+        clauses.append("q.difficulty_level = ANY(%s)")
+        params.append(list(difficulties))
+
+    return " AND ".join(clauses) or "TRUE", params, rank, rank_params
+
+
+# ============================================================
+# Queries
+# ============================================================
+def fetch_page(filters: tuple, after=None, limit: int = PAGE_SIZE) -> tuple:
+    """(questions, next_after) for the page that starts after the key `after`.
+
+    Browsing pages by keyset on question_id, so every page is an index range
+    scan from the previous page's last id and page 100 costs the same as page 1,
+    unlike OFFSET. Searches come best match first and page on (rank, question_id).
+    next_after is the key to pass for the following page, or None on the last page.
+    """
+    where, params, rank, rank_params = filters
+
+    if rank is None:
+        keyset, keyset_params = "", []
+        if after is not None:
+            keyset, keyset_params = "AND q.question_id > %s", [after]
+        sql = f"""
+            SELECT q.question_id, q.question_number, left(q.question_text, %s),
+                   e.year, e.subject, e.exam_name, q.difficulty_level, NULL
+            FROM questions q
+            JOIN exams e ON q.exam_id = e.exam_id
+            WHERE {where} {keyset}
+            ORDER BY q.question_id
+            LIMIT %s;
+        """
+        sql_params = [PREVIEW_CHARS + 1] + params + keyset_params + [limit + 1]
+    else:
+        keyset, keyset_params = "", []
+        if after is not None:
+            # float8 round-trips exactly through Python, so equal ranks compare equal
+            keyset = "WHERE rank < %s OR (rank = %s AND question_id > %s)"
+            keyset_params = [after[0], after[0], after[1]]
+        sql = f"""
+            SELECT * FROM (
+                SELECT q.question_id, q.question_number, left(q.question_text, %s),
+                       e.year, e.subject, e.exam_name, q.difficulty_level,
+                       ({rank})::float8 AS rank
+                FROM questions q
+                JOIN exams e ON q.exam_id = e.exam_id
+                WHERE {where}
+            ) ranked
+            {keyset}
+            ORDER BY rank DESC, question_id
+            LIMIT %s;
+        """
+        sql_params = [PREVIEW_CHARS + 1] + rank_params + params + keyset_params + [limit + 1]
+
+    with db.cursor() as cursor:
+        cursor.execute(sql, sql_params)
+        rows = cursor.fetchall()
+
+    questions = [
+        {
+            "question_id": row[0],
+            "question_number": row[1],
+            "preview_text": row[2][:PREVIEW_CHARS] + "..." if len(row[2] or "") > PREVIEW_CHARS else row[2] or "",
+            "year": row[3],
+            "subject": row[4],
+            "exam_name": row[5],
+            "difficulty": row[6],
+            "rank": row[7]
+        }
+        for row in rows[:limit]
+    ]
+
+    next_after = None
+    if len(rows) > limit:
+        last = questions[-1]
+        next_after = last["question_id"] if rank is None else (last["rank"], last["question_id"])
+    return questions, next_after
+
+
+def count_questions(filters: tuple) -> int:
+    """Questions matching the filters, counted up to COUNT_LIMIT"""
+    where, params = filters[:2]
+    with db.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT count(*) FROM (
+                SELECT 1
+                FROM questions q
+                JOIN exams e ON q.exam_id = e.exam_id
+                WHERE {where}
+                LIMIT %s
+            ) matched;
+        """, params + [COUNT_LIMIT])
+        return cursor.fetchone()[0]
+
+
+def facets() -> dict:
+    """Every year, subject and difficulty in the bank, for the filter controls"""
+    with db.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT year FROM exams WHERE year IS NOT NULL ORDER BY year;")
+        years = [r[0] for r in cursor.fetchall()]
+        cursor.execute("SELECT DISTINCT subject FROM exams WHERE subject IS NOT NULL ORDER BY subject;")
+        subjects = [r[0] for r in cursor.fetchall()]
+        cursor.execute("""
+            SELECT DISTINCT difficulty_level FROM questions
+            WHERE difficulty_level IS NOT NULL ORDER BY difficulty_level;
+        """)
+        difficulties = [r[0] for r in cursor.fetchall()]
+
+    return {"years": years, "subjects": subjects, "difficulties": difficulties}
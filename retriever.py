@@ -1,16 +1,8 @@
 import os
 import numpy as np
-import psycopg2
-from pgvector.psycopg2 import register_vector
 from nomic import embed  # assuming nomic embed.text works
 
-DB_CONFIG = {
-    "host": "localhost",
-    "database": "vce_learning_platform",
-    "user": "postgres",
-    "password": "postgres1234",
-    "port": 5432
-}
+import db
 
 # os.environ["NOMIC_API_KEY"] = "YOUR_API_KEY_HERE"
 
@@ -23,10 +15,7 @@ def get_embedding(text: str):
     return np.array(resp["embeddings"][0], dtype=float)
 
 def retrieve_similar(query: str, top_k: int = 3):
-    conn = psycopg2.connect(**DB_CONFIG)
-    register_vector(conn)
-    cur = conn.cursor()
-
+    # Embed first so the pooled connection is only held for the query itself
     q_vec = get_embedding(query)
 
     sql = """
@@ -55,10 +44,9 @@ def retrieve_similar(query: str, top_k: int = 3):
     LIMIT %s;
     """
 
-    cur.execute(sql, (q_vec, top_k))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with db.cursor() as cur:
+        cur.execute(sql, (q_vec, top_k))
+        rows = cur.fetchall()
 
     results = []
     for r in rows:
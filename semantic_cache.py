@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+
+import db
+from retriever import get_embedding
+
+# nomic-embed-text-v1.5 output size
+EMBEDDING_DIM = 768
+
+# Cosine similarity above which a stored answer is reused for a new question
+DEFAULT_THRESHOLD = float(os.environ.get("TUTOR_CACHE_THRESHOLD", 0.92))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("TUTOR_CACHE_MAX_ENTRIES", 5000))
+DEFAULT_TTL_SECONDS = float(os.environ.get("TUTOR_CACHE_TTL", 30 * 24 * 3600))
+
+CREATE_CACHE_SQL = f"""
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS tutor_answer_cache (
+    cache_id SERIAL PRIMARY KEY,
+    settings_key VARCHAR(64) NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    embedding vector({EMBEDDING_DIM}) NOT NULL,
+    hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_tutor_answer_cache_settings ON tutor_answer_cache(settings_key);
+CREATE INDEX IF NOT EXISTS idx_tutor_answer_cache_embedding
+    ON tutor_answer_cache USING hnsw (embedding vector_cosine_ops);
+"""
+
+# HNSW filters WHERE clauses after its ef_search candidates are picked, so entries of other
+# settings can crowd out a near-duplicate. pgvector >= 0.8 keeps scanning until a row passes
+# the filter; older versions get an exact search over the rows with the same settings instead.
+NEAREST_ITERATIVE_SQL = """
+SELECT cache_id, question, answer, 1 - (embedding <=> %(vector)s) AS similarity
+FROM tutor_answer_cache
+WHERE settings_key = %(key)s
+ORDER BY embedding <=> %(vector)s
+LIMIT 1;
+"""
+
+NEAREST_EXACT_SQL = """
+WITH candidates AS MATERIALIZED (
+    SELECT cache_id, question, answer, embedding <=> %(vector)s AS distance
+    FROM tutor_answer_cache
+    WHERE settings_key = %(key)s
+)
+SELECT cache_id, question, answer, 1 - distance AS similarity
+FROM candidates
+ORDER BY distance
+LIMIT 1;
+"""
+
+
+def settings_key(settings: dict) -> str:
+    """Hash of everything besides the question that shapes the tutor's answer"""
+    normalised = {
+        key: sorted(value) if isinstance(value, (list, tuple, set)) else value
+        for key, value in settings.items()
+    }
+    return hashlib.sha256(json.dumps(normalised, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    def __init__(self, pool: db.ConnectionPool = None, threshold: float = DEFAULT_THRESHOLD,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        """Tutor answers in pgvector, reused for questions that mean the same thing.
+
+        A stored answer is served when its question embeds within `threshold` cosine
+        similarity of the new one and it was generated with the same tutor settings.
+        Entries older than ttl_seconds go first, then the least recently used beyond
+        max_entries. Any database or embedding failure counts as a miss, so the tutor
+        keeps working without the cache.
+        """
+        self._pool = pool
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Lookup and store of the same question share one embedding call
+        self.embed = lru_cache(maxsize=256)(self._embed)
+
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._iterative_scan = False
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+        self.total_similarity = 0.0
+        self.embed_seconds = 0.0
+        self.embed_calls = 0
+
+    @property
+    def pool(self) -> db.ConnectionPool:
+        # Resolved on use, so a database that is down only turns lookups into misses
+        return self._pool or db.get_pool()
+
+    def _embed(self, text: str):
+        start = time.perf_counter()
+        vector = get_embedding(text)
+        with self._lock:
+            self.embed_seconds += time.perf_counter() - start
+            self.embed_calls += 1
+        return vector
+
+    def _prepare(self, conn):
+        """Create the cache table on first use; the vector type exists only after that"""
+        if not self._schema_ready:
+            with conn.cursor() as cur:
+                for statement in CREATE_CACHE_SQL.split(";"):
+                    if statement.strip():
+                        cur.execute(statement)
+                cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+                version = tuple(int(part) for part in cur.fetchone()[0].split(".")[:2])
+            conn.commit()
+            self._iterative_scan = version >= (0, 8)
+            self._schema_ready = True
+        self.pool.register_vector(conn)
+
+    def lookup(self, question: str, settings: dict) -> Optional[dict]:
+        """{"answer", "question", "similarity"} of the closest stored answer, or None on a miss"""
+        try:
+            vector = self.embed(question.strip())
+            with self.pool.connection() as conn:
+                self._prepare(conn)
+                with conn.cursor() as cur:
+                    params = {"vector": vector, "key": settings_key(settings)}
+                    if self._iterative_scan:
+                        cur.execute("SET LOCAL hnsw.iterative_scan = strict_order;")
+                        cur.execute(NEAREST_ITERATIVE_SQL, params)
+                    else:
+                        cur.execute(NEAREST_EXACT_SQL, params)
+                    row = cur.fetchone()
+                    if row is None or row[3] < self.threshold:
+                        self._record(hit=False)
+                        return None
+                    cur.execute("""
+                        UPDATE tutor_answer_cache SET hits = hits + 1, last_used_at = CURRENT_TIMESTAMP
+                        WHERE cache_id = %s;
+                    """, (row[0],))
+        except Exception as e:
+            self._record_error("lookup", e)
+            return None
+
+        self._record(hit=True, similarity=row[3])
+        return {"question": row[1], "answer": row[2], "similarity": row[3]}
+
+    def store(self, question: str, settings: dict, answer: str):
+        """Save a freshly generated answer and evict what no longer fits"""
+        try:
+            vector = self.embed(question.strip())
+            with self.pool.connection() as conn:
+                self._prepare(conn)
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO tutor_answer_cache (settings_key, question, answer, embedding)
+                        VALUES (%s, %s, %s, %s);
+                    """, (settings_key(settings), question.strip(), answer, vector))
+                    cur.execute("""
+                        DELETE FROM tutor_answer_cache
+                        WHERE created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second';
+                    """, (self.ttl_seconds,))
+                    evicted = cur.rowcount
+                    cur.execute("""
+                        DELETE FROM tutor_answer_cache
+                        WHERE cache_id IN (
+                            SELECT cache_id FROM tutor_answer_cache
+                            ORDER BY last_used_at DESC
+                            OFFSET %s
+                        );
+                    """, (self.max_entries,))
+                    evicted += cur.rowcount
+        except Exception as e:
+            self._record_error("store", e)
+            return
+
+        with self._lock:
+            self.stores += 1
+            self.evictions += evicted
+
+    def _record(self, hit: bool, similarity: float = 0.0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.total_similarity += similarity
+            else:
+                self.misses += 1
+
+    def _record_error(self, operation: str, error: Exception):
+        with self._lock:
+            self.errors += 1
+            if operation == "lookup":
+                self.misses += 1
+        print(f"⚠️  Semantic cache {operation} failed: {error}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "threshold": self.threshold,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_hit_similarity": self.total_similarity / self.hits if self.hits else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "avg_embed_ms": self.embed_seconds / self.embed_calls * 1000 if self.embed_calls else 0.0
+            }
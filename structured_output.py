@@ -0,0 +1,262 @@
+import json
+import math
+from collections import defaultdict
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import torch
+
+# Bounds on what a request may ask the decoder to enforce
+MAX_PROPERTIES = 16
+MAX_CHOICES = 10000
+DEFAULT_MULTIPLE_OF = 0.01
+
+# Segment kinds of a compiled schema
+LITERAL = "literal"
+STRING = "string"
+CHOICE = "choice"
+
+# (segment index, segment state): literal -> chars matched, string -> pending escape, choice -> typed prefix
+State = Tuple[int, object]
+
+
+# ============================================================
+# Schema Grammar
+# ============================================================
+class JsonSchemaGrammar:
+    """Character-level automaton for the JSON objects a (subset of) JSON schema allows.
+
+    The schema must be an object whose properties are strings (optionally an
+    "enum"), integers or numbers (with "minimum" and "maximum", and for numbers
+    an optional "multipleOf"). Every property is emitted, in declared order,
+    with fixed punctuation, so the only freedom left to the model is the values:
+    string contents, one of the enum values, or one of the numbers in range.
+    """
+
+    def __init__(self, schema: dict):
+        if not isinstance(schema, dict) or schema.get("type") != "object":
+            raise ValueError("json_schema must be an object schema")
+        properties = schema.get("properties")
+        if not isinstance(properties, dict) or not properties:
+            raise ValueError("json_schema must define at least one property")
+        if len(properties) > MAX_PROPERTIES:
+            raise ValueError(f"json_schema may define at most {MAX_PROPERTIES} properties")
+
+        self.segments = []
+        literal = "{"
+        for i, (name, spec) in enumerate(properties.items()):
+            literal += (", " if i else "") + json.dumps(name) + ": "
+            kind, choices = _property_segment(name, spec)
+            if kind == STRING:
+                literal += '"'
+            self._add_literal(literal)
+            self.segments.append((kind, choices))
+            literal = '"' if kind == STRING else ""
+        self._add_literal(literal + "}")
+
+        # Fewest characters that complete each segment onwards, for budget-aware decoding
+        self._rest = [0] * (len(self.segments) + 1)
+        for i in range(len(self.segments) - 1, -1, -1):
+            kind, data = self.segments[i]
+            if kind == LITERAL:
+                length = len(data)
+            elif kind == STRING:
+                length = 0
+            else:
+                length = data[""]
+            self._rest[i] = length + self._rest[i + 1]
+
+    def _add_literal(self, text: str):
+        if not text:
+            return
+        if self.segments and self.segments[-1][0] == LITERAL:
+            self.segments[-1] = (LITERAL, self.segments[-1][1] + text)
+        else:
+            self.segments.append((LITERAL, text))
+
+    def start(self) -> State:
+        return self._enter(0)
+
+    def _enter(self, index: int) -> State:
+        if index >= len(self.segments):
+            return (index, None)
+        kind = self.segments[index][0]
+        return (index, 0 if kind == LITERAL else False if kind == STRING else "")
+
+    def is_complete(self, state: Optional[State]) -> bool:
+        return state is not None and state[0] >= len(self.segments)
+
+    def advance(self, state: State, char: str) -> Optional[State]:
+        """State after one more character, or None if the schema does not allow it"""
+        index, data = state
+        if index >= len(self.segments):
+            return None
+        kind, segment = self.segments[index]
+
+        if kind == LITERAL:
+            if char != segment[data]:
+                return None
+            return (index, data + 1) if data + 1 < len(segment) else self._enter(index + 1)
+
+        if kind == STRING:
+            if data:
+                return (index, False) if char in '"\\/bfnrt' else None
+            if char == '"':
+                # The closing quote belongs to the literal that follows
+                return self.advance(self._enter(index + 1), char)
+            if char == "\\":
+                return (index, True)
+            return (index, False) if ord(char) >= 0x20 else None
+
+        if data + char in segment:
+            return (index, data + char)
+        if segment[data] == 0:
+            # A complete value; the character must start what comes after it
+            return self.advance(self._enter(index + 1), char)
+        return None
+
+    def consume(self, state: State, text: str) -> Optional[State]:
+        for char in text:
+            state = self.advance(state, char)
+            if state is None:
+                return None
+        return state
+
+    def min_remaining(self, state: State) -> int:
+        """Fewest characters that still have to be generated to complete the object"""
+        index, data = state
+        if index >= len(self.segments):
+            return 0
+        kind, segment = self.segments[index]
+        if kind == LITERAL:
+            length = len(segment) - data
+        elif kind == STRING:
+            length = 1 if data else 0
+        else:
+            length = segment[data]
+        return length + self._rest[index + 1]
+
+    def matches(self, text: str) -> bool:
+        """Whether `text` is exactly an object this grammar generates"""
+        return self.is_complete(self.consume(self.start(), text.strip()))
+
+
+def _property_segment(name: str, spec) -> tuple:
+    """(kind, choices) for one property; choices maps every prefix of an allowed value to
+    the fewest characters needed to finish it (0 for a complete value)"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"json_schema property {name!r} must be an object")
+    kind = spec.get("type")
+
+    if kind == "string" and "enum" not in spec:
+        return STRING, None
+    if kind == "string":
+        values = spec["enum"]
+        if not isinstance(values, list) or not values or not all(isinstance(v, str) and v for v in values):
+            raise ValueError(f"json_schema property {name!r}: enum must be a list of non-empty strings")
+        return CHOICE, _prefixes(['"' + json.dumps(v)[1:-1] + '"' for v in values])
+
+    if kind in ("integer", "number"):
+        try:
+            low, high = float(spec["minimum"]), float(spec["maximum"])
+            step = 1.0 if kind == "integer" else float(spec.get("multipleOf", DEFAULT_MULTIPLE_OF))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"json_schema property {name!r}: numbers need a numeric minimum and maximum")
+        if step <= 0 or high < low:
+            raise ValueError(f"json_schema property {name!r}: invalid range")
+        first, last = math.ceil(low / step - 1e-9), math.floor(high / step + 1e-9)
+        if last - first + 1 > MAX_CHOICES:
+            raise ValueError(f"json_schema property {name!r}: at most {MAX_CHOICES} numbers may be allowed")
+        if last < first:
+            raise ValueError(f"json_schema property {name!r}: no value is in range")
+        return CHOICE, _prefixes([_format_number(k * step) for k in range(first, last + 1)])
+
+    raise ValueError(f"json_schema property {name!r}: type must be string, integer or number")
+
+
+def _format_number(value: float) -> str:
+    text = f"{round(value, 6):.6f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def _prefixes(values: List[str]) -> dict:
+    shortest = {}
+    for value in values:
+        for n in range(len(value) + 1):
+            remaining = len(value) - n
+            prefix = value[:n]
+            if remaining < shortest.get(prefix, remaining + 1):
+                shortest[prefix] = remaining
+    return shortest
+
+
+@lru_cache(maxsize=64)
+def _compile(canonical: str) -> JsonSchemaGrammar:
+    return JsonSchemaGrammar(json.loads(canonical))
+
+
+def compile_schema(schema: dict) -> JsonSchemaGrammar:
+    """Shared, validated grammar for a schema; raises ValueError if it is not supported"""
+    try:
+        # Property order is part of the output format, so keys are not sorted
+        canonical = json.dumps(schema)
+    except (TypeError, ValueError):
+        raise ValueError("json_schema must be JSON")
+    return _compile(canonical)
+
+
+# ============================================================
+# Token Masks
+# ============================================================
+class TokenConstraint:
+    """Which vocabulary entries keep the output inside a grammar, per automaton state.
+
+    Masks are memoised by state: free-text states recur every step, so after the
+    first request a step costs a dictionary lookup. When the remaining token budget
+    no longer covers the rest of the object, only tokens that make progress towards
+    closing it are allowed, so an answer never ends half-written.
+    """
+
+    def __init__(self, grammar: JsonSchemaGrammar, token_texts: List[str], vocab_size: int):
+        self.grammar = grammar
+        self.token_texts = token_texts
+        self.vocab_size = vocab_size
+        self._by_first_char = defaultdict(list)
+        for token_id, text in enumerate(token_texts):
+            if text:
+                self._by_first_char[text[0]].append(token_id)
+        self._masks = {}
+
+    def mask(self, state: State, tokens_left: int, device) -> torch.Tensor:
+        """Boolean mask over the vocabulary of tokens allowed next"""
+        finishing = tokens_left <= self.grammar.min_remaining(state)
+        key = (state, finishing, str(device))
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._build(state, finishing).to(device)
+            self._masks[key] = mask
+        return mask
+
+    def _build(self, state: State, finishing: bool) -> torch.Tensor:
+        mask = torch.zeros(self.vocab_size, dtype=torch.bool)
+        remaining = self.grammar.min_remaining(state)
+        for char, token_ids in self._by_first_char.items():
+            if self.grammar.advance(state, char) is None:
+                continue
+            for token_id in token_ids:
+                end = self.grammar.consume(state, self.token_texts[token_id])
+                if end is None:
+                    continue
+                if finishing and self.grammar.min_remaining(end) >= remaining:
+                    continue
+                if token_id < self.vocab_size:
+                    mask[token_id] = True
+        return mask
+
+    def consume(self, state: State, token_id: int) -> Optional[State]:
+        return self.grammar.consume(state, self.token_texts[token_id])
+
+
+def token_texts(tokenizer) -> List[str]:
+    """Decoded text of every vocabulary entry (special tokens decode to "")"""
+    return tokenizer.batch_decode([[i] for i in range(len(tokenizer))], skip_special_tokens=True)